@@ -26,20 +26,56 @@ Functions
 * :func:`~capsul.study_config.process_instance.get_process_instance`
 * :func:`~capsul.utils.finder.find_processes`
 
+Objects are actually imported from their sub-module the first time they are
+accessed (using a module ``__getattr__`` function), so that importing
+capsul.api does not load the whole Capsul machinery (pipelines, engine,
+database...) until it is used.
 '''
 
 from __future__ import absolute_import
-from capsul.process.process import (Process, NipypeProcess, ProcessResult,
-                                    FileCopyProcess, InteractiveProcess)
-from capsul.pipeline.pipeline import Pipeline
-from capsul.pipeline.pipeline_nodes import Plug
-from capsul.pipeline.pipeline_nodes import Node
-from capsul.pipeline.pipeline_nodes import ProcessNode
-from capsul.pipeline.pipeline_nodes import PipelineNode
-from capsul.pipeline.pipeline_nodes import Switch
-from capsul.pipeline.pipeline_nodes import OptionalOutputSwitch
-from capsul.engine import capsul_engine
-from capsul.engine import activate_configuration
-from capsul.study_config.process_instance import get_process_instance
-from capsul.study_config.study_config import StudyConfig
-from capsul.utils.finder import find_processes
+import importlib
+import sys
+
+_lazy_objects = {
+    'Process': 'capsul.process.process',
+    'NipypeProcess': 'capsul.process.process',
+    'ProcessResult': 'capsul.process.process',
+    'FileCopyProcess': 'capsul.process.process',
+    'InteractiveProcess': 'capsul.process.process',
+    'Pipeline': 'capsul.pipeline.pipeline',
+    'Plug': 'capsul.pipeline.pipeline_nodes',
+    'Node': 'capsul.pipeline.pipeline_nodes',
+    'ProcessNode': 'capsul.pipeline.pipeline_nodes',
+    'PipelineNode': 'capsul.pipeline.pipeline_nodes',
+    'Switch': 'capsul.pipeline.pipeline_nodes',
+    'OptionalOutputSwitch': 'capsul.pipeline.pipeline_nodes',
+    'capsul_engine': 'capsul.engine',
+    'activate_configuration': 'capsul.engine',
+    'get_process_instance': 'capsul.study_config.process_instance',
+    'StudyConfig': 'capsul.study_config.study_config',
+    'find_processes': 'capsul.utils.finder',
+}
+
+__all__ = sorted(_lazy_objects)
+
+
+def __getattr__(name):
+    module = _lazy_objects.get(name)
+    if module is None:
+        raise AttributeError('module %r has no attribute %r'
+                             % (__name__, name))
+    value = getattr(importlib.import_module(module), name)
+    # cache it, __getattr__ will not be called again for this name
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_objects))
+
+
+if sys.version_info < (3, 7):
+    # no module __getattr__: import everything now
+    for _name in _lazy_objects:
+        __getattr__(_name)
+    del _name
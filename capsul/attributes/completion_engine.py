@@ -34,8 +34,13 @@ from soma.controller.trait_utils import relax_exists_constraint
 import six
 import sys
 import copy
+import time
+import logging
+import collections
 from six.moves import range
 
+logger = logging.getLogger(__name__)
+
 # DEBUG
 #ce_calls = 0
 
@@ -90,8 +95,11 @@ class ProcessCompletionEngine(traits.HasTraits):
     get_completion_engine
     get_attribute_values
     complete_parameters
+    complete_changed_attributes
+    get_attributes_dependencies
     set_parameters
     attributes_to_path
+    attributes_list_to_paths
     get_path_completion_engine
     install_auto_completion
     remove_auto_completion
@@ -106,6 +114,11 @@ class ProcessCompletionEngine(traits.HasTraits):
         self.completion_ongoing = False
         self.add_trait('completion_progress', traits.Float(0.))
         self.add_trait('completion_progress_total', traits.Float(1.))
+        # time (in seconds) spent completing each pipeline node
+        self.completion_timings = {}
+        # attributes modified since the last completion
+        self.changed_attributes = set()
+        self._attributes_dependencies = None
         self._rebuild_attributes = False
 
 
@@ -294,6 +307,10 @@ class ProcessCompletionEngine(traits.HasTraits):
             completion which will anyway be done (again) when building a
             workflow in
             `~capsul.pipeline.pipeline_workflow.workflow_from_pipeline`.
+
+        For a pipeline, nodes are completed in dependencies order, and the
+        time spent for each node is recorded in the ``completion_timings``
+        dict.
         '''
         self.completion_progress = 0.
         self.completion_progress_total = 1.
@@ -311,16 +328,6 @@ class ProcessCompletionEngine(traits.HasTraits):
         # now, but it is sub-optimal since many parameters will be set many
         # times.
 
-        def satisfied_deps(node, all_nodes, done):
-            for param, plug in node.plugs.items():
-                if not plug.output:
-                    for link in plug.links_from:
-                        snode = link[2]
-                        if snode not in done \
-                                and (link[0], snode) in all_nodes:
-                            return False
-            return True
-
         verbose = False
 
         pipeline = None
@@ -329,29 +336,20 @@ class ProcessCompletionEngine(traits.HasTraits):
         elif isinstance(self.process, Pipeline):
             pipeline = self.process
         if pipeline:
+            t0 = time.time()
             attrib_values = self.get_attribute_values().export_to_dict()
             name = getattr(pipeline, 'context_name', pipeline.name)
 
-            # build nodes list
-            nodes_list = set([n for n in pipeline.nodes.items()
-                              if n[0] != ''
-                                  and pipeline_tools.is_node_enabled(
-                                      pipeline, n[0], n[1])])
-            init_result = True
-            done = set()
-            todo = [(node_name, node) for node_name, node in nodes_list
-                    if satisfied_deps(node, nodes_list, done)]
-
+            nodes_order, nodes_list = self._sorted_nodes(pipeline)
             self.completion_progress_total = len(nodes_list) + 0.05
+            self.completion_timings = {}
             index = 0
 
             # process topologically through nodes dependencies
-            while todo:
-                node_name, node = todo.pop(0)
-                done.add(node)
-
+            for node_name, node in nodes_order:
                 pname = '.'.join([name, node_name])
 
+                t1 = time.time()
                 subprocess_compl = \
                     ProcessCompletionEngine.get_completion_engine(node, pname)
                 self._install_subprogress_moniotoring(subprocess_compl)
@@ -367,50 +365,82 @@ class ProcessCompletionEngine(traits.HasTraits):
                     except Exception:
                         pass
                 self._remove_subprogress_moniotoring(subprocess_compl)
+                self.completion_timings[node_name] = time.time() - t1
 
                 # increase progress notification
                 index += 1
                 self.completion_progress = index
 
-                # insert downstream nodes in todo list
-                for param, plug in node.plugs.items():
-                    if not plug.output:
-                        continue
-                    links = plug.links_to
-                    for l in links:
-                        dnode = l[2]
-                        #print(l[0], dnode in done, dnode in )
-                        if dnode not in done \
-                                and (l[0], dnode) in nodes_list \
-                                and (l[0], dnode) not in todo \
-                                and satisfied_deps(dnode, nodes_list,
-                                                    done):
-                            todo.append((l[0], dnode))
-                        # not needed any longer:
-                        ## release "exists" property on connected traits
-                        #if hasattr(dnode, 'process'):
-                            #p = l[2].process
-                        #else:
-                            #p = l[2]
-                        #trait = p.trait(l[1])
-                        #if trait:
-                            #relax_exists_constraint(trait)
-                            ## FIXME this very specific stuff should be
-                            ## handled another way at another place...
-                            #if hasattr(p, 'process') \
-                                    #and hasattr(p.process, 'inputs'):
-                                ## MIA custom wrappings of nipype interfaces
-                                ## are this way, and do not release the
-                                ## exists constrain internally.
-                                #relax_exists_constraint(
-                                    #p.process.inputs.trait(l[1]))
-
-            if len(done) != len(nodes_list):
-                print('Some nodes of the pipeline could not be reached '
-                      'through dependencies. The pipeline structure is '
-                      'probably wrong:')
-                print([nname for nname, n in nodes_list if n not in done])
+            logger.debug('completion of %s nodes: %f s', name,
+                         time.time() - t0)
+
+        self._complete_process_parameters(verbose=verbose)
+        self.completion_progress = self.completion_progress_total
+
+
+    def _sorted_nodes(self, pipeline):
+        ''' Enabled nodes of a pipeline, sorted in dependencies order.
 
+        Returns
+        -------
+        nodes_order: list
+            (node_name, node) list. Nodes which cannot be reached through
+            dependencies are not included.
+        nodes_list: set
+            all enabled (node_name, node)
+        '''
+        nodes_list = set([n for n in pipeline.nodes.items()
+                          if n[0] != ''
+                              and pipeline_tools.is_node_enabled(
+                                  pipeline, n[0], n[1])])
+        # dependencies between enabled nodes: count upstream nodes of
+        # each node, and record downstream ones
+        in_degree = {}
+        downstream = {}
+        for node_name, node in nodes_list:
+            upstream = set()
+            for param, plug in six.iteritems(node.plugs):
+                if plug.output:
+                    continue
+                for link in plug.links_from:
+                    if (link[0], link[2]) in nodes_list:
+                        upstream.add((link[0], link[2]))
+            in_degree[node] = len(upstream)
+            for unode in upstream:
+                downstream.setdefault(unode[1], []).append(
+                    (node_name, node))
+        todo = collections.deque(
+            [(node_name, node) for node_name, node in nodes_list
+             if in_degree[node] == 0])
+        nodes_order = []
+        while todo:
+            node_name, node = todo.popleft()
+            nodes_order.append((node_name, node))
+            # insert downstream nodes in todo list once all their upstream
+            # nodes are done
+            for dnode in downstream.get(node, []):
+                in_degree[dnode[1]] -= 1
+                if in_degree[dnode[1]] == 0:
+                    todo.append(dnode)
+
+        if len(nodes_order) != len(nodes_list):
+            done = set([node for node_name, node in nodes_order])
+            print('Some nodes of the pipeline could not be reached '
+                  'through dependencies. The pipeline structure is '
+                  'probably wrong:')
+            print([nname for nname, n in nodes_list if n not in done])
+        return nodes_order, nodes_list
+
+
+    def _complete_process_parameters(self, parameters=None, verbose=False):
+        ''' Complete the process parameters from attributes.
+
+        Parameters
+        ----------
+        parameters: list or set (optional)
+            restrict completion to these parameters. Default: all.
+        verbose: bool
+        '''
         attributes = self.get_attribute_values()
 
         # if some attributes are list, we must separate list and non-list
@@ -430,6 +460,8 @@ class ProcessCompletionEngine(traits.HasTraits):
         if isinstance(process, ProcessNode):
             process = process.process
         for pname, trait in six.iteritems(process.user_traits()):
+            if parameters is not None and pname not in parameters:
+                continue
             if trait.forbid_completion \
                     or process.is_parameter_protected(pname):
                 # completion has been explicitly disabled on this parameter
@@ -490,7 +522,6 @@ class ProcessCompletionEngine(traits.HasTraits):
                     import traceback
                     traceback.print_exc()
                 #pass
-        self.completion_progress = self.completion_progress_total
 
 
     def attributes_to_path(self, parameter, attributes):
@@ -505,6 +536,30 @@ class ProcessCompletionEngine(traits.HasTraits):
             .attributes_to_path(self.process, parameter, attributes)
 
 
+    def attributes_list_to_paths(self, parameter, attributes,
+                                 iterated_values):
+        ''' Build paths from a series of attributes values sets for a given
+        parameter in a process.
+
+        Parameters
+        ----------
+        parameter: str
+        attributes: ProcessAttributes instance (Controller)
+            attributes values shared by all items
+        iterated_values: dict
+            {attribute: values_list}: values of attributes which change for
+            each item.
+
+        Returns
+        -------
+        paths: list
+            one path (or None) for each item
+        '''
+        return self.get_path_completion_engine() \
+            .attributes_list_to_paths(self.process, parameter, attributes,
+                                      iterated_values)
+
+
     def set_parameters(self, process_inputs):
         ''' Set the given parameters dict to the given process.
         process_inputs may include regular parameters of the underlying
@@ -544,11 +599,118 @@ class ProcessCompletionEngine(traits.HasTraits):
         if name != 'trait_added' and name != 'user_traits_changed' \
                 and self.completion_ongoing is False:
             #setattr(self.capsul_attributes, name, new)
-            self.completion_ongoing = True
-            self.complete_parameters({'capsul_attributes': {name: new}})
+            self.changed_attributes.add(name)
+            self.complete_changed_attributes()
+
+
+    def get_attributes_dependencies(self):
+        ''' Process parameters depending on each attribute, as declared in
+        the attributes ``parameter_attributes``.
+
+        Returns
+        -------
+        dependencies: dict
+            {attribute: set of parameters}
+        '''
+        attributes = self.get_attribute_values()
+        if self._attributes_dependencies is not None \
+                and self._attributes_dependencies[0] is attributes \
+                and self._attributes_dependencies[1] \
+                    == len(attributes.parameter_attributes):
+            return self._attributes_dependencies[2]
+        dependencies = {}
+        for parameter, param_att \
+                in six.iteritems(attributes.parameter_attributes):
+            editable_attributes, fixed_attibute_values = param_att
+            for ea in editable_attributes:
+                for attribute in ea.user_traits():
+                    dependencies.setdefault(attribute, set()).add(parameter)
+        self._attributes_dependencies = (
+            attributes, len(attributes.parameter_attributes), dependencies)
+        return dependencies
+
+
+    def complete_changed_attributes(self, attributes=None):
+        ''' Incremental completion: only re-complete the parameters, and
+        pipeline nodes, which depend on attributes which have changed since
+        the last completion.
+
+        Changed attributes are recorded in ``changed_attributes`` by
+        :meth:`attributes_changed`: completion may thus be postponed and
+        triggered later for a whole set of modifications.
+
+        Completion engines which specialize :meth:`complete_parameters`
+        perform a full completion.
+
+        Parameters
+        ----------
+        attributes: list (optional)
+            attributes names to consider changed, in addition to
+            ``changed_attributes``
+        '''
+        changed = set(self.changed_attributes)
+        if attributes:
+            changed.update(attributes)
+        self.changed_attributes = set()
+        if not changed:
+            return
+        self.completion_ongoing = True
+        try:
+            self._complete_changed_attributes(changed)
+        finally:
             self.completion_ongoing = False
 
 
+    def _complete_changed_attributes(self, changed):
+        attributes = self.get_attribute_values()
+        if not _uses_generic_completion(self):
+            self.complete_parameters()
+            return
+
+        self.completion_progress = 0.
+        self.completion_progress_total = 1.
+        pipeline = None
+        if isinstance(self.process, PipelineNode):
+            pipeline = self.process.process
+        elif isinstance(self.process, Pipeline):
+            pipeline = self.process
+        if pipeline:
+            attrib_values = attributes.export_to_dict()
+            name = getattr(pipeline, 'context_name', pipeline.name)
+            nodes_order, nodes_list = self._sorted_nodes(pipeline)
+            self.completion_progress_total = len(nodes_list) + 0.05
+            for index, (node_name, node) in enumerate(nodes_order):
+                pname = '.'.join([name, node_name])
+                try:
+                    subprocess_compl = \
+                        ProcessCompletionEngine.get_completion_engine(
+                            node, pname)
+                    sub_attributes = subprocess_compl.get_attribute_values()
+                    old_values = sub_attributes.export_to_dict()
+                    subprocess_compl.set_parameters(
+                        {'capsul_attributes': attrib_values})
+                    new_values = sub_attributes.export_to_dict()
+                    # attributes actually modified for this node
+                    node_changed = set(
+                        [a for a in new_values
+                         if a in changed
+                            or old_values.get(a) != new_values[a]])
+                    if node_changed:
+                        subprocess_compl._complete_changed_attributes(
+                            node_changed)
+                except Exception:
+                    pass
+                self.completion_progress = index + 1
+
+        dependencies = self.get_attributes_dependencies()
+        parameters = set()
+        for attribute in changed:
+            parameters.update(dependencies.get(attribute, ()))
+        if parameters:
+            self._complete_process_parameters(parameters)
+        self.completion_progress = self.completion_progress_total
+
+
     def nodes_selection_changed(self, obj, name, old, new):
         ''' Traits changed callback which triggers parameters update.
 
@@ -562,6 +724,7 @@ class ProcessCompletionEngine(traits.HasTraits):
         if not self.completion_ongoing:
             self.completion_ongoing = True
             self._rebuild_attributes = True
+            self._attributes_dependencies = None
             self.complete_parameters()
             self.completion_ongoing = False
 
@@ -569,6 +732,9 @@ class ProcessCompletionEngine(traits.HasTraits):
     def install_auto_completion(self):
         ''' Monitor attributes changes and switches changes (which may
         influence attributes) and recompute parameters completion when needed.
+
+        Attributes changes only trigger the completion of the parameters
+        depending on them (see :meth:`complete_changed_attributes`).
         '''
         self.get_attribute_values().on_trait_change(
             self.attributes_changed, 'anytrait')
@@ -933,6 +1099,17 @@ class SwitchCompletionEngine(ProcessCompletionEngine):
 
 
 
+def _uses_generic_completion(completion_engine):
+    ''' Tells if the completion engine uses the generic
+    :meth:`ProcessCompletionEngine.complete_parameters` implementation, which
+    only completes parameters from attributes through paths completion.
+    '''
+    return six.get_unbound_function(
+        type(completion_engine).complete_parameters) \
+            is six.get_unbound_function(
+                ProcessCompletionEngine.complete_parameters)
+
+
 class PathCompletionEngine(object):
     ''' Implements building of a single path from a set of attributes for a
     specific process / parameter
@@ -951,6 +1128,41 @@ class PathCompletionEngine(object):
         '''
         return None
 
+    def attributes_list_to_paths(self, process, parameter, attributes,
+                                 iterated_values):
+        ''' Build paths for a series of attributes values sets for a given
+        parameter in a process: this is a "vectorized" version of
+        :meth:`attributes_to_path`, used to complete iterations in one pass.
+
+        The default implementation calls :meth:`attributes_to_path` for each
+        item, after having set the iterated attributes values on
+        ``attributes``. Specializations may share the rules selection for all
+        items.
+
+        Parameters
+        ----------
+        process: Node or Process instance
+        parameter: str
+        attributes: ProcessAttributes instance (Controller)
+            attributes values shared by all items
+        iterated_values: dict
+            {attribute: values_list}: values of attributes which change for
+            each item. All lists should have the same length.
+
+        Returns
+        -------
+        paths: list
+            one path (or None) for each item
+        '''
+        size = max([len(v) for v in iterated_values.values()] or [0])
+        paths = []
+        for item in range(size):
+            for attribute, values in six.iteritems(iterated_values):
+                setattr(attributes, attribute, values[item])
+            paths.append(self.attributes_to_path(process, parameter,
+                                                 attributes))
+        return paths
+
     def allowed_formats(self, process, parameter):
         ''' List of possible formats names associated with a parameter
         '''
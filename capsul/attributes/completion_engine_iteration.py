@@ -14,7 +14,8 @@ from __future__ import print_function
 from __future__ import absolute_import
 from capsul.pipeline.process_iteration import ProcessIteration
 from capsul.attributes.completion_engine import ProcessCompletionEngine, \
-    ProcessCompletionEngineFactory
+    ProcessCompletionEngineFactory, _uses_generic_completion
+from capsul.pipeline.pipeline import Pipeline
 from capsul.pipeline.pipeline_nodes import ProcessNode
 from capsul.attributes.attributes_schema import ProcessAttributes
 from soma.controller import Controller,ControllerTrait
@@ -35,7 +36,16 @@ class ProcessCompletionEngineIteration(ProcessCompletionEngine):
     Iterated attributes are given by get_iterated_attributes().
     Completion performs a single iteration step, stored in
     self.capsul_iteration_step
+
+    When the iterated process is a "simple" process (not a pipeline), and its
+    completion engine does not specialize
+    :meth:`~capsul.attributes.completion_engine.ProcessCompletionEngine.complete_parameters`,
+    all iterations are completed in one pass using
+    :meth:`complete_iterations_batch`, unless :attr:`batch_completion` is
+    False.
     '''
+    batch_completion = True
+
     def __init__(self, process, name=None):
         super(ProcessCompletionEngineIteration, self).__init__(
             process=process, name=name)
@@ -213,13 +223,6 @@ class ProcessCompletionEngineIteration(ProcessCompletionEngine):
         for parameter in process.regular_parameters:
             parameters[parameter] = getattr(process, parameter)
 
-        # complete each step to get iterated parameters.
-        # This is generally "too much" but it's difficult to perform a partial
-        # completion only on iterated parameters
-
-        iterative_parameters = dict(
-            [(key, []) for key in process.iterative_parameters])
-
         # propagate forbid_completion
         for param, trait in six.iteritems(process.user_traits()):
             if trait.forbid_completion:
@@ -230,6 +233,49 @@ class ProcessCompletionEngineIteration(ProcessCompletionEngine):
                     process.process.trait(param).forbid_completion = True
 
         self.completion_progress_total = size
+        iterative_parameters = None
+        if self.batch_completion:
+            iterated_values = {}
+            for attribute in iterated_attributes:
+                values = getattr(attributes_set, attribute)
+                iterated_values[attribute] \
+                    = [values[min(len(values) - 1, it_step)]
+                       for it_step in range(size)]
+            iterative_parameters = self.complete_iterations_batch(
+                iterated_values, parameters, size)
+        if iterative_parameters is None:
+            iterative_parameters = self._complete_iterations_steps(
+                completion_engine, attributes_set, step_attributes,
+                iterated_attributes, parameters, size)
+        for parameter, values in iterative_parameters.items():
+            try:
+                setattr(process, parameter, values)
+            except Exception as e:
+                print('assign iteration parameter', parameter, ':\n', e,
+                      file=sys.stderr)
+        for parameter in parameters:
+            try:
+                value = getattr(process.process, parameter)
+                setattr(process, parameter, value)
+            except Exception as e:
+                print('assign parameter', parameter, ':\n', e,
+                      file=sys.stderr)
+
+
+    def _complete_iterations_steps(self, completion_engine, attributes_set,
+                                   step_attributes, iterated_attributes,
+                                   parameters, size):
+        ''' Complete iterations step by step, running the iterated process
+        completion engine for each of them.
+
+        This is generally "too much" but it's difficult to perform a partial
+        completion only on iterated parameters.
+        '''
+        process = self.process
+        if isinstance(process, ProcessNode):
+            process = process.process
+        iterative_parameters = dict(
+            [(key, []) for key in process.iterative_parameters])
         for it_step in range(size):
             self.capsul_iteration_step = it_step
             for attribute in iterated_attributes:
@@ -242,24 +288,115 @@ class ProcessCompletionEngineIteration(ProcessCompletionEngine):
                 if isinstance(values, list) and len(values) > it_step:
                     parameters[parameter] = values[it_step]
             completion_engine.complete_parameters(
-                parameters, complete_iterations=complete_iterations)
+                parameters, complete_iterations=True)
             for parameter in process.iterative_parameters:
                 value = getattr(process.process, parameter)
                 iterative_parameters[parameter].append(value)
             self.completion_progress = it_step + 1
-        for parameter, values in iterative_parameters.items():
+        return iterative_parameters
+
+
+    def complete_iterations_batch(self, iterated_values, parameters, size):
+        ''' Complete all iterations in one pass.
+
+        Paths are built for all iterations at once for each parameter of the
+        iterated process, using
+        :meth:`~capsul.attributes.completion_engine.ProcessCompletionEngine.attributes_list_to_paths`,
+        so that completion rules selection is shared between iterations. The
+        iterated process is left in the state of the last iteration, as it
+        would be after a step-by-step completion.
+
+        Parameters
+        ----------
+        iterated_values: dict
+            {attribute: values_list}: values of the iterated attributes for
+            each iteration (column-wise). Non-iterated attributes should
+            already be set on the iterated process attributes.
+        parameters: dict
+            regular parameters values. Iterative parameters values for each
+            step are inserted in it.
+        size: int
+            number of iterations
+
+        Returns
+        -------
+        iterative_parameters: dict or None
+            {parameter: values_list} for iterative parameters, or None if
+            batch completion cannot be used for the iterated process. In this
+            case nothing has been done.
+        '''
+        process = self.process
+        if isinstance(process, ProcessNode):
+            process = process.process
+        inner_process = process.process
+        if isinstance(inner_process, Pipeline):
+            return None
+        try:
+            completion_engine = ProcessCompletionEngine.get_completion_engine(
+                inner_process, self.name)
+            attributes = completion_engine.get_attribute_values()
+        except AttributeError:
+            return None
+        if not _uses_generic_completion(completion_engine):
+            # specialized completion: cannot be guessed from paths only
+            return None
+        if any([isinstance(t.trait_type, traits.List)
+                for t in attributes.user_traits().values()]):
+            return None
+        param_attributes = attributes.parameter_attributes
+        completed = [
+            pname for pname, trait in six.iteritems(inner_process.user_traits())
+            if pname in param_attributes
+                and not trait.forbid_completion
+                and not inner_process.is_parameter_protected(pname)]
+        if any([isinstance(inner_process.trait(pname).trait_type, traits.List)
+                for pname in completed]):
+            return None
+
+        iterative_parameters = dict(
+            [(key, []) for key in process.iterative_parameters])
+        if size == 0:
+            return iterative_parameters
+
+        paths = {}
+        for pname in completed:
             try:
-                setattr(process, parameter, values)
-            except Exception as e:
-                print('assign iteration parameter', parameter, ':\n', e,
-                      file=sys.stderr)
-        for parameter in parameters:
+                paths[pname] = completion_engine.attributes_list_to_paths(
+                    pname, attributes, iterated_values)
+            except Exception:
+                paths[pname] = [None] * size
+
+        # replay steps: a parameter which gets no path keeps its input value,
+        # or the value of the previous step
+        state_params = set(parameters)
+        state_params.update(process.iterative_parameters)
+        state_params.update(completed)
+        state = dict([(pname, getattr(inner_process, pname))
+                      for pname in state_params])
+        for it_step in range(size):
+            self.capsul_iteration_step = it_step
+            for parameter in process.iterative_parameters:
+                values = getattr(process, parameter)
+                if isinstance(values, list) and len(values) > it_step:
+                    parameters[parameter] = values[it_step]
+            state.update(parameters)
+            for pname in completed:
+                value = paths[pname][it_step]
+                if value is not None:
+                    state[pname] = value
+            for parameter in process.iterative_parameters:
+                iterative_parameters[parameter].append(state[parameter])
+            self.completion_progress = it_step + 1
+
+        # leave the iterated process in the last step state
+        for attribute, values in six.iteritems(iterated_values):
+            setattr(attributes, attribute, values[-1])
+        for pname, value in six.iteritems(state):
             try:
-                value = getattr(process.process, parameter)
-                setattr(process, parameter, value)
-            except Exception as e:
-                print('assign parameter', parameter, ':\n', e,
-                      file=sys.stderr)
+                setattr(inner_process, pname, value)
+            except Exception:
+                pass
+        return iterative_parameters
 
 
     def complete_iteration_step(self, step):
@@ -11,6 +11,8 @@ Classes
 --------------------------------
 :class:`FomProcessCompletionEngineIteration`
 --------------------------------------------
+:class:`AttributesToPathCache`
+------------------------------
 '''
 
 from __future__ import print_function
@@ -18,6 +20,8 @@ from __future__ import absolute_import
 
 import os
 import six
+import threading
+from collections import OrderedDict
 from traits.api import Str, HasTraits, List, Undefined
 
 from soma.controller import Controller, ControllerTrait
@@ -397,12 +401,69 @@ class FomPathCompletionEngine(PathCompletionEngine):
         parameter: str
         attributes: ProcessAttributes instance (Controller)
         '''
+        atp, name, parameter_attributes, cache \
+            = self._select_rules(process, parameter)
+        allowed_attributes = self._allowed_attributes(attributes)
+        d = dict((i, getattr(attributes, i)) \
+            for i in parameter_attributes if i in allowed_attributes)
+        return self._find_path(atp, name, parameter, d, cache)
+
+
+    def attributes_list_to_paths(self, process, parameter, attributes,
+                                 iterated_values):
+        ''' Build paths for a series of attributes values sets
+
+        FOM rules selection (process, parameter and discriminant attributes
+        lookup) is done once for all items: only patterns substitution is
+        performed for each of them.
+
+        Parameters
+        ----------
+        process: Process instance
+        parameter: str
+        attributes: ProcessAttributes instance (Controller)
+            attributes values shared by all items
+        iterated_values: dict
+            {attribute: values_list}: values of attributes which change for
+            each item. All lists should have the same length.
+
+        Returns
+        -------
+        paths: list
+            one path (or None) for each item
+        '''
+        size = max([len(v) for v in iterated_values.values()] or [0])
+        atp, name, parameter_attributes, cache \
+            = self._select_rules(process, parameter)
+        allowed_attributes = self._allowed_attributes(attributes)
+        used_attributes = [i for i in parameter_attributes
+                           if i in allowed_attributes]
+        base = dict((i, getattr(attributes, i)) for i in used_attributes
+                    if i not in iterated_values)
+        items = [(i, iterated_values[i]) for i in used_attributes
+                 if i in iterated_values]
+        paths = []
+        for item in range(size):
+            d = dict(base)
+            for i, values in items:
+                d[i] = values[item]
+            paths.append(self._find_path(atp, name, parameter, d, cache))
+        return paths
+
+
+    def _select_rules(self, process, parameter):
+        ''' Get the FOM rules set (AttributesToPaths), process name and
+        discriminant attributes used to build paths for the given parameter.
+        '''
         FomProcessCompletionEngine.setup_fom(process)
 
         input_fom = process.study_config.modules_data.foms['input']
         output_fom = process.study_config.modules_data.foms['output']
         input_atp = process.study_config.modules_data.fom_atp['input']
         output_atp = process.study_config.modules_data.fom_atp['output']
+        # rules selection cache, reset when FOMs are (re)loaded
+        cache = getattr(process.study_config.modules_data, 'fom_atp_cache',
+                        None)
 
         #Create completion
         names_search_list = []
@@ -434,6 +495,23 @@ class FomPathCompletionEngine(PathCompletionEngine):
             raise KeyError('Process not found in FOMs amongst %s' \
                 % repr(names_search_list))
 
+        # Select only the attributes that are discriminant for this
+        # parameter otherwise other attributes can prevent the appropriate
+        # rule to match
+        key = (id(atp), name, parameter)
+        parameter_attributes = None
+        if cache is not None:
+            parameter_attributes = cache.get(key)
+        if parameter_attributes is None:
+            parameter_attributes = atp.find_discriminant_attributes(
+                fom_parameter=parameter, fom_process=name)
+            if cache is not None:
+                cache[key] = parameter_attributes
+        return atp, name, parameter_attributes, cache
+
+
+    @staticmethod
+    def _allowed_attributes(attributes):
         allowed_attributes = set(attributes.user_traits().keys())
         allowed_attributes.discard('parameter')
         allowed_attributes.discard('process_name')
@@ -442,14 +520,24 @@ class FomPathCompletionEngine(PathCompletionEngine):
         #allowed_attributes.discard('type')
         #allowed_attributes.discard('generated_by_parameter')
         #allowed_attributes.discard('generated_by_process')
+        return allowed_attributes
 
-        # Select only the attributes that are discriminant for this
-        # parameter otherwise other attributes can prevent the appropriate
-        # rule to match
-        parameter_attributes = atp.find_discriminant_attributes(
-            fom_parameter=parameter, fom_process=name)
-        d = dict((i, getattr(attributes, i)) \
-            for i in parameter_attributes if i in allowed_attributes)
+
+    @staticmethod
+    def _find_path(atp, name, parameter, d, cache):
+        ''' Substitute attributes values d in the FOM patterns of the
+        selected rules set
+        '''
+        if cache is not None:
+            key = (id(atp), name, parameter) + tuple(sorted(six.iteritems(d)))
+            try:
+                return cache[key]
+            except KeyError:
+                pass
+            except TypeError:
+                # unhashable attribute values (lists...): don't cache
+                cache = None
+        d = dict(d)
         d['fom_process'] = name
         d['fom_parameter'] = parameter
         d['fom_format'] = 'fom_preferred'
@@ -464,6 +552,8 @@ class FomPathCompletionEngine(PathCompletionEngine):
             #path_values.append(h[0])
             break
 
+        if cache is not None:
+            cache[key] = path_value
         return path_value
 
 
@@ -585,6 +675,49 @@ class FomProcessCompletionEngineIteration(ProcessCompletionEngineIteration):
         return iter_attrib
 
 
+class AttributesToPathCache(object):
+    ''' Least recently used cache of FOM rules selection, used by
+    :meth:`FomPathCompletionEngine.attributes_to_path`.
+
+    It maps (attributes to path object id, process name, parameter) keys to
+    discriminant attributes of the parameter, and keys extended with
+    discriminant attributes values to paths. It is held by the engine FOM
+    module data, and cleared whenever FOMs, formats or directories are
+    changed (see :func:`capsul.engine.module.fom.update_fom`).
+    '''
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            value = self._items.pop(key)
+            self._items[key] = value  # most recently used
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
 #class FomPathCompletionEngineFactory(PathCompletionEngineFactory):
 
     #factory_id = 'fom'
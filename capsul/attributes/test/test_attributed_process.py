@@ -44,6 +44,27 @@ class DummyListProcess(Process):
                 '{\n    truc=%s,\n    bidule=%s\n}' % (self.truc, self.bidule))
 
 
+class DummyChainPipeline(Pipeline):
+
+    def pipeline_definition(self):
+        self.add_process(
+            'node3',
+            'capsul.attributes.test.test_attributed_process.DummyProcess')
+        self.add_process(
+            'node2',
+            'capsul.attributes.test.test_attributed_process.DummyProcess')
+        self.add_process(
+            'node1',
+            'capsul.attributes.test.test_attributed_process.DummyProcess')
+        self.add_link('node1.bidule->node2.truc')
+        self.add_link('node2.bidule->node3.truc')
+        self.export_parameter('node1', 'truc')
+        self.export_parameter('node3', 'bidule')
+        for node_name in ('node1', 'node2', 'node3'):
+            self.export_parameter(node_name, 'f', 'f_%s' % node_name)
+        self.do_autoexport_nodes_parameters = False
+
+
 class CustomAttributesSchema(AttributesSchema):
     factory_id = 'custom_ex'
 
@@ -219,6 +240,22 @@ class TestCompletion(unittest.TestCase):
                              '/tmp/out/DummyProcess_bidule_muppets_stalter',
                              '/tmp/out/DummyProcess_bidule_muppets_waldorf']])
 
+    def test_pipeline_completion_order(self):
+        study_config = self.study_config
+        pipeline = study_config.get_process_instance(
+            'capsul.attributes.test.test_attributed_process.'
+            'DummyChainPipeline')
+        cm = ProcessCompletionEngine.get_completion_engine(pipeline)
+        atts = cm.get_attribute_values()
+        atts.center = 'muppets'
+        atts.subject = 'kermit'
+        cm.complete_parameters()
+        # nodes are completed in dependencies order
+        self.assertEqual(list(cm.completion_timings.keys()),
+                         ['node1', 'node2', 'node3'])
+        self.assertTrue(all([t >= 0.
+                             for t in cm.completion_timings.values()]))
+
     def test_list_completion(self):
         study_config = self.study_config
         process = study_config.get_process_instance(
@@ -249,6 +286,64 @@ class TestCompletion(unittest.TestCase):
                          os.path.normpath(
                             '/tmp/out/DummyListProcess_result_cartoon'))
 
+    def test_incremental_completion(self):
+        study_config = self.study_config
+        process = study_config.get_process_instance(
+            'capsul.attributes.test.test_attributed_process.DummyListProcess')
+        patt = ProcessCompletionEngine.get_completion_engine(process)
+        atts = patt.get_attribute_values()
+        atts.center = ['jojo', 'koko']
+        atts.subject = ['barbapapa', 'barbatruc']
+        atts.group = 'cartoon'
+        patt.complete_parameters()
+        deps = patt.get_attributes_dependencies()
+        self.assertEqual(deps['group'], set(['result']))
+        self.assertEqual(deps['subject'], set(['truc', 'bidule']))
+        patt.install_auto_completion()
+        try:
+            process.truc = ['/tmp/in/manual']
+            atts.group = 'comics'
+            # only parameters depending on "group" are completed again
+            self.assertEqual(os.path.normpath(process.result),
+                             os.path.normpath(
+                                '/tmp/out/DummyListProcess_result_comics'))
+            self.assertEqual(process.truc, ['/tmp/in/manual'])
+            atts.subject = ['barbidur', 'barbouille']
+            self.assertEqual(
+                [os.path.normpath(p) for p in process.truc],
+                [os.path.normpath(p) for p in
+                    ['/tmp/in/DummyListProcess_truc_jojo_barbidur',
+                     '/tmp/in/DummyListProcess_truc_koko_barbouille']])
+        finally:
+            patt.remove_auto_completion()
+
+    def test_incremental_pipeline_completion(self):
+        study_config = self.study_config
+        pipeline = study_config.get_process_instance(
+            'capsul.attributes.test.test_attributed_process.'
+            'DummyChainPipeline')
+        cm = ProcessCompletionEngine.get_completion_engine(pipeline)
+        atts = cm.get_attribute_values()
+        atts.center = 'muppets'
+        atts.subject = 'kermit'
+        cm.complete_parameters()
+        atts.subject = 'piggy'
+        cm.complete_changed_attributes(['subject'])
+        self.assertEqual(cm.changed_attributes, set())
+        self.assertEqual(
+            os.path.normpath(pipeline.bidule),
+            os.path.normpath('/tmp/out/DummyChainPipeline_bidule_muppets_piggy'))
+        values = dict([(node_name, node.process.export_to_dict())
+                       for node_name, node in pipeline.nodes.items()
+                       if node_name != ''])
+        # same result as a full completion
+        cm.complete_parameters()
+        self.assertEqual(
+            dict([(node_name, node.process.export_to_dict())
+                  for node_name, node in pipeline.nodes.items()
+                  if node_name != '']),
+            values)
+
 
     def test_run_iteraton_sequential(self):
         study_config = self.study_config
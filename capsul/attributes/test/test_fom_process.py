@@ -5,6 +5,8 @@ from __future__ import absolute_import
 
 from capsul.api import StudyConfig, Pipeline
 from capsul.attributes.completion_engine import ProcessCompletionEngine
+from capsul.attributes.completion_engine_iteration \
+    import ProcessCompletionEngineIteration
 from capsul.attributes.fom_completion_engine \
     import FomProcessCompletionEngine, FomPathCompletionEngine
 from traits.api import Str, Float, File, String, Undefined, List
@@ -149,6 +151,31 @@ class TestCompletion(unittest.TestCase):
                          os.path.normpath('/tmp/out/DummyProcess_bidule_jojo_barbapapa.txt'))
 
 
+    def test_attributes_to_path_cache(self):
+        study_config = self.study_config
+        process = study_config.get_process_instance(
+            'capsul.attributes.test.test_attributed_process.DummyProcess')
+        patt = ProcessCompletionEngine.get_completion_engine(process)
+        atts = patt.get_attribute_values()
+        atts.center = 'jojo'
+        atts.subject = 'barbapapa'
+        patt.complete_parameters()
+        cache = study_config.modules_data.fom_atp_cache
+        self.assertTrue(len(cache) != 0)
+        # another subject reuses rules selection
+        atts.subject = 'barbidou'
+        patt.complete_parameters()
+        self.assertEqual(os.path.normpath(process.bidule),
+                         os.path.normpath(
+                            '/tmp/out/DummyProcess_bidule_jojo_barbidou.txt'))
+        # changing the FOM directories invalidates the cache
+        study_config.output_directory = '/tmp/out2'
+        self.assertEqual(len(cache), 0)
+        patt.complete_parameters()
+        self.assertEqual(os.path.normpath(process.bidule),
+                         os.path.normpath(
+                            '/tmp/out2/DummyProcess_bidule_jojo_barbidou.txt'))
+
     def test_iteration(self):
         study_config = self.study_config
         pipeline = study_config.get_iteration_pipeline(
@@ -175,6 +202,31 @@ class TestCompletion(unittest.TestCase):
                 '/tmp/out/DummyProcess_bidule_muppets_stalter.txt',
                 '/tmp/out/DummyProcess_bidule_muppets_waldorf.txt']])
 
+    def test_iteration_batch_completion(self):
+        study_config = self.study_config
+        pipeline = study_config.get_iteration_pipeline(
+            'iter',
+            'dummy',
+            'capsul.attributes.test.test_attributed_process.DummyProcess',
+            ['truc', 'bidule'])
+        cm = ProcessCompletionEngine.get_completion_engine(pipeline)
+        atts = cm.get_attribute_values()
+        atts.center = ['muppets']
+        atts.subject = ['kermit', 'piggy', 'stalter', 'waldorf']
+        cm.complete_parameters()
+        batch_truc = pipeline.truc
+        batch_bidule = pipeline.bidule
+        self.assertEqual(len(batch_truc), 4)
+        pipeline.truc = []
+        pipeline.bidule = []
+        ProcessCompletionEngineIteration.batch_completion = False
+        try:
+            cm.complete_parameters()
+        finally:
+            ProcessCompletionEngineIteration.batch_completion = True
+        self.assertEqual(pipeline.truc, batch_truc)
+        self.assertEqual(pipeline.bidule, batch_bidule)
+
     def test_list_completion(self):
         study_config = self.study_config
         process = study_config.get_process_instance(
@@ -22,6 +22,7 @@ Functions
 
 from __future__ import absolute_import
 from __future__ import print_function
+from functools import partial
 import importlib
 import json
 import os
@@ -30,6 +31,7 @@ import re
 import tempfile
 import subprocess
 import sys
+import weakref
 
 from traits.api import Dict, String, Undefined
 
@@ -39,9 +41,8 @@ from soma.sorted_dictionary import SortedDictionary
 from soma.utils.weak_proxy import get_ref
 
 from .database_json import JSONDBEngine
-from .database_populse import PopulseDBEngine
 
-from .settings import Settings
+from .settings import Settings, FrozenSettings
 from .module import default_modules
 from . import run
 from .run import WorkflowExecutionError
@@ -182,13 +183,20 @@ class CapsulEngine(Controller):
     :class:`~capsul.engine.module.matlab`,
     :class:`~capsul.engine.module.spm`
 
+    Modules which are not explicitly required are only registered when the
+    engine is created (see :meth:`register_module`): they are actually loaded
+    the first time their configuration is used, in settings sessions or
+    selections. The :class:`~capsul.study_config.study_config.StudyConfig`
+    object of the engine is also built the first time it is used.
+
     **Methods**
     '''
 
     def __init__(self, 
                  database_location,
                  database,
-                 require):
+                 require,
+                 settings=None):
         '''
         CapsulEngine.__init__(self, database_location, database, config=None)
 
@@ -197,16 +205,22 @@ class CapsulEngine(Controller):
         '''
         super(CapsulEngine, self).__init__()
         
-        self._settings = None
+        self._settings = settings
         
         self._database_location = database_location
         self._database = database        
 
         self._loaded_modules = set()
+        self._registered_modules = set()
+        if settings is not None:
+            settings.module_loader = partial(
+                CapsulEngine.load_registered_modules, weakref.proxy(self))
+        # study_config does not exist while it is being built (modules
+        # check it to link with it)
+        self._study_config = None
+        self._building_study_config = True
         self.load_modules(require)
-        
-        from capsul.study_config.study_config import StudyConfig
-        self.study_config = StudyConfig(engine=self)
+        self._building_study_config = False
 
         self._metadata_engine = from_json(database.json_value('metadata_engine'))
 
@@ -217,8 +231,27 @@ class CapsulEngine(Controller):
     def settings(self):
         if self._settings is None:
             self._settings = Settings(self.database.db)
+            self._settings.module_loader = partial(
+                CapsulEngine.load_registered_modules, weakref.proxy(self))
         return self._settings
 
+    @property
+    def study_config(self):
+        if self._study_config is None:
+            if self._building_study_config:
+                raise AttributeError('study_config')
+            from capsul.study_config.study_config import StudyConfig
+            self._building_study_config = True
+            try:
+                self._study_config = StudyConfig(engine=self)
+            finally:
+                self._building_study_config = False
+        return self._study_config
+
+    @study_config.setter
+    def study_config(self, study_config):
+        self._study_config = study_config
+
     @property
     def database(self):
         return self._database
@@ -240,16 +273,48 @@ class CapsulEngine(Controller):
     
     def load_modules(self, require):
         '''
-        Call self.load_module for each required module. The list of modules
-        to load is located in self.modules (if it is None,
-        capsul.module.default_modules is used).
+        Call self.load_module for each required module. If require is None,
+        capsul.module.default_modules are registered (see
+        :meth:`register_module`) and will be loaded when they are first used.
         '''
         if require is None:
-            require = default_modules
-        
+            for module in default_modules:
+                self.register_module(module)
+            return
+
         for module in require:
             self.load_module(module)
 
+    def register_module(self, module_name):
+        '''
+        Register a module to be loaded (see :meth:`load_module`) only when
+        its configuration is first used, through settings sessions or
+        :meth:`~capsul.engine.settings.Settings.select_configurations`.
+        Registering a module which is already loaded does nothing.
+        '''
+        module_name = Settings.module_name(module_name)
+        if module_name not in self._loaded_modules:
+            self._registered_modules.add(module_name)
+
+    def load_registered_modules(self, modules=None):
+        '''
+        Load registered modules (see :meth:`register_module`) which are not
+        loaded yet, among the given ones (all if modules is None).
+
+        Returns
+        -------
+        loaded: bool
+            True if at least one module has been loaded
+        '''
+        if modules is None:
+            modules = list(self._registered_modules)
+        loaded = False
+        for module_name in modules:
+            module_name = Settings.module_name(module_name)
+            if module_name in self._registered_modules:
+                loaded |= self.load_module(module_name)
+        return loaded
+
     def load_module(self, module_name):
         '''
         Load a module if it has not already been loaded (is this case,
@@ -282,6 +347,7 @@ class CapsulEngine(Controller):
         module_name = self.settings.module_name(module_name)
         if module_name not in self._loaded_modules:
             self._loaded_modules.add(module_name)
+            self._registered_modules.discard(module_name)
             python_module = importlib.import_module(module_name)
             init_settings = getattr(python_module, 'init_settings', None)
             if init_settings is not None:
@@ -295,6 +361,13 @@ class CapsulEngine(Controller):
 
     # TODO: take computing resource in account in the following methods
 
+    def transaction(self):
+        '''
+        Context manager grouping database operations in a single transaction
+        (see :meth:`capsul.engine.database.DatabaseEngine.transaction`)
+        '''
+        return self.database.transaction()
+
     def set_named_directory(self, name, path):
         return self.database.set_named_directory(name, path)
 
@@ -302,7 +375,7 @@ class CapsulEngine(Controller):
         return self.database.named_directory(name)
 
     def named_directories(self):
-        return self.database.set_named_directories()
+        return self.database.named_directories()
 
     def set_json_value(self, name, json_value):
         return self.database.set_json_value(name, json_value)
@@ -314,7 +387,15 @@ class CapsulEngine(Controller):
         return self.database.set_path_metadata(path, metadata, named_directory)
 
     def path_metadata(self, path, named_directory=None):
-        return self.database.set_path_metadata(path, named_directory)
+        return self.database.path_metadata(path, named_directory)
+
+    def set_paths_metadata(self, paths_metadata, named_directory=None):
+        return self.database.set_paths_metadata(paths_metadata,
+                                                named_directory)
+
+    def paths_metadata(self, named_directory=None, prefix=None,
+                       filters=None):
+        return self.database.paths_metadata(named_directory, prefix, filters)
 
     def import_configs(self, environment, config_dict, cont_on_error=False):
         '''
@@ -378,7 +459,8 @@ class CapsulEngine(Controller):
         pipeline.autoexport_nodes_parameters(include_optional=True)
         return pipeline
 
-    def start(self, process, workflow=None, history=True, get_pipeline=False, **kwargs):
+    def start(self, process, workflow=None, history=True, get_pipeline=False,
+              shards=None, **kwargs):
         '''
         Asynchronously start the execution of a process or pipeline in the
         connected computing environment. Returns an identifier of
@@ -405,15 +487,23 @@ class CapsulEngine(Controller):
             be inserted into a small pipeline for execution. This pipeline will
             be the one actually run, and may be passed to :meth:`wait` to set
             output parameters.
+        shards: int (optional)
+            if given and greater than 1, and if the pipeline only contains an
+            iteration node (see :meth:`get_iteration_pipeline`), the
+            iterations are split into this number of independent workflows,
+            which are submitted concurrently. The returned execution id is
+            then a :class:`~capsul.engine.run.ShardedExecution`, which is
+            accepted by :meth:`wait`, :meth:`status`, :meth:`dispose` etc.
 
         Returns
         -------
-        execution_id: int
+        execution_id: int or ShardedExecution
             execution identifier (actually a soma-workflow id)
         pipeline: Pipeline instance (optional)
             only returned if get_pipeline is True.
         '''
-        return run.start(self, process, workflow, history, get_pipeline, **kwargs)
+        return run.start(self, process, workflow, history, get_pipeline,
+                         shards=shards, **kwargs)
 
     def connect(self, computing_resource):
         '''
@@ -506,6 +596,9 @@ def database_factory(database_location):
     '''
     global _populsedb_url_re 
 
+    # populse_db is only imported when a database is actually created
+    from .database_populse import PopulseDBEngine
+
     engine_directory = None
 
     if database_location is None:
@@ -530,13 +623,24 @@ def database_factory(database_location):
         engine.set_named_directory('capsul_engine', engine_directory)
     return engine
 
-def capsul_engine(database_location=None, require=None):
+def capsul_engine(database_location=None, require=None,
+                  settings_snapshot=None):
     '''
     User facrory for creating capsul engines.
 
     If no database_location is given, it will default to an internal (in-
     memory) database with no persistent settings or history values.
 
+    If settings_snapshot is given, settings are read-only
+    :class:`~capsul.engine.settings.FrozenSettings`: no settings database is
+    created, and only the modules which have configurations in the snapshot
+    are loaded, unless require is specified. settings_snapshot may be a
+    :class:`~capsul.engine.settings.FrozenSettings` instance, a snapshot
+    file name (see :meth:`~capsul.engine.settings.Settings.save_snapshot`),
+    or a dict in the shape of
+    :meth:`~capsul.engine.settings.Settings.export_config_dict`. This is
+    meant for jobs workers.
+
     Configuration is read from a dictionary stored in two database entries.
     The first entry has the key 'global_config' (i.e.
     database.json_value('global_config')), it contains the configuration
@@ -552,6 +656,21 @@ def capsul_engine(database_location=None, require=None):
     '''
     #if database_location is None:
         #database_location = osp.expanduser('~/.config/capsul/capsul_engine.sqlite')
+    if settings_snapshot is not None:
+        if isinstance(settings_snapshot, FrozenSettings):
+            settings = settings_snapshot
+        elif isinstance(settings_snapshot, dict):
+            settings = FrozenSettings(settings_snapshot)
+        else:
+            settings = FrozenSettings.load(settings_snapshot)
+        if require is None:
+            require = settings.modules()
+        if database_location is None:
+            database = JSONDBEngine(None)
+        else:
+            database = database_factory(database_location)
+        return CapsulEngine(database_location, database, require=require,
+                            settings=settings)
     database = database_factory(database_location)
     capsul_engine = CapsulEngine(database_location, database, require=require)
     return capsul_engine
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
+from contextlib import contextmanager
 import os.path as osp
+import threading
 
 class DatabaseEngine(object):
     '''
@@ -15,10 +17,28 @@ class DatabaseEngine(object):
     - :py:class:`capsul.engine.database_json.JSONDBEngine`
     - :py:class:`capsul.engine.database_populse.PopulseDBEngine`
     
+    Path metadata are stored for a pair (named_directory, path), and can be
+    searched by named directory, path prefix and attribute values (see
+    :meth:`paths_metadata`), using indexes in the database.
     '''
-    
+
+    # [(path, name)] of named directories, sorted by decreasing path length,
+    # used by check_path(). Engines must reset it to None when named
+    # directories are modified.
+    _named_directories_cache = None
+
+    def _sorted_named_directories(self):
+        named_directories = self._named_directories_cache
+        if named_directories is None:
+            named_directories = sorted(
+                ((nd['path'], nd['name']) for nd in self.named_directories()),
+                key=lambda x: len(x[0]), reverse=True)
+            self._named_directories_cache = named_directories
+        return named_directories
+
     def check_path_metadata(self, path, metadata, named_directory=None):
-        named_directory = metadata.get('named_directory')
+        if named_directory is None:
+            named_directory = metadata.get('named_directory')
         named_directory, path = self.check_path(path, named_directory)
         
         doc = metadata.copy()
@@ -33,7 +53,8 @@ class DatabaseEngine(object):
         
         If named_directory is not given, path must be absolute or a 
         ValueError is raised. Then, either the corresponding named 
-        directory is found or 'absolute' is used.
+        directory is found (the one with the longest path containing
+        path) or 'absolute' is used.
         
         If name_directory is given, the path must be relative (unless
         named_directory == 'absolute') or begin with the path of the 
@@ -41,10 +62,10 @@ class DatabaseEngine(object):
         '''
         if named_directory is None:
             if osp.isabs(path):
-                for nd in self.named_directories():
-                    base_path = nd['path']
-                    if path.startswith(base_path):
-                        named_directory = nd['name']
+                for base_path, name in self._sorted_named_directories():
+                    if path == base_path \
+                            or path.startswith(base_path + osp.sep):
+                        named_directory = name
                         path = path[len(base_path)+1:]
                         break
                 else:
@@ -66,6 +87,65 @@ class DatabaseEngine(object):
         return (named_directory, path)
     
     
+    def commit(self):
+        '''
+        Make modifications persistent
+        '''
+        raise NotImplementedError()
+
+    def rollback(self):
+        '''
+        Cancel modifications done since the last commit
+        '''
+        raise NotImplementedError()
+
+    # lock held during the outermost transaction() blocks, by engines which
+    # can be shared between threads
+    _lock = None
+
+    def _transaction_state(self):
+        # per-thread state of transaction() blocks (dict.setdefault is
+        # atomic, so concurrent first calls get the same object)
+        return self.__dict__.setdefault('_transactions', threading.local())
+
+    @contextmanager
+    def transaction(self):
+        '''
+        Context manager grouping several operations in a single
+        transaction::
+
+            with db.transaction():
+                db.set_json_value('study', {'name': 'my_study'})
+                db.set_paths_metadata(paths_metadata)
+
+        Modifications are committed at the end of the outermost with block
+        (nested blocks of the same thread are part of the outer
+        transaction), or rolled back if an exception is raised. If the
+        engine has a lock, it is held during the whole transaction, so that
+        transactions of other threads do not interleave with it.
+        '''
+        state = self._transaction_state()
+        if getattr(state, 'active', False):
+            yield self
+            return
+        lock = self._lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            state.active = True
+            try:
+                yield self
+            finally:
+                state.active = False
+        except BaseException:
+            self.rollback()
+            raise
+        else:
+            self.commit()
+        finally:
+            if lock is not None:
+                lock.release()
+
     def set_json_value(self, name, json_value):
         '''
         Store a json value and associate it with a key given in "name".
@@ -122,3 +202,59 @@ class DatabaseEngine(object):
         Retrieve metadata associated with a path.
         '''
         raise NotImplementedError()
+
+    def set_paths_metadata(self, paths_metadata, named_directory=None):
+        '''
+        Set metadata of many paths at once, in a single transaction. This
+        is the same as calling :meth:`set_path_metadata` for each path, but
+        much faster.
+
+        Parameters
+        ----------
+        paths_metadata: iterable
+            (path, metadata) pairs
+        named_directory: str (optional)
+            named directory used for all paths (see :meth:`check_path`)
+        '''
+        for path, metadata in paths_metadata:
+            self.set_path_metadata(path, metadata, named_directory)
+
+    def paths_metadata(self, named_directory=None, prefix=None,
+                       filters=None):
+        '''
+        Search path metadata. All criteria are optional, and combined.
+
+        Parameters
+        ----------
+        named_directory: str (optional)
+            only return paths relative to this named directory
+        prefix: str (optional)
+            only return paths starting with this prefix. If named_directory
+            is not given, an absolute prefix is translated like paths in
+            :meth:`check_path`.
+        filters: dict (optional)
+            {attribute: value} metadata values to match. A value may be a
+            list (or tuple) of accepted values. For instance, all T1 files
+            of a subject could be selected using::
+
+                db.paths_metadata(filters={'subject': 'subject01',
+                                           'modality': 'T1'})
+
+        Returns
+        -------
+        metadata: list
+            metadata dicts of matching paths, including the ``path`` and
+            ``named_directory`` items.
+        '''
+        raise NotImplementedError()
+
+    def _check_prefix(self, prefix, named_directory):
+        '''
+        Get (named_directory, prefix) for a prefix query
+        '''
+        if prefix is None:
+            return named_directory, None
+        if named_directory is None and not osp.isabs(prefix):
+            raise ValueError('Cannot determine base named directory for '
+                             'relative prefix "%s"' % prefix)
+        return self.check_path(prefix, named_directory)
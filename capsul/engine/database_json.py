@@ -5,51 +5,242 @@ import os.path as osp
 import six
 import uuid
 import json
+import bisect
+import threading
 
 from capsul.engine.database import DatabaseEngine
 
+# value of keys which do not exist, used to undo modifications
+_missing = object()
+
 class JSONDBEngine(DatabaseEngine):
     '''
     A JSON dictionary implementation of :py:class:`capsul.engine.database.DatabaseEngine`
+
+    The database is stored in a JSON file, and a journal file (with the
+    ``.journal`` suffix) where :meth:`commit` appends modifications, one
+    JSON line per modification, followed by a commit marker line. When the
+    database is opened, the journal is replayed over the JSON file
+    contents. Modifications of a commit which has not been completely
+    written (after a crash) are discarded. When the journal exceeds
+    :attr:`compaction_threshold` entries, the JSON file is rewritten with
+    the whole database contents and the journal is emptied (see
+    :meth:`compact`). :meth:`rollback` restores the values modified since
+    the last commit, in memory, both for file and in-memory databases.
+
+    Path metadata queries use in-memory indexes (sorted paths per named
+    directory, and {value: keys} per attribute), which are built the first
+    time they are needed, and maintained when metadata are set.
     '''
+
+    # number of journal entries over which commit() compacts the database
+    compaction_threshold = 10000
+
     def __init__(self, json_filename):
         if json_filename is not None:
             self.json_filename = osp.normpath(osp.abspath(json_filename))
         else:
             self.json_filename = None
+        # protects modifications, their writing, and transaction() blocks
+        # from other threads
+        self._lock = threading.RLock()
         self.read_json()
-    
+
+    @property
+    def journal_filename(self):
+        if self.json_filename is None:
+            return None
+        return self.json_filename + '.journal'
+
     def read_json(self):
+        with self._lock:
+            self._read_json()
+
+    def _read_json(self):
+        self.json_dict = {}
+        self._pending = []
+        self._undo = []
+        self._journal_size = 0
+        self._named_directories_cache = None
+        self._paths_index = None
+        self._attributes_index = None
         if self.json_filename is not None and osp.exists(self.json_filename):
-            self.json_dict = json.load(open(self.json_filename))
+            with open(self.json_filename) as f:
+                stored = json.load(f)
+            # path metadata are stored as a list, in memory they are indexed
+            # by (named_directory, path)
+            paths_metadata = stored.pop('path_metadata', [])
+            if isinstance(paths_metadata, dict):
+                paths_metadata = paths_metadata.values()
+            self.json_dict = stored
+            if paths_metadata:
+                self.json_dict['path_metadata'] = dict(
+                    ((m['named_directory'], m['path']), m)
+                    for m in paths_metadata)
             self.modified = False
         else:
-            self.json_dict = {}
             self.modified = True
-            
+        self._replay_journal()
+
+    def _replay_journal(self):
+        journal = self.journal_filename
+        if journal is None or not osp.exists(journal):
+            return
+        modifications = []
+        valid_size = 0
+        with open(journal, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    # truncated line, written during a crash
+                    break
+                if entry == ['commit']:
+                    for modification in modifications:
+                        self._apply(*modification)
+                    self._journal_size += len(modifications)
+                    modifications = []
+                    valid_size = f.tell()
+                else:
+                    modifications.append(entry)
+            f.seek(0, os.SEEK_END)
+            file_size = f.tell()
+        if file_size != valid_size:
+            # remove an incomplete commit
+            with open(journal, 'r+b') as f:
+                f.truncate(valid_size)
+
     def commit(self):
-        if self.modified and self.json_filename is not None:
-            parent = osp.dirname(self.json_filename)
-            if not osp.exists(parent):
-                os.makedirs(parent)
-            json.dump(self.json_dict, open(self.json_filename, 'w'), indent=2)
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        if self.json_filename is None:
+            self._pending = []
+            self._undo = []
             self.modified = False
+            return
+        parent = osp.dirname(self.json_filename)
+        if not osp.exists(parent):
+            os.makedirs(parent)
+        if self._pending:
+            lines = [json.dumps(modification, separators=(',', ':'))
+                     for modification in self._pending]
+            lines.append('["commit"]')
+            with open(self.journal_filename, 'a') as f:
+                f.write('\n'.join(lines) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_size += len(self._pending)
+            self._pending = []
+        self._undo = []
+        if self._journal_size >= self.compaction_threshold \
+                or not osp.exists(self.json_filename):
+            self._compact()
+        self.modified = False
+
+    def compact(self):
+        '''
+        Commit pending modifications, then rewrite the JSON file with the
+        whole database contents and empty the journal.
+        '''
+        with self._lock:
+            self._commit()
+            if self.json_filename is not None and self._journal_size != 0:
+                self._compact()
+
+    def _compact(self):
+        stored = dict(self.json_dict)
+        if 'path_metadata' in stored:
+            stored['path_metadata'] = list(stored['path_metadata'].values())
+        # write a new file then replace the former one, so that a crash
+        # does not leave a partial file
+        tmp_filename = self.json_filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(stored, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        # os.replace does not exist in python 2, where os.rename replaces
+        # files on posix systems
+        getattr(os, 'replace', os.rename)(tmp_filename, self.json_filename)
+        # if a crash occurs here, replaying the journal on the new file
+        # leads to the same state
+        if osp.exists(self.journal_filename):
+            os.remove(self.journal_filename)
+        self._journal_size = 0
 
     def rollback(self):
-        self.read_json()
-    
-    
+        '''
+        Cancel the modifications done since the last commit, using the
+        previous values recorded by :meth:`_modify`
+        '''
+        with self._lock:
+            for collection, key, value in reversed(self._undo):
+                self._apply(collection, key, value)
+            self._pending = []
+            self._undo = []
+            self.modified = False
+
+    def _modify(self, *modification):
+        '''
+        Apply a modification and record it to be written in the journal at
+        the next commit
+        '''
+        with self._lock:
+            collection, key = modification[:2]
+            self._undo.append((collection, key,
+                               self._current_value(collection, key)))
+            self._apply(*modification)
+            self._pending.append(list(modification))
+            self.modified = True
+
+    def _current_value(self, collection, key):
+        '''
+        Value which, given to :meth:`_apply`, restores the current state of
+        a key
+        '''
+        if collection == 'named_directory':
+            return self.named_directory(key)
+        if collection == 'path_metadata':
+            return self.json_dict.get('path_metadata', {}).get(tuple(key))
+        return self.json_dict.get(collection, {}).get(key, _missing)
+
+    def _apply(self, collection, key, value):
+        if collection == 'named_directory':
+            self._named_directories_cache = None
+            if value:
+                self.json_dict.setdefault('named_directory', {})[key] \
+                    = {'name': key, 'path': value}
+            else:
+                self.json_dict.get('named_directory', {}).pop(key, None)
+        elif collection == 'json_value':
+            if value is _missing:
+                self.json_dict.get('json_value', {}).pop(key, None)
+            else:
+                self.json_dict.setdefault('json_value', {})[key] = value
+        elif collection == 'path_metadata':
+            key = tuple(key)
+            paths_metadata = self.json_dict.setdefault('path_metadata', {})
+            if self._paths_index is not None:
+                old = paths_metadata.get(key)
+                if old is not None:
+                    self._unindex_path_metadata(key, old)
+                if value is not None:
+                    self._index_path_metadata(key, value)
+            if value is None:
+                paths_metadata.pop(key, None)
+            else:
+                paths_metadata[key] = value
+        else:
+            raise ValueError('Unknown modification in %s: %s'
+                             % (self.journal_filename, collection))
+
     def set_named_directory(self, name, path):
         if path:
             path = osp.normpath(osp.abspath(path))
-            self.json_dict.setdefault('named_directory', {})[name] = {'name': name,
-                                                                      'path': path}
-            self.modified = True
-        else:
-            named_directory = self.json_dict.get('named_directory')
-            if named_directory is not None:
-                named_directory.pop(name, None)
-                self.modified = True
+        elif name not in self.json_dict.get('named_directory', {}):
+            return
+        self._modify('named_directory', name, path or None)
 
     def named_directory(self, name):
         return self.json_dict.get('named_directory', {}).get(name, {}).get('path')
@@ -59,8 +250,7 @@ class JSONDBEngine(DatabaseEngine):
     
         
     def set_json_value(self, name, json_value):
-        self.json_dict.setdefault('json_value', {})[name] = json_value
-        self.modified = True
+        self._modify('json_value', name, json_value)
 
     def json_value(self, name):
         return self.json_dict.get('json_value', {}).get(name)
@@ -68,13 +258,95 @@ class JSONDBEngine(DatabaseEngine):
     
     def set_path_metadata(self, path, metadata, named_directory=None):
         metadata = self.check_path_metadata(path, metadata, named_directory)
-        path = metadata['path']
-        named_directory = metadata['named_directory']
-        self.json_dict.setdefault('path_metadata', {})[
-            (named_directory, path)] = metadata
-        self.modified = True
-            
+        self._modify('path_metadata',
+                     [metadata['named_directory'], metadata['path']],
+                     metadata)
 
     def path_metadata(self, path, named_directory=None):
         named_directory, path = self.check_path(path, named_directory)
         return self.json_dict.get('path_metadata', {}).get((named_directory, path))
+
+    def paths_metadata(self, named_directory=None, prefix=None,
+                       filters=None):
+        named_directory, prefix = self._check_prefix(prefix, named_directory)
+        self._build_paths_index()
+        paths_metadata = self.json_dict.get('path_metadata', {})
+        keys = None
+        unindexed = {}
+        for attribute, values in six.iteritems(filters or {}):
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            index = self._attributes_index.get(attribute, {})
+            try:
+                selected = set()
+                for value in values:
+                    selected.update(index.get(value, ()))
+            except TypeError:
+                # unhashable values are not indexed
+                unindexed[attribute] = values
+                continue
+            keys = selected if keys is None else keys.intersection(selected)
+        if keys is None:
+            if named_directory is None:
+                named_directories = list(self._paths_index.keys())
+            else:
+                named_directories = [named_directory]
+            keys = []
+            for nd in named_directories:
+                paths = self._sorted_paths(nd)
+                if prefix:
+                    begin = bisect.bisect_left(paths, prefix)
+                    end = bisect.bisect_left(paths, prefix + u'\U0010ffff')
+                    paths = paths[begin:end]
+                keys.extend((nd, path) for path in paths)
+        else:
+            keys = [key for key in keys
+                    if (named_directory is None or key[0] == named_directory)
+                    and (not prefix or key[1].startswith(prefix))]
+        result = []
+        for key in keys:
+            metadata = paths_metadata[key]
+            if all(metadata.get(attribute) in values
+                   for attribute, values in six.iteritems(unindexed)):
+                result.append(metadata)
+        return result
+
+    def _build_paths_index(self):
+        if self._paths_index is None:
+            self._paths_index = {}
+            self._attributes_index = {}
+            for key, metadata in six.iteritems(
+                    self.json_dict.get('path_metadata', {})):
+                self._index_path_metadata(key, metadata)
+
+    def _index_path_metadata(self, key, metadata):
+        # {named_directory: [set of paths, sorted list of paths or None]}
+        self._paths_index.setdefault(key[0], [set(), None])[0].add(key[1])
+        self._paths_index[key[0]][1] = None
+        for attribute, value in six.iteritems(metadata):
+            try:
+                self._attributes_index.setdefault(attribute, {}).setdefault(
+                    value, set()).add(key)
+            except TypeError:
+                # unhashable value (list, dict)
+                pass
+
+    def _unindex_path_metadata(self, key, metadata):
+        paths = self._paths_index.get(key[0])
+        if paths is not None:
+            paths[0].discard(key[1])
+            paths[1] = None
+        for attribute, value in six.iteritems(metadata):
+            try:
+                self._attributes_index.get(attribute, {}).get(
+                    value, set()).discard(key)
+            except TypeError:
+                pass
+
+    def _sorted_paths(self, named_directory):
+        paths = self._paths_index.get(named_directory)
+        if paths is None:
+            return []
+        if paths[1] is None:
+            paths[1] = sorted(paths[0])
+        return paths[1]
@@ -1,17 +1,115 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
+from contextlib import contextmanager
+import copy
 import os.path as osp
 import six
+import threading
 import uuid
+import json
 
 from capsul.engine.database import DatabaseEngine
 
-from populse_db.database import Database
+from populse_db.database import Database, python_value_type
+
+
+class SessionPool(object):
+    '''
+    Pool of populse_db sessions, used like a populse_db
+    :class:`~populse_db.database.Database`::
+
+        with pool as dbs:
+            ...
+
+    Each thread gets its own database connection, so that sessions can be
+    used concurrently from several threads. Like for populse_db databases,
+    nested with blocks in a thread reuse the same session, and the
+    transaction is committed (or rolled back if an exception is raised)
+    at the end of the outermost block: several operations are thus grouped
+    in a single transaction and committed together by enclosing them in a
+    with block.
+
+    An in-memory database only exists in the connection which created it:
+    in that case a single connection is shared, and threads use it in turn.
+    '''
+
+    def __init__(self, database_url):
+        self.database_url = database_url
+        self.shared = database_url.endswith(':memory:')
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        if self.shared:
+            self._shared_database = Database(database_url)
+
+    def database(self):
+        '''
+        populse_db Database used by the current thread
+        '''
+        if self.shared:
+            return self._shared_database
+        database = getattr(self._local, 'database', None)
+        if database is None:
+            database = Database(self.database_url)
+            self._local.database = database
+        return database
+
+    def __enter__(self):
+        if self.shared:
+            self._lock.acquire()
+        try:
+            return self.database().__enter__()
+        except Exception:
+            if self.shared:
+                self._lock.release()
+            raise
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.database().__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            if self.shared:
+                self._lock.release()
+
+    def commit(self):
+        '''
+        Commit the modifications done in the current thread transaction, and
+        start a new transaction.
+        '''
+        with self as dbs:
+            dbs.commit()
+            dbs.engine.cursor.execute('BEGIN DEFERRED')
+
+    def rollback(self):
+        '''
+        Cancel the modifications done in the current thread transaction,
+        and start a new transaction.
+        '''
+        with self as dbs:
+            dbs.rollback()
+            dbs.engine.cursor.execute('BEGIN DEFERRED')
 
 
 class PopulseDBEngine(DatabaseEngine):
+    '''
+    A populse_db implementation of
+    :py:class:`capsul.engine.database.DatabaseEngine`
+
+    Database sessions are taken from a :class:`SessionPool`, thus the engine
+    can be used from several threads. Operations done within a
+    :meth:`transaction` are committed together. Named directories and JSON
+    values are cached, so that reading them does not open a session each
+    time: modifications done on the same database by another engine (or
+    another process) are not seen by cached reads.
+    '''
+
     def __init__(self, database_engine):
-        self.db = Database(database_engine)
+        self.db = SessionPool(database_engine)
+        # cache of json values, and version of the cache, incremented when
+        # values are modified. A value read from the database is only
+        # cached if no modification happened meanwhile.
+        self._json_values_cache = {}
+        self._cache_version = 0
+        self._cache_lock = threading.Lock()
         with self.db as dbs:
             if not dbs.get_collection('path_metadata'):
                 # Create the schema if it does not exist
@@ -21,13 +119,43 @@ class PopulseDBEngine(DatabaseEngine):
                 dbs.add_collection('json_value', 'name')
                 dbs.add_field('json_value', 'value', 'json')
                 
-                dbs.add_collection('path_metadata', 'path')
-                dbs.add_field('path_metadata', 'named_directory', 'string', 
-                              description='Reference to a base directory whose '
-                              'path is stored in named_directory collection')
+            self._check_path_metadata_schema(dbs)
         #self.dbs = self.db.__enter__()
             
     
+    def _check_path_metadata_schema(self, dbs):
+        '''
+        Create the path_metadata collection, or upgrade it from the older
+        schema which was indexed on paths only.
+        '''
+        collection = dbs.get_collection('path_metadata')
+        docs = []
+        if collection is not None:
+            if collection.primary_key == self.path_key_field:
+                return
+            docs = [dict(doc._items())
+                    for doc in dbs.get_documents('path_metadata')]
+            dbs.remove_collection('path_metadata')
+        dbs.add_collection('path_metadata', self.path_key_field)
+        dbs.add_field('path_metadata', 'named_directory', 'string',
+                      description='Reference to a base directory whose '
+                      'path is stored in named_directory collection',
+                      index=True)
+        dbs.add_field('path_metadata', 'path', 'string',
+                      description='path relative to the named directory',
+                      index=True)
+        for doc in docs:
+            doc.setdefault('named_directory', 'capsul_engine')
+            doc[self.path_key_field] = self._path_key(
+                doc['named_directory'], doc['path'])
+            for field, value in six.iteritems(doc):
+                if dbs.get_field('path_metadata', field) is None:
+                    field_type = python_value_type(value)
+                    if field_type is not None:
+                        dbs.add_field('path_metadata', field, field_type,
+                                      index=True)
+            dbs.add_document('path_metadata', doc)
+
     def __del__(self):
         self.close()
     
@@ -39,16 +167,30 @@ class PopulseDBEngine(DatabaseEngine):
     
     
     def commit(self):
-        #self.dbs.save_modifications()
-        with self.db as dbs:
-            dbs.save_modifications()
+        self.db.commit()
 
     def rollback(self):
-        #self.dbs.unsave_modifications()
-        with self.db as dbs:
-            dbs.unsave_modifications()
+        self.db.rollback()
+        self._clear_caches()
+
+    @contextmanager
+    def transaction(self):
+        try:
+            with self.db:
+                yield self
+        except BaseException:
+            self._clear_caches()
+            raise
+
+    def _clear_caches(self):
+        with self._cache_lock:
+            self._cache_version += 1
+            self._json_values_cache = {}
+            self._named_directories_cache = None
+            self._path_fields_cache = None
 
     def set_named_directory(self, name, path):
+        self._clear_caches()
         if path:
             path = osp.normpath(osp.abspath(path))
         #doc = self.dbs.get_document('named_directory', name)
@@ -74,16 +216,20 @@ class PopulseDBEngine(DatabaseEngine):
                     dbs.set_value('named_directory', name, 'path', path)
                 else:
                     dbs.remove_document('named_directory', name)
+        # another thread may have read the former value meanwhile
+        self._clear_caches()
 
     def named_directory(self, name):
         #return self.dbs.get_value('named_directory', name, 'path')
-        with self.db as dbs:
-            return dbs.get_value('named_directory', name, 'path')
+        for path, named_directory in self._sorted_named_directories():
+            if named_directory == name:
+                return path
+        return None
 
     def named_directories(self):
         #return self.dbs.filter_documents('named_directory', 'all')
         with self.db as dbs:
-            return dbs.filter_documents('named_directory', 'all')
+            return list(dbs.filter_documents('named_directory', 'all'))
 
     def set_json_value(self, name, json_value):
         #doc = self.dbs.get_document('json_value', name)
@@ -95,6 +241,9 @@ class PopulseDBEngine(DatabaseEngine):
             #self.dbs.add_document('json_value', doc)
         #else:
             #self.dbs.set_value('json_value', name, 'json_dict', json_dict)
+        with self._cache_lock:
+            self._cache_version += 1
+            self._json_values_cache.pop(name, None)
         with self.db as dbs:
             doc = dbs.get_document('json_value', name)
             json_dict = {'value': json_value}
@@ -111,49 +260,124 @@ class PopulseDBEngine(DatabaseEngine):
         #if doc:
             #return doc['json_dict']['value']
         #return None
-        with self.db as dbs:
-            doc = dbs.get_document('json_value', name)
-            if doc:
-                return doc['json_dict']['value']
-            return None
-
-    def set_path_metadata(self, path, metadata):
-        named_directory = metadata.get('named_directory')
-        if named_directory:
-            base_path = self.named_directory('capsul_engine')
-            if base_path:
-                if not path.startswith(named_directory):
-                    raise ValueError('Path "%s" is defined as relative to named directory %s but it does not start with "%s"' % (path, named_directory, base_path))
-                path = path[len(base_path)+1:]
-            else:
-                if osp.isabs(path):
-                    raise ValueError('Cannot determine relative path for "%s" because its base named directory "%s" is unknown' % (path, named_directory))
-        else:
-            if osp.isabs(path):
-                for nd in self.named_directories():
-                    if path.startswith(nd.path):
-                        named_directory = nd.name()
-                        path = path[len(nd.path)+1]
-                        break
-                else:
-                    named_directory = None
-            else:
-                # capsul_engine is the default named directory for relative paths
-                named_directory = 'capsul_engine'
+        try:
+            value = self._json_values_cache[name]
+        except KeyError:
+            version = self._cache_version
+            with self.db as dbs:
+                doc = dbs.get_document('json_value', name)
+                value = doc['json_dict']['value'] if doc else None
+            with self._cache_lock:
+                if version == self._cache_version:
+                    self._json_values_cache[name] = value
+        # the cached value must not be modified by the caller
+        return copy.deepcopy(value)
+
+    def set_path_metadata(self, path, metadata, named_directory=None):
+        self.set_paths_metadata([(path, metadata)], named_directory)
 
-        doc = metadata.copy()
-        doc['path'] = path
-        if named_directory:
-            doc['named_directory'] = named_directory
+    def set_paths_metadata(self, paths_metadata, named_directory=None):
+        try:
+            with self.db as dbs:
+                for path, metadata in paths_metadata:
+                    doc = self.check_path_metadata(path, metadata,
+                                                   named_directory)
+                    key = self._path_key(doc['named_directory'], doc['path'])
+                    doc[self.path_key_field] = key
+                    for field, value in six.iteritems(doc):
+                        if field not in self._path_fields:
+                            self._add_path_field(dbs, field, value)
+                    try:
+                        dbs.add_document('path_metadata', doc)
+                    except ValueError:
+                        # the path already has metadata: replace them
+                        dbs.remove_document('path_metadata', key)
+                        dbs.add_document('path_metadata', doc)
+        except BaseException:
+            # fields added meanwhile may have been rolled back
+            self._path_fields_cache = None
+            raise
+
+    def path_metadata(self, path, named_directory=None):
+        named_directory, path = self.check_path(path, named_directory)
         with self.db as dbs:
-            dbs.add_document('path_metadata', doc)
-            
+            doc = dbs.get_document('path_metadata',
+                                   self._path_key(named_directory, path))
+            if doc is None:
+                return None
+            return self._path_document_dict(doc)
 
-    def path_metadata(self, path):
-        if osp.isabs(path):
-            for nd in self.named_directories():
-                if path.startswith(nd.path):
-                    path = path[len(nd.path)+1:]
-                    break
+    def paths_metadata(self, named_directory=None, prefix=None,
+                       filters=None):
+        named_directory, prefix = self._check_prefix(prefix, named_directory)
+        conditions = []
+        if named_directory is not None:
+            conditions.append('named_directory == %s'
+                              % _filter_literal(named_directory))
+        if prefix:
+            # range on the indexed path field, rather than LIKE which is
+            # case insensitive in sqlite
+            conditions.append('path >= %s AND path < %s'
+                              % (_filter_literal(prefix),
+                                 _filter_literal(prefix + u'\U0010ffff')))
+        for attribute, values in six.iteritems(filters or {}):
+            if attribute not in self._path_fields:
+                # no path has this attribute
+                return []
+            if isinstance(values, (list, tuple)):
+                conditions.append('{%s} IN %s'
+                                  % (attribute, _filter_literal(values)))
+            else:
+                conditions.append('{%s} == %s'
+                                  % (attribute, _filter_literal(values)))
+        query = ' AND '.join(conditions) if conditions else 'all'
         with self.db as dbs:
-            return dbs.get_document('path_metadata', path)
+            return [self._path_document_dict(doc)
+                    for doc in dbs.filter_documents('path_metadata', query)]
+
+    path_key_field = 'path_key'
+
+    @staticmethod
+    def _path_key(named_directory, path):
+        return '%s:%s' % (named_directory, path)
+
+    @property
+    def _path_fields(self):
+        fields = self.__dict__.get('_path_fields_cache')
+        if fields is None:
+            with self.db as dbs:
+                fields = set(f.field_name
+                             for f in dbs.get_fields('path_metadata'))
+            self._path_fields_cache = fields
+        return fields
+
+    def _add_path_field(self, dbs, field, value):
+        '''
+        Create an indexed field for a new metadata attribute
+        '''
+        field_type = python_value_type(value)
+        if field_type is None:
+            # let add_document() complain about it
+            return
+        dbs.add_field('path_metadata', field, field_type, index=True)
+        self._path_fields.add(field)
+
+    def _path_document_dict(self, doc):
+        items = dict(doc._items())
+        items.pop(self.path_key_field, None)
+        return items
+
+
+def _filter_literal(value):
+    '''
+    Format a value as a literal in a populse_db filter query
+    '''
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, six.string_types):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, (list, tuple)):
+        return '[%s]' % ', '.join(_filter_literal(v) for v in value)
+    return repr(value)
@@ -67,6 +67,8 @@ def init_settings(capsul_engine):
     store['all_foms'] = SortedDictionary()
     store['fom_atp'] = {'all': {}}
     store['fom_pta'] = {'all': {}}
+    from capsul.attributes.fom_completion_engine import AttributesToPathCache
+    store['atp_cache'] = AttributesToPathCache()
 
     capsul_engine.settings.module_notifiers['capsul.engine.module.fom'] \
         = [partial(fom_config_updated, weakref.proxy(capsul_engine), 'global')]
@@ -178,12 +180,16 @@ def update_fom(capsul_engine, environment='global', param=None, value=None):
 
         for atp in store['fom_atp']['all'].values():
             atp.directories = directories
+        # FOMs or directories may have changed
+        store['atp_cache'].clear()
 
         # backward compatibility for StudyConfig
         capsul_engine.study_config.modules_data.foms = store['foms']
         capsul_engine.study_config.modules_data.all_foms = store['all_foms']
         capsul_engine.study_config.modules_data.fom_atp = store['fom_atp']
         capsul_engine.study_config.modules_data.fom_pta = store['fom_pta']
+        capsul_engine.study_config.modules_data.fom_atp_cache \
+            = store['atp_cache']
 
 
 def update_formats(capsul_engine, environment):
@@ -225,6 +231,7 @@ def update_formats(capsul_engine, environment):
                 for t in ('input', 'output', 'shared'):
                     if store['fom_atp'].get(t) is old_atp:
                         store['fom_atp'][t] = atp
+        store['atp_cache'].clear()
 
 
 def load_fom(capsul_engine, schema, config, session, environment='global'):
@@ -273,6 +280,7 @@ def load_fom(capsul_engine, schema, config, session, environment='global'):
     store['fom_atp']['all'][schema] = atp
     pta = PathToAttributes(fom, selection={})
     store['fom_pta']['all'][schema] = pta
+    store['atp_cache'].clear()
     #print('   load fom done:', time.time() - t0, 's')
     return fom, atp, pta
 
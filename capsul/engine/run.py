@@ -9,13 +9,11 @@ Running is always using `Soma-Workflow <https://github.com/populse/soma-workflow
 from __future__ import absolute_import
 from __future__ import print_function
 
-from capsul.pipeline.pipeline import Pipeline
-from capsul.pipeline.pipeline_nodes import ProcessNode
-from traits.api import Undefined
 import six
 import tempfile
 import os
 import io
+import time
 
 
 class WorkflowExecutionError(Exception):
@@ -113,7 +111,43 @@ class WorkflowExecutionError(Exception):
             % (status, wk, wc, precisions))
 
 
-def start(engine, process, workflow=None, history=True, get_pipeline=False, **kwargs):
+class ShardedExecution(object):
+    '''
+    Execution identifier of a workflow split into several independent
+    sub-workflows (shards) which run concurrently (see
+    :func:`~capsul.pipeline.pipeline_workflow.workflow_shards_from_pipeline`).
+
+    It is returned by :func:`start` in place of a soma-workflow id, and is
+    accepted by the other execution functions (:func:`wait`, :func:`status`,
+    :func:`interrupt`, :func:`dispose`...) which apply to all shards and
+    aggregate their results.
+
+    Attributes
+    ----------
+    workflow_ids: list of int
+        soma-workflow ids of the shards workflows, in iterations order
+    '''
+    def __init__(self, workflow_ids):
+        self.workflow_ids = list(workflow_ids)
+
+    def __repr__(self):
+        return '<ShardedExecution %s>' % repr(self.workflow_ids)
+
+
+def _workflow_ids(execution_id):
+    if isinstance(execution_id, ShardedExecution):
+        return execution_id.workflow_ids
+    return [execution_id]
+
+
+def _get_controller(engine):
+    swm = engine.study_config.modules['SomaWorkflowConfig']
+    swm.connect_resource(engine.connected_to())
+    return swm.get_workflow_controller()
+
+
+def start(engine, process, workflow=None, history=True, get_pipeline=False,
+          shards=None, **kwargs):
     '''
     Asynchronously start the execution of a process or pipeline in the
     connected computing environment. Returns an identifier of
@@ -141,14 +175,21 @@ def start(engine, process, workflow=None, history=True, get_pipeline=False, **kw
         be inserted into a small pipeline for execution. This pipeline will
         be the one actually run, and may be passed to :meth:`wait` to set
         output parameters.
+    shards: int (optional)
+        if given and greater than 1, and if the pipeline only contains an
+        iteration node, the iterations are split into this number of
+        independent workflows, submitted concurrently. ``workflow`` may also
+        be a list of such workflows.
 
     Returns
     -------
-    execution_id: int
-        execution identifier (actually a soma-workflow id)
+    execution_id: int or ShardedExecution
+        execution identifier (actually a soma-workflow id, or a
+        :class:`ShardedExecution` when the execution is split into shards)
     pipeline: Pipeline instance (optional)
         only returned if get_pipeline is True.
     '''
+    from capsul.pipeline.pipeline import Pipeline
 
     # set parameters values
     for k, v in six.iteritems(kwargs):
@@ -167,7 +208,8 @@ def start(engine, process, workflow=None, history=True, get_pipeline=False, **kw
     # on the local machine
 
     # Create soma workflow pipeline
-    from capsul.pipeline.pipeline_workflow import workflow_from_pipeline
+    from capsul.pipeline.pipeline_workflow import workflow_from_pipeline, \
+        workflow_shards_from_pipeline
     import soma_workflow.client as swclient
 
     swf_config = engine.settings.select_configurations(
@@ -190,7 +232,14 @@ def start(engine, process, workflow=None, history=True, get_pipeline=False, **kw
         environment = 'global'
 
     if workflow is None:
-        workflow = workflow_from_pipeline(process, environment=environment)
+        if shards is not None and shards > 1:
+            workflow = workflow_shards_from_pipeline(
+                process, shards, environment=environment)
+            if len(workflow) == 1:
+                workflow = workflow[0]
+        else:
+            workflow = workflow_from_pipeline(process,
+                                              environment=environment)
 
     queue = getattr(resource_config, 'queue', None)
     #if hasattr(engine.study_config.somaworkflow_computing_resources_config,
@@ -202,9 +251,22 @@ def start(engine, process, workflow=None, history=True, get_pipeline=False, **kw
         #if queue is Undefined:
             #queue = None
     workflow_name = process.name
-    wf_id = controller.submit_workflow(workflow=workflow, name=workflow_name,
-                                       queue=queue)
-    swclient.Helper.transfer_input_files(wf_id, controller)
+    if isinstance(workflow, list):
+        # shards: submit all workflows before transfering files, so that
+        # they run concurrently
+        wf_ids = [controller.submit_workflow(
+                      workflow=shard_wf,
+                      name='%s_%d' % (workflow_name, i),
+                      queue=queue)
+                  for i, shard_wf in enumerate(workflow)]
+        for shard_id in wf_ids:
+            swclient.Helper.transfer_input_files(shard_id, controller)
+        wf_id = ShardedExecution(wf_ids)
+        workflow = workflow[0]
+    else:
+        wf_id = controller.submit_workflow(workflow=workflow,
+                                           name=workflow_name, queue=queue)
+        swclient.Helper.transfer_input_files(wf_id, controller)
 
     if get_pipeline:
         return wf_id, workflow.pipeline()
@@ -219,17 +281,26 @@ def wait(engine, execution_id, timeout=-1, pipeline=None):
     '''
     import soma_workflow.client as swclient
     from soma_workflow import constants
+    from capsul.pipeline.pipeline import Pipeline
+    from capsul.pipeline.pipeline_nodes import ProcessNode
+    from capsul.pipeline.process_iteration import ProcessIteration
+    from capsul.pipeline.pipeline_workflow import job_output_params
 
-    swm = engine.study_config.modules['SomaWorkflowConfig']
-    swm.connect_resource(engine.connected_to())
-    controller = swm.get_workflow_controller()
-    wf_id = execution_id
+    controller = _get_controller(engine)
+    wf_ids = _workflow_ids(execution_id)
 
-    controller.wait_workflow(wf_id, timeout=timeout)
-    workflow_status = controller.workflow_status(wf_id)
-    if workflow_status != constants.WORKFLOW_DONE:
-        # not finished
-        return workflow_status
+    if timeout is not None and timeout >= 0:
+        deadline = time.time() + timeout
+    else:
+        deadline = None
+    for wf_id in wf_ids:
+        if deadline is not None:
+            timeout = max(deadline - time.time(), 0)
+        controller.wait_workflow(wf_id, timeout=timeout)
+        workflow_status = controller.workflow_status(wf_id)
+        if workflow_status != constants.WORKFLOW_DONE:
+            # not finished
+            return workflow_status
 
     # get output values
     if pipeline:
@@ -244,56 +315,94 @@ def wait(engine, execution_id, timeout=-1, pipeline=None):
             else:
                 proc_map[id(process)] = process
 
-        eng_wf = controller.workflow(wf_id)
-        for job in eng_wf.jobs:
-            if job.has_outputs:
-                out_params = controller.get_job_output_params(
-                    eng_wf.job_mapping[job].job_id)
-                if out_params:
-                    process = proc_map.get(job.process_hash)
-                    if process is None:
-                        # iteration or non-process job
+        # outputs of iterations split into shards have to be concatenated
+        reduced_outputs = {}
+        for wf_id in wf_ids:
+            eng_wf = controller.workflow(wf_id)
+            for job in eng_wf.jobs:
+                if job.has_outputs:
+                    job_out_params = controller.get_job_output_params(
+                        eng_wf.job_mapping[job].job_id)
+                    if not job_out_params:
                         continue
-                    for param in list(out_params.keys()):
-                        if process.trait(param) is None:
-                            del out_params[param]
-                    try:
-                        process.import_from_dict(out_params)
-                    except Exception as e:
-                        print('error while importing outputs in', process.name)
-                        print('outputs:', out_params)
-                        print(e)
+                    # a batch job runs several processes
+                    for process_hash, out_params \
+                            in job_output_params(job, job_out_params):
+                        process = proc_map.get(process_hash)
+                        if process is None or not out_params:
+                            # iteration or non-process job
+                            continue
+                        for param in list(out_params.keys()):
+                            if process.trait(param) is None:
+                                del out_params[param]
+                        if len(wf_ids) > 1 \
+                                and isinstance(process, ProcessIteration):
+                            outputs = reduced_outputs.setdefault(process, {})
+                            for param, value in six.iteritems(out_params):
+                                if param in process.iterative_parameters:
+                                    outputs.setdefault(param, []).extend(
+                                        value)
+                                else:
+                                    outputs[param] = value
+                            continue
+                        _import_job_outputs(process, out_params)
+        for process, out_params in six.iteritems(reduced_outputs):
+            _import_job_outputs(process, out_params)
 
     # TODO: should we transfer if the WF fails ?
-    swclient.Helper.transfer_output_files(wf_id, controller)
+    for wf_id in wf_ids:
+        swclient.Helper.transfer_output_files(wf_id, controller)
     return status(engine, execution_id)
 
 
+def _import_job_outputs(process, out_params):
+    try:
+        process.import_from_dict(out_params)
+    except Exception as e:
+        print('error while importing outputs in', process.name)
+        print('outputs:', out_params)
+        print(e)
+
+
 def interrupt(engine, execution_id):
     '''
     Try to stop the execution of a process. Does not wait for the process
     to be terminated.
     '''
-    swm = engine.study_config.modules['SomaWorkflowConfig']
-    swm.connect_resource(engine.connected_to())
-    controller = swm.get_workflow_controller()
-    controller.stop_workflow(execution_id)
+    controller = _get_controller(engine)
+    for wf_id in _workflow_ids(execution_id):
+        controller.stop_workflow(wf_id)
 
 
 def status(engine, execution_id):
     '''
     Return a simple value with the status of an execution (queued,
     running, terminated, error, etc.)
+
+    For a :class:`ShardedExecution`, the status of the first unfinished shard
+    is returned, or ``'workflow_failed'`` if any shard has failed.
     '''
     from soma_workflow import constants
 
-    swm = engine.study_config.modules['SomaWorkflowConfig']
-    swm.connect_resource(engine.connected_to())
-    controller = swm.get_workflow_controller()
-    workflow_status = controller.workflow_status(execution_id)
+    controller = _get_controller(engine)
+    statuses = [_workflow_status(controller, wf_id)
+                for wf_id in _workflow_ids(execution_id)]
+    for workflow_status in statuses:
+        if workflow_status not in (constants.WORKFLOW_DONE,
+                                   'workflow_failed'):
+            return workflow_status
+    if 'workflow_failed' in statuses:
+        return 'workflow_failed'
+    return constants.WORKFLOW_DONE
+
+
+def _workflow_status(controller, wf_id):
+    from soma_workflow import constants
+
+    workflow_status = controller.workflow_status(wf_id)
     if workflow_status == constants.WORKFLOW_DONE:
         # finished, but in which state ?
-        elements_status = controller.workflow_elements_status(execution_id)
+        elements_status = controller.workflow_elements_status(wf_id)
         failed_jobs = [element for element in elements_status[0]
                        if element[1] == constants.FAILED
                        or (element[1] == constants.DONE and
@@ -309,11 +418,13 @@ def status(engine, execution_id):
 def detailed_information(engine, execution_id):
     '''
     Return complete (and possibly big) information about a process
-    execution.
+    execution. For a :class:`ShardedExecution`, a list with the information
+    of each shard is returned.
     '''
-    swm = engine.study_config.modules['SomaWorkflowConfig']
-    swm.connect_resource(engine.connected_to())
-    controller = swm.get_workflow_controller()
+    controller = _get_controller(engine)
+    if isinstance(execution_id, ShardedExecution):
+        return [controller.workflow_elements_status(wf_id)
+                for wf_id in execution_id.workflow_ids]
     elements_status = controller.workflow_elements_status(execution_id)
 
     return elements_status
@@ -342,10 +453,9 @@ def dispose(engine, execution_id, conditional=False):
                 if status != constants.WORKFLOW_DONE:
                     keep = True
     if not keep:
-        swm = engine.study_config.modules['SomaWorkflowConfig']
-        swm.connect_resource(engine.connected_to())
-        controller = swm.get_workflow_controller()
-        controller.delete_workflow(execution_id)
+        controller = _get_controller(engine)
+        for wf_id in _workflow_ids(execution_id):
+            controller.delete_workflow(wf_id)
         # TODO: update engine DB
 
 
@@ -374,9 +484,14 @@ def raise_for_status(engine, status, execution_id=None):
     from soma_workflow import constants
 
     if status != constants.WORKFLOW_DONE:
-        swm = engine.study_config.modules['SomaWorkflowConfig']
-        swm.connect_resource(engine.connected_to())
-        controller = swm.get_workflow_controller()
+        controller = _get_controller(engine)
+        if isinstance(execution_id, ShardedExecution):
+            # report the first failed shard
+            for wf_id in execution_id.workflow_ids:
+                if _workflow_status(controller, wf_id) \
+                        != constants.WORKFLOW_DONE:
+                    execution_id = wf_id
+                    break
         raise WorkflowExecutionError(
             controller, execution_id, status,
             engine.study_config.somaworkflow_keep_failed_workflows)
@@ -38,8 +38,11 @@ Settings cannot be used directly to configure the execution of a software. It is
 # doc on modules activation / use ?
 #
 
+import copy
 import importlib
+import json
 from uuid import uuid4
+import six
 import sys
 
 
@@ -73,13 +76,20 @@ class Settings:
         '''
         self.populse_db = populse_db
         self.module_notifiers = {}
+        # callable loading modules, given a list of names (or None for all
+        # modules), before they are used. Set by CapsulEngine, which
+        # registers modules lazily.
+        self.module_loader = None
+        self._snapshot = None
 
     def __enter__(self):
         '''
         Starts a session to read or write settings
         '''
         dbs = self.populse_db.__enter__()
-        return SettingsSession(dbs, module_notifiers=self.module_notifiers)
+        return SettingsSession(dbs, module_notifiers=self.module_notifiers,
+                               on_change=self.clear_snapshot,
+                               module_loader=self.module_loader)
 
     def __exit__(self, *args):
         self.populse_db.__exit__(*args)
@@ -98,6 +108,16 @@ class Settings:
             module_name = 'capsul.engine.module.' + module_name
         return module_name
     
+    def _load_modules(self, modules=None):
+        '''
+        Make sure the given modules (all if None) are loaded, using
+        :attr:`module_loader`. Returns True if a module has been loaded
+        (and thus settings may have changed).
+        '''
+        if self.module_loader is None:
+            return False
+        return bool(self.module_loader(modules))
+
     def select_configurations(self, environment, uses=None,
                               check_invalid_mods=False):
         '''
@@ -129,55 +149,66 @@ class Settings:
             config = ce.select_configurations('my_environment',
                                               uses={'spm': 'version > 8'})
         '''
+        if not isinstance(environment, str):
+            # environment is only used as a string in queries
+            environment = str(environment)
+        self._load_modules(None if uses is None else list(uses))
+        key = (environment,
+               None if uses is None else tuple(sorted(uses.items())),
+               bool(check_invalid_mods))
+        try:
+            hash(key)
+        except TypeError:
+            # unhashable queries: don't reuse selections
+            key = None
+        snapshot = self._get_snapshot()
+        configurations = snapshot['selections'].get(key)
+        if configurations is not None:
+            return copy.deepcopy(configurations)
+
         configurations = {}
-        with self as settings:
-            if uses is None:
-                uses = {}
-                for collection in (i.collection_name 
-                                   for i in 
-                                   settings._dbs.get_collections()):
-                    if collection.startswith(Settings.collection_prefix):
-                        module_name = \
-                            collection[len(Settings.collection_prefix):]
-                        uses[module_name] = 'ALL'
-            uses_stack = list(uses.items())
-            while uses_stack:
-                module, query = uses_stack.pop(-1)
-                # append environment to config_id if it is given in the filter
-                if 'config_id=="' in query:
-                    i = query.index('config_id=="')
-                    i = query.index('"', i+12)
-                    query = '%s-%s%s' % (query[:i], environment, query[i:])
-
-                module = self.module_name(module)
-                if module in configurations:
-                    continue
-                configurations.setdefault('capsul_engine', 
-                                          {}).setdefault('uses', 
-                                                         {})[module] = query
-                selected_config = None
-                query_env = environment
-                full_query = '%s == "%s" AND (%s)' % (
-                    Settings.environment_field, environment, (
-                        'ALL' if query == 'any' else query))
-                collection = '%s%s' % (Settings.collection_prefix, module)
-                if settings._dbs.get_collection(collection):
-                    docs = list(settings._dbs.filter_documents(collection, 
-                                                               full_query))
+        if uses is None:
+            # sorted, so that the selection does not depend on the modules
+            # loading order
+            uses = dict((module_name, 'ALL')
+                        for module_name in sorted(snapshot['documents']))
+        uses_stack = list(uses.items())
+        while uses_stack:
+            module, query = uses_stack.pop(-1)
+            # append environment to config_id if it is given in the filter
+            if 'config_id=="' in query:
+                i = query.index('config_id=="')
+                i = query.index('"', i+12)
+                query = '%s-%s%s' % (query[:i], environment, query[i:])
+
+            module = self.module_name(module)
+            if module in configurations:
+                continue
+            if self._load_modules([module]):
+                # a dependency module was not loaded yet
+                snapshot = self._get_snapshot()
+            configurations.setdefault('capsul_engine',
+                                      {}).setdefault('uses',
+                                                     {})[module] = query
+            selected_config = None
+            query_env = environment
+            docs = self._select_documents(snapshot, module, environment,
+                                          query, check_invalid_mods)
+
+            if len(docs) == 1:
+                selected_config = docs[0]
+            elif len(docs) > 1:
+                if query == 'any':
+                    selected_config = docs[0]
                 else:
-                    docs = []
-
-                if check_invalid_mods:
-                    # filter out invalid configs
-                    doc_t = docs
-                    docs = []
-                    for doc in doc_t:
-                        mod = sys.modules[module]
-                        invalid = []
-                        if hasattr(mod, 'check_notably_invalid_config'):
-                            invalid = mod.check_notably_invalid_config(doc)
-                        if len(invalid) == 0:
-                            docs.append(doc)
+                    raise EnvironmentError('Cannot create configurations '
+                        'for environment "%s" because settings returned '
+                        '%d instances for module %s' % (environment,
+                                                        len(docs), module))
+            else:
+                query_env = Settings.global_environment
+                docs = self._select_documents(snapshot, module, query_env,
+                                              query, check_invalid_mods)
 
                 if len(docs) == 1:
                     selected_config = docs[0]
@@ -185,74 +216,126 @@ class Settings:
                     if query == 'any':
                         selected_config = docs[0]
                     else:
-                        raise EnvironmentError('Cannot create configurations '
-                            'for environment "%s" because settings returned '
-                            '%d instances for module %s' % (environment, 
-                                                            len(docs), module))
-                else:
-                    full_query = '%s == "%s" AND (%s)' % (Settings.environment_field,
-                                                          Settings.global_environment,
-                                                          ('ALL' if query == 'any' 
-                                                           else query))
-                    query_env = Settings.global_environment
-                    if settings._dbs.get_collection(collection):
-                        docs = list(settings._dbs.filter_documents(collection, 
-                                                                   full_query))
-                    else:
-                        docs = []
-
-                    if check_invalid_mods:
-                        # filter out invalid configs
-                        doc_t = docs
-                        docs = []
-                        for doc in doc_t:
-                            mod = sys.modules[module]
-                            invalid = []
-                            if hasattr(mod, 'check_notably_invalid_config'):
-                                invalid = mod.check_notably_invalid_config(doc)
-                            if len(invalid) == 0:
-                                docs.append(doc)
-
-                    if len(docs) == 1:
-                        selected_config = docs[0]
-                    elif len(docs) > 1:
-                        if query == 'any':
-                            selected_config = docs[0]
-                        else:
-                            raise EnvironmentError('Cannot create '
-                                'configurations for environment "%s" because '
-                                'global settings returned %d instances for '
-                                'module %s' % (query_env, len(docs), module))
-                if selected_config:
-                    # Remove values that are None
-                    items = getattr(selected_config, '_items', None)
-                    if items is None:
-                        # older populse_db 1.x
-                        items = selected_config.items
-                    selected_config = dict(items())
-                    if 'config_id' in selected_config:
-                        selected_config['config_id'] \
-                            = selected_config['config_id'][
-                                :-len(query_env)-1]
-                    for k, v in list(items()):
-                        if v is None:
-                            del selected_config[k]
-                    configurations[module] = selected_config
-                    python_module = importlib.import_module(module)
-                    config_dependencies = getattr(python_module, 
-                                                  'config_dependencies', 
-                                                  None)
-                    if config_dependencies:
-                        d = config_dependencies(selected_config)
-                        if d:
-                            uses_stack.extend(
-                                [(Settings.module_name(k), v)
-                                 for k, v in d.items()])
-
+                        raise EnvironmentError('Cannot create '
+                            'configurations for environment "%s" because '
+                            'global settings returned %d instances for '
+                            'module %s' % (query_env, len(docs), module))
+            if selected_config:
+                # Remove values that are None
+                items = getattr(selected_config, '_items', None)
+                if items is None:
+                    # older populse_db 1.x
+                    items = selected_config.items
+                selected_config = dict(items())
+                if 'config_id' in selected_config:
+                    selected_config['config_id'] \
+                        = selected_config['config_id'][
+                            :-len(query_env)-1]
+                for k, v in list(items()):
+                    if v is None:
+                        del selected_config[k]
+                configurations[module] = selected_config
+                python_module = importlib.import_module(module)
+                config_dependencies = getattr(python_module,
+                                              'config_dependencies',
+                                              None)
+                if config_dependencies:
+                    d = config_dependencies(selected_config)
+                    if d:
+                        uses_stack.extend(
+                            [(Settings.module_name(k), v)
+                             for k, v in d.items()])
+
+        if key is not None:
+            snapshot['selections'][key] = copy.deepcopy(configurations)
         return configurations
 
+    def _get_snapshot(self):
+        '''
+        Get the in-memory snapshot of settings, reading all configuration
+        documents from the database if it is not built yet.
+
+        The snapshot is a dict with the following items:
+
+        documents:
+            {module: {environment: [documents]}}
+        queries:
+            {(module, environment, query): [documents]}: results of
+            populse_db queries already performed
+        selections:
+            results of :meth:`select_configurations`
+
+        It is discarded (see :meth:`clear_snapshot`) when settings are
+        modified through a :class:`SettingsSession`.
+        '''
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = {'documents': {}, 'queries': {}, 'selections': {}}
+            with self as session:
+                for collection in (i.collection_name
+                                   for i in session._dbs.get_collections()):
+                    if not collection.startswith(Settings.collection_prefix):
+                        continue
+                    module_name = collection[len(Settings.collection_prefix):]
+                    env_docs = {}
+                    for doc in session._dbs.get_documents(collection):
+                        env_docs.setdefault(
+                            getattr(doc, Settings.environment_field),
+                            []).append(doc)
+                    snapshot['documents'][module_name] = env_docs
+            self._snapshot = snapshot
+        return snapshot
+
+    def clear_snapshot(self, name=None, value=None):
+        '''
+        Discard the in-memory snapshot of settings used by
+        :meth:`select_configurations`. It is called whenever settings are
+        modified, and has the signature of a module notifier.
+        '''
+        self._snapshot = None
+
+    def _select_documents(self, snapshot, module, environment, query,
+                          check_invalid_mods=False):
+        '''
+        Get configuration documents for a module in an environment, matching
+        a populse_db query, from the snapshot. Queries other than "ALL" or
+        "any" are run on the database the first time.
+        '''
+        if query in ('ALL', 'any'):
+            docs = snapshot['documents'].get(module, {}).get(environment, [])
+        else:
+            key = (module, environment, query)
+            try:
+                docs = snapshot['queries'].get(key)
+            except TypeError:
+                # unhashable query: don't keep its result
+                key = None
+                docs = None
+            if docs is None:
+                full_query = '%s == "%s" AND (%s)' % (
+                    Settings.environment_field, environment, query)
+                collection = '%s%s' % (Settings.collection_prefix, module)
+                docs = []
+                if module in snapshot['documents']:
+                    with self as settings:
+                        docs = list(settings._dbs.filter_documents(
+                            collection, full_query))
+                if key is not None:
+                    snapshot['queries'][key] = docs
+
+        if check_invalid_mods and docs:
+            # filter out invalid configs (the module may not be loaded if no
+            # config is selected)
+            mod = sys.modules.get(module)
+            if mod is not None \
+                    and hasattr(mod, 'check_notably_invalid_config'):
+                docs = [doc for doc in docs
+                        if len(mod.check_notably_invalid_config(doc)) == 0]
+        return list(docs)
+
     def export_config_dict(self, environment=None):
         conf = {}
+        self._load_modules()
         if environment is None:
             environment = self.get_all_environments()
         elif isinstance(environment, str):
@@ -333,25 +416,208 @@ class Settings:
         '''
         Get all environment values in the database
         '''
+        self._load_modules()
         with self as session:
             return session.get_all_environments()
-    
+
+    def save_snapshot(self, filename, environment=None):
+        '''
+        Write a read-only snapshot of settings in a compact JSON file, which
+        can be loaded without a database using :meth:`FrozenSettings.load`
+        (typically in jobs workers).
+
+        Parameters
+        ----------
+        filename: str
+            output JSON file
+        environment: str or list (optional)
+            environments to include. Default: all.
+        '''
+        snapshot = {'capsul_settings_snapshot': FrozenSettings.format_version,
+                    'settings': self.export_config_dict(environment)}
+        with open(filename, 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+
+
+class FrozenSettings(Settings):
+    '''
+    Read-only settings which do not use a populse_db database: values are
+    given as a dictionary, in the shape returned by
+    :meth:`Settings.export_config_dict`::
+
+        {environment: {module: {config_id: config_values}}}
+
+    They are typically used in jobs workers, which only need to read the
+    configuration they have been given, and thus avoid creating a database::
+
+        settings = FrozenSettings.load('/tmp/settings_snapshot.json')
+        ce = capsul_engine(settings_snapshot=settings)
+
+    :meth:`select_configurations` works as for :class:`Settings`. Queries
+    other than ``"ALL"`` or ``"any"`` need a database however: an in-memory
+    one is created, the first time it is needed, from the snapshot values.
+    Modifications in sessions raise a :class:`PermissionError`, except for
+    the creation of default configurations for modules which have none,
+    which are kept in memory.
+    '''
+
+    format_version = 1
+
+    def __init__(self, config_dict):
+        super(FrozenSettings, self).__init__(None)
+        self._config_dict = config_dict
+        self._database_settings = None
+
+    @staticmethod
+    def load(filename):
+        '''
+        Load a snapshot file written by :meth:`Settings.save_snapshot`
+        '''
+        with open(filename) as f:
+            snapshot = json.load(f)
+        version = snapshot.get('capsul_settings_snapshot')
+        if version != FrozenSettings.format_version:
+            raise ValueError('%s is not a capsul settings snapshot file (or '
+                             'has an unsupported version)' % filename)
+        return FrozenSettings(snapshot['settings'])
+
+    @staticmethod
+    def from_configuration(configuration, environment=None):
+        '''
+        Build frozen settings from a configuration dictionary as returned by
+        :meth:`Settings.select_configurations`.
+        '''
+        if environment is None:
+            environment = Settings.global_environment
+        env_conf = {'capsul_engine': configuration.get('capsul_engine', {})}
+        for module, config in six.iteritems(configuration):
+            if module == 'capsul_engine':
+                continue
+            config = dict(config)
+            config_id = config.get(Settings.config_id_field)
+            if config_id is None:
+                config_id = module
+                config[Settings.config_id_field] = config_id
+            config[Settings.environment_field] = environment
+            env_conf[module] = {config_id: config}
+        return FrozenSettings({environment: env_conf})
+
+    def __enter__(self):
+        return FrozenSettingsSession(self)
+
+    def __exit__(self, *args):
+        pass
+
+    def modules(self):
+        '''
+        Names of the modules having configurations in the settings
+        '''
+        modules = set()
+        for env_conf in self._config_dict.values():
+            modules.update([Settings.module_name(m) for m in env_conf
+                            if m != 'capsul_engine'])
+        return sorted(modules)
+
+    def _get_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = {'documents': {}, 'queries': {}, 'selections': {}}
+            for environment, env_conf in six.iteritems(self._config_dict):
+                for module, configs in six.iteritems(env_conf):
+                    if module == 'capsul_engine':
+                        continue
+                    module = Settings.module_name(module)
+                    docs = snapshot['documents'].setdefault(
+                        module, {}).setdefault(environment, [])
+                    for config_id, values in six.iteritems(configs):
+                        docs.append(_FrozenDocument(
+                            values, environment, config_id))
+            self._snapshot = snapshot
+        return snapshot
+
+    def _select_documents(self, snapshot, module, environment, query,
+                          check_invalid_mods=False):
+        if query in ('ALL', 'any'):
+            return super(FrozenSettings, self)._select_documents(
+                snapshot, module, environment, query, check_invalid_mods)
+        # general query: use an in-memory database
+        if self._database_settings is None:
+            from capsul.engine.database_populse import PopulseDBEngine
+
+            database = PopulseDBEngine('sqlite:///:memory:')
+            settings = Settings(database.db)
+            settings._database = database  # keep it alive
+            for env, env_conf in six.iteritems(self._config_dict):
+                config = dict(env_conf)
+                config['capsul_engine'] = {
+                    'uses': dict([(m, 'ALL') for m in env_conf
+                                  if m != 'capsul_engine'])}
+                with settings as session:
+                    for mod in config['capsul_engine']['uses']:
+                        fields = {}
+                        for values in env_conf[mod].values():
+                            for name, value in six.iteritems(values):
+                                if value is not None:
+                                    fields[name] = _field_type(value)
+                        fields.pop(Settings.config_id_field, None)
+                        fields.pop(Settings.environment_field, None)
+                        session.ensure_module_fields(
+                            mod,
+                            [dict(name=f, type=t, description='')
+                             for f, t in sorted(fields.items())])
+                settings.import_configs(env, config)
+            self._database_settings = settings
+        return self._database_settings._select_documents(
+            self._database_settings._get_snapshot(), module, environment,
+            query, check_invalid_mods)
+
+    def export_config_dict(self, environment=None):
+        if environment is None:
+            environment = list(self._config_dict.keys())
+        elif isinstance(environment, str):
+            environment = [environment]
+        return copy.deepcopy(dict([(env, self._config_dict[env])
+                                   for env in environment
+                                   if env in self._config_dict]))
+
+    def import_configs(self, environment, config_dict, cont_on_error=False):
+        raise PermissionError('FrozenSettings are read-only')
+
+    def get_all_environments(self):
+        return set(self._config_dict.keys())
+
     
 class SettingsSession:
     '''
     Settings use/modifiction session, returned by "with settings as session:"
     '''
 
-    def __init__(self, populse_session, module_notifiers=None):
+    def __init__(self, populse_session, module_notifiers=None,
+                 on_change=None, module_loader=None):
         '''
         SettingsSession are created with Settings.__enter__ using a `with`
         statement.
+
+        `on_change`, if given, is called whenever settings are modified in
+        the session. `module_loader`, if given, is called with a list of
+        module names before their configurations are used (see
+        :attr:`Settings.module_loader`).
         '''
         self._dbs = populse_session
         if module_notifiers is None:
             self.module_notifiers = {}
         else:
             self.module_notifiers = module_notifiers
+        self._on_change = on_change
+        self._module_loader = module_loader
+
+    def _changed(self):
+        if self._on_change is not None:
+            self._on_change()
+
+    def _load_module(self, module):
+        if self._module_loader is not None:
+            self._module_loader([Settings.module_name(module)])
 
     @staticmethod
     def collection_name(module):
@@ -372,17 +638,22 @@ class SettingsSession:
         - description: the documentation of the field
         '''
         collection = self.collection_name(module)
+        changed = False
         if self._dbs.get_collection(collection) is None:
             self._dbs.add_collection(collection, Settings.config_id_field)
             self._dbs.add_field(collection, 
                                 Settings.environment_field, 
                                 'string', index=True)
+            changed = True
         for field in fields:
             name = field['name']
             if self._dbs.get_field(collection, name) is None:
                 self._dbs.add_field(collection, name=name,
                                     field_type=field['type'],
                                     description=field['description'])
+                changed = True
+        if changed:
+            self._changed()
         return collection
     
     def new_config(self, module, environment, values):
@@ -394,6 +665,7 @@ class SettingsSession:
         given in `values` a unique random value is created (with 
         `uuid.uuid4()`).
         '''
+        self._load_module(module)
         document = {
             Settings.environment_field: environment}
         document.update(values)
@@ -406,7 +678,8 @@ class SettingsSession:
         config = SettingsConfig(
             self._dbs, collection, id, environment,
             notifiers=self.module_notifiers.get(Settings.module_name(module),
-                                                []))
+                                                []),
+            on_change=self._on_change)
         config.notify()
         return config
 
@@ -415,15 +688,18 @@ class SettingsSession:
         Removes a configuration (document in the database) for a given module /
         environment, identified by its `Settings.config_id_field` value.
         '''
+        self._load_module(module)
         collection = self.collection_name(module)
         id = '%s-%s' % (config_id, environment)
         self._dbs.remove_document(collection, id)
+        self._changed()
 
     def configs(self, module, environment, selection=None):
         '''
         Returns a generator that iterates over all configuration
         documents created for the given module and environment.
         '''
+        self._load_module(module)
         collection = self.collection_name(module)
         if self._dbs.get_collection(collection) is not None:
             if selection:
@@ -446,7 +722,8 @@ class SettingsSession:
                 yield SettingsConfig(
                     self._dbs, collection, id, environment,
                     notifiers=self.module_notifiers.get(Settings.module_name(
-                        module), []))
+                        module), []),
+                    on_change=self._on_change)
 
     def config(self, module, environment, selection=None, any=True):
         '''
@@ -506,8 +783,9 @@ class SettingsSession:
 
 class SettingsConfig:
     def __init__(self, populse_session, collection, id, environment,
-                 notifiers=[]):
+                 notifiers=[], on_change=None):
         super(SettingsConfig, self).__setattr__('_dbs', populse_session)
+        super(SettingsConfig, self).__setattr__('_on_change', on_change)
         super(SettingsConfig, self).__setattr__('_collection', collection)
         super(SettingsConfig, self).__setattr__('_environment', environment)
         super(SettingsConfig, self).__setattr__('_id', id)
@@ -543,6 +821,138 @@ class SettingsConfig:
                 self.notify(name, value)
 
     def notify(self, name=None, value=None):
+        if self._on_change is not None:
+            self._on_change()
         for notifier in self._notifiers:
             notifier(name, value)
     
+
+
+class FrozenSettingsSession(SettingsSession):
+    '''
+    Read-only session on :class:`FrozenSettings`
+    '''
+
+    def __init__(self, settings):
+        super(FrozenSettingsSession, self).__init__(
+            None, module_notifiers=settings.module_notifiers)
+        self._settings = settings
+
+    def ensure_module_fields(self, module, fields):
+        return self.collection_name(module)
+
+    def new_config(self, module, environment, values):
+        '''
+        Only default configurations may be created, when the module has no
+        configuration in the given environment (modules initialization
+        does this). They are only kept in memory.
+        '''
+        module = Settings.module_name(module)
+        env_conf = self._settings._config_dict.setdefault(environment, {})
+        if env_conf.get(module):
+            raise PermissionError('FrozenSettings are read-only')
+        values = dict(values)
+        id = values.get(Settings.config_id_field)
+        if id is None:
+            id = str(uuid4())
+            values[Settings.config_id_field] = id
+        values[Settings.environment_field] = environment
+        env_conf[module] = {id: values}
+        self._settings.clear_snapshot()
+        self._settings._database_settings = None
+        return FrozenSettingsConfig(
+            _FrozenDocument(values, environment, id)._values,
+            self.collection_name(module), id, environment)
+
+    def remove_config(self, module, environment, config_id):
+        raise PermissionError('FrozenSettings are read-only')
+
+    def configs(self, module, environment, selection=None):
+        module = Settings.module_name(module)
+        settings = self._settings
+        if selection:
+            if 'config_id' in selection:
+                x = selection.find('config_id')
+                x = selection.find('"', x + 9)
+                x = selection.find('"', x + 1)
+                selection = '%s-%s%s'% (selection[:x], environment,
+                                        selection[x:])
+        else:
+            selection = 'ALL'
+        docs = settings._select_documents(settings._get_snapshot(), module,
+                                          environment, selection)
+        for doc in docs:
+            id = doc[Settings.config_id_field][:-len(environment)-1]
+            yield FrozenSettingsConfig(
+                dict(doc._items()), self.collection_name(module), id,
+                environment)
+
+    def get_all_environments(self):
+        return self._settings.get_all_environments()
+
+
+class FrozenSettingsConfig(SettingsConfig):
+    '''
+    Read-only configuration of :class:`FrozenSettings`
+    '''
+
+    def __init__(self, values, collection, id, environment):
+        super(FrozenSettingsConfig, self).__init__(None, collection, id,
+                                                   environment)
+        super(SettingsConfig, self).__setattr__('_values', values)
+
+    def __setattr__(self, name, value):
+        raise PermissionError('FrozenSettings are read-only')
+
+    def __getattr__(self, name):
+        if name in ('_id', '_environment', '_values'):
+            return super(SettingsConfig, self).__getattribute__(name)
+        value = self._values.get(name)
+        if name == 'config_id' and value is not None:
+            return value[:-len(self._environment)-1]
+        return value
+
+    def set_values(self, values):
+        raise PermissionError('FrozenSettings are read-only')
+
+
+def _field_type(value):
+    '''
+    populse_db field type for a value
+    '''
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, six.integer_types):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, six.string_types):
+        return 'string'
+    return 'json'
+
+
+class _FrozenDocument(object):
+    '''
+    Configuration values of :class:`FrozenSettings`, with the same API as
+    populse_db documents
+    '''
+
+    def __init__(self, values, environment, config_id):
+        values = dict(values)
+        values[Settings.environment_field] = environment
+        values[Settings.config_id_field] = '%s-%s' % (
+            values.get(Settings.config_id_field, config_id), environment)
+        self.__dict__['_values'] = values
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, name):
+        return self._values[name]
+
+    def _items(self):
+        return ((k, v) for k, v in six.iteritems(self._values)
+                if v is not None)
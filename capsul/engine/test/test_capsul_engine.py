@@ -301,6 +301,121 @@ class TestCapsulEngine(unittest.TestCase):
                     {'capsul.engine.module.spm': 'version=="12"',
                      'capsul.engine.module.matlab': 'any'}}})
 
+    def test_settings_snapshot(self):
+        cif = self.ce.settings.config_id_field
+        with self.ce.settings as settings:
+            config = settings.config('fsl', 'global')
+            if config:
+                settings.remove_config('fsl', 'global',
+                                       getattr(config, cif))
+            fsl = settings.new_config('fsl', 'global', {cif: '5'})
+            fsl.directory = '/there'
+        conf = self.ce.settings.select_configurations('global',
+                                                      uses={'fsl': 'any'})
+        self.assertEqual(conf['capsul.engine.module.fsl']['directory'],
+                         '/there')
+        self.assertTrue(self.ce.settings._snapshot is not None)
+        # modifying the returned dict does not alter the snapshot
+        conf['capsul.engine.module.fsl']['directory'] = '/elsewhere'
+        self.assertEqual(
+            self.ce.settings.select_configurations(
+                'global', uses={'fsl': 'any'})[
+                    'capsul.engine.module.fsl']['directory'],
+            '/there')
+        # settings modifications invalidate the snapshot
+        with self.ce.settings as settings:
+            settings.config('fsl', 'global').directory = '/here'
+        self.assertEqual(
+            self.ce.settings.select_configurations(
+                'global', uses={'fsl': 'any'})[
+                    'capsul.engine.module.fsl']['directory'],
+            '/here')
+        with self.ce.settings as settings:
+            settings.remove_config('fsl', 'global', '5')
+        self.assertTrue(
+            'capsul.engine.module.fsl' not in
+                self.ce.settings.select_configurations(
+                    'global', uses={'fsl': 'any'}))
+
+    def test_select_unknown_module(self):
+        # an unknown module gives an unmet selection, also when invalid
+        # configs are filtered out as in Process.check_requirements()
+        uses = {'capsul.engine.module.nonexistent_mod': 'ALL'}
+        for check_invalid_mods in (False, True):
+            self.assertEqual(
+                self.ce.settings.select_configurations(
+                    'global', uses=uses,
+                    check_invalid_mods=check_invalid_mods),
+                {'capsul_engine': {'uses': uses}})
+
+    def test_lazy_modules(self):
+        ce = capsul_engine()
+        self.assertEqual(ce._loaded_modules, set())
+        self.assertTrue('capsul.engine.module.fsl' in ce._registered_modules)
+        conf = ce.settings.select_configurations('global',
+                                                 uses={'fsl': 'any'})
+        self.assertTrue('capsul.engine.module.fsl' in conf)
+        self.assertEqual(ce._loaded_modules, set(['capsul.engine.module.fsl']))
+        with ce.settings as session:
+            self.assertTrue(session.config('afni', 'global') is not None)
+        self.assertTrue('capsul.engine.module.afni' in ce._loaded_modules)
+        # dependencies of selected configurations are loaded too
+        with ce.settings as session:
+            session.new_config('spm', 'global', {'version': '12'})
+        self.assertTrue('capsul.engine.module.matlab'
+                        not in ce._loaded_modules)
+        ce.settings.select_configurations('global', uses={'spm': 'any'})
+        self.assertTrue('capsul.engine.module.matlab' in ce._loaded_modules)
+        ce.settings.select_configurations('global')
+        self.assertEqual(ce._registered_modules, set())
+
+    def test_frozen_settings(self):
+        from capsul.engine.settings import FrozenSettings
+
+        cif = self.ce.settings.config_id_field
+        with self.ce.settings as settings:
+            config = settings.config('fsl', 'global')
+            if config:
+                settings.remove_config('fsl', 'global',
+                                       getattr(config, cif))
+            settings.new_config('fsl', 'global',
+                                {cif: '5', 'directory': '/there'})
+            settings.new_config('spm', 'global',
+                                {cif: '12', 'version': '12',
+                                 'standalone': True})
+        tmp = tempfile.mkstemp(prefix='capsul_settings', suffix='.json')
+        os.close(tmp[0])
+        try:
+            self.ce.settings.save_snapshot(tmp[1])
+            ce = capsul_engine(settings_snapshot=tmp[1])
+        finally:
+            os.unlink(tmp[1])
+        self.assertTrue(isinstance(ce.settings, FrozenSettings))
+        self.assertTrue(ce.database_location is None)
+        self.assertEqual(set(ce._loaded_modules),
+                         set(ce.settings.modules()))
+        for uses in ({'fsl': 'any'}, {'spm': 'version=="12"'}):
+            self.assertEqual(
+                ce.settings.select_configurations('global', uses=uses),
+                self.ce.settings.select_configurations('global',
+                                                       uses=uses))
+        with ce.settings as settings:
+            config = settings.config('fsl', 'global')
+            self.assertEqual(config.directory, '/there')
+            self.assertRaises(PermissionError, setattr, config,
+                              'directory', '/here')
+            self.assertRaises(PermissionError, settings.new_config, 'fsl',
+                              'global', {cif: '6'})
+            self.assertRaises(PermissionError, settings.remove_config,
+                              'fsl', 'global', '5')
+        # from a jobs configuration dict
+        conf = self.ce.settings.select_configurations('global',
+                                                      uses={'fsl': 'any'})
+        ce = capsul_engine(
+            settings_snapshot=FrozenSettings.from_configuration(conf))
+        self.assertEqual(ce.settings.select_configurations(
+            'global', uses={'fsl': 'any'}), conf)
+
     def test_fsl_config(self):
         # fake the FSL "bet" command to have test working without FSL installed
         path = os.environ.get('PATH')
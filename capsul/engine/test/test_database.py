@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function
+from __future__ import absolute_import
+
+import unittest
+import tempfile
+import os
+import os.path as osp
+import shutil
+import threading
+
+from capsul.engine.database_json import JSONDBEngine
+from capsul.engine.database_populse import PopulseDBEngine
+
+
+class DatabaseTest(object):
+    '''
+    Path metadata tests, run on each database engine
+    '''
+
+    def create_database(self):
+        raise NotImplementedError()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='capsul_db')
+        self.db = self.create_database()
+        self.db.set_named_directory('study', '/data/study')
+        self.db.set_named_directory('study2', '/data/study2')
+
+    def tearDown(self):
+        self.db = None
+        shutil.rmtree(self.tmp_dir)
+
+    def test_named_directories(self):
+        self.assertEqual(self.db.check_path('/data/study/sub01/t1.nii'),
+                         ('study', 'sub01/t1.nii'))
+        # study2 is not a sub-directory of study
+        self.assertEqual(self.db.check_path('/data/study2/t1.nii'),
+                         ('study2', 't1.nii'))
+        self.assertEqual(self.db.check_path('/data/study3/t1.nii'),
+                         ('absolute', '/data/study3/t1.nii'))
+        self.db.set_named_directory('sub01', '/data/study/sub01')
+        self.assertEqual(self.db.check_path('/data/study/sub01/t1.nii'),
+                         ('sub01', 't1.nii'))
+
+    def test_path_metadata(self):
+        self.db.set_path_metadata('/data/study/sub01/t1.nii',
+                                  {'subject': 'sub01', 'modality': 'T1'})
+        self.assertEqual(
+            self.db.path_metadata('/data/study/sub01/t1.nii'),
+            {'subject': 'sub01', 'modality': 'T1',
+             'named_directory': 'study', 'path': 'sub01/t1.nii'})
+        self.assertEqual(
+            self.db.path_metadata('sub01/t1.nii', 'study')['subject'],
+            'sub01')
+        self.db.set_path_metadata('sub01/t1.nii', {'subject': 'sub02'},
+                                  named_directory='study')
+        self.assertEqual(
+            self.db.path_metadata('/data/study/sub01/t1.nii'),
+            {'subject': 'sub02', 'named_directory': 'study',
+             'path': 'sub01/t1.nii'})
+        self.assertTrue(self.db.path_metadata('/data/study/none.nii')
+                        is None)
+
+    def test_paths_metadata_queries(self):
+        self.db.set_paths_metadata(
+            [('/data/study/sub%02d/%s.nii' % (i, modality),
+              {'subject': 'sub%02d' % i, 'modality': modality})
+             for i in range(10) for modality in ('T1', 'T2', 'dwi')])
+        self.db.set_path_metadata('/data/study2/sub01/T1.nii',
+                                  {'subject': 'sub01', 'modality': 'T1'})
+        self.db.set_path_metadata('/data/sub01/T1.nii',
+                                  {'subject': 'sub01', 'modality': 'T1'})
+
+        def paths(metadata):
+            return sorted((m['named_directory'], m['path'])
+                          for m in metadata)
+
+        self.assertEqual(len(self.db.paths_metadata()), 32)
+        self.assertEqual(
+            paths(self.db.paths_metadata(
+                filters={'subject': 'sub01', 'modality': 'T1'})),
+            [('absolute', '/data/sub01/T1.nii'),
+             ('study', 'sub01/T1.nii'),
+             ('study2', 'sub01/T1.nii')])
+        self.assertEqual(
+            paths(self.db.paths_metadata(
+                'study', filters={'subject': 'sub01', 'modality': 'T1'})),
+            [('study', 'sub01/T1.nii')])
+        self.assertEqual(
+            paths(self.db.paths_metadata(prefix='/data/study/sub02/')),
+            [('study', 'sub02/T1.nii'), ('study', 'sub02/T2.nii'),
+             ('study', 'sub02/dwi.nii')])
+        self.assertEqual(
+            paths(self.db.paths_metadata('study', prefix='sub03/T',
+                                         filters={'modality': 'T2'})),
+            [('study', 'sub03/T2.nii')])
+        self.assertEqual(
+            len(self.db.paths_metadata(
+                filters={'modality': ['T1', 'T2']})), 22)
+        self.assertEqual(self.db.paths_metadata(filters={'session': '1'}),
+                         [])
+        # replaced metadata are not found any longer by former values
+        self.db.set_path_metadata('/data/study/sub04/T1.nii',
+                                  {'subject': 'sub04', 'modality': 'T1w'})
+        self.assertEqual(
+            paths(self.db.paths_metadata(filters={'subject': 'sub04',
+                                                  'modality': 'T1'})),
+            [])
+        self.assertEqual(
+            paths(self.db.paths_metadata(filters={'modality': 'T1w'})),
+            [('study', 'sub04/T1.nii')])
+
+
+class TransactionTest(object):
+    '''
+    Transaction tests. reopen() opens persistent databases again, and does
+    nothing for in-memory ones.
+    '''
+
+    def reopen(self):
+        raise NotImplementedError()
+
+    def test_transaction(self):
+        self.db.commit()
+        with self.db.transaction():
+            self.db.set_json_value('a', 1)
+            with self.db.transaction():
+                self.db.set_json_value('b', 2)
+            self.db.set_path_metadata('/data/study/sub01/t1.nii',
+                                      {'subject': 'sub01'})
+        try:
+            with self.db.transaction():
+                self.db.set_json_value('a', 3)
+                self.db.set_named_directory('study2', None)
+                raise RuntimeError('abort')
+        except RuntimeError:
+            pass
+        self.assertEqual(self.db.json_value('a'), 1)
+        self.assertEqual(self.db.named_directory('study2'), '/data/study2')
+        self.reopen()
+        self.assertEqual(self.db.json_value('a'), 1)
+        self.assertEqual(self.db.json_value('b'), 2)
+        self.assertEqual(self.db.named_directory('study2'), '/data/study2')
+        self.assertEqual(
+            self.db.path_metadata('/data/study/sub01/t1.nii')['subject'],
+            'sub01')
+
+    def test_rollback(self):
+        # only the modifications of the failed transaction are cancelled
+        with self.db.transaction():
+            self.db.set_json_value('a', 1)
+            self.db.set_named_directory('home', '/tmp')
+        try:
+            with self.db.transaction():
+                self.db.set_json_value('a', 2)
+                self.db.set_json_value('c', 3)
+                self.db.set_named_directory('home', None)
+                self.db.set_path_metadata('/data/study/sub01/t1.nii',
+                                          {'subject': 'sub01'})
+                raise RuntimeError('abort')
+        except RuntimeError:
+            pass
+        self.assertEqual(self.db.json_value('a'), 1)
+        self.assertTrue(self.db.json_value('c') is None)
+        self.assertEqual(self.db.named_directory('home'), '/tmp')
+        self.assertEqual(self.db.named_directory('study'), '/data/study')
+        self.assertTrue(
+            self.db.path_metadata('/data/study/sub01/t1.nii') is None)
+        self.assertEqual(self.db.paths_metadata(filters={'subject': 'sub01'}),
+                         [])
+
+    def test_threads(self):
+        errors = []
+
+        def write(i):
+            try:
+                for j in range(10):
+                    with self.db.transaction():
+                        self.db.set_json_value('t%d_%d' % (i, j), [i, j])
+                        self.db.set_path_metadata(
+                            '/data/study/sub%02d/t%d.nii' % (i, j),
+                            {'subject': 'sub%02d' % i})
+                    self.assertEqual(self.db.json_value('t%d_%d' % (i, j)),
+                                     [i, j])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(i,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.reopen()
+        self.assertEqual(len(self.db.paths_metadata('study')), 40)
+        self.assertEqual(self.db.json_value('t3_9'), [3, 9])
+
+    def test_concurrent_transactions(self):
+        # a transaction started by another thread is not nested in a
+        # running one, and is not rolled back with it
+        self.db.commit()
+        started = threading.Event()
+        done = threading.Event()
+        errors = []
+
+        def abort():
+            try:
+                with self.db.transaction():
+                    self.db.set_json_value('a', 1)
+                    started.set()
+                    # the other transaction has to wait for this one
+                    done.wait(0.5)
+                    raise RuntimeError('abort')
+            except RuntimeError:
+                pass
+
+        def write():
+            started.wait()
+            try:
+                with self.db.transaction():
+                    self.db.set_json_value('b', 2)
+                done.set()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=abort),
+                   threading.Thread(target=write)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.reopen()
+        self.assertTrue(self.db.json_value('a') is None)
+        self.assertEqual(self.db.json_value('b'), 2)
+
+
+class TestJSONDatabase(DatabaseTest, TransactionTest, unittest.TestCase):
+
+    def create_database(self):
+        return JSONDBEngine(None)
+
+    def reopen(self):
+        # in-memory database: committed data are kept in the engine
+        pass
+
+
+class TestJSONDatabaseFile(DatabaseTest, TransactionTest, unittest.TestCase):
+
+    def create_database(self):
+        return JSONDBEngine(osp.join(self.tmp_dir, 'capsul.json'))
+
+    def reopen(self):
+        self.db = JSONDBEngine(self.db.json_filename)
+
+    def test_persistence(self):
+        self.db.set_path_metadata('/data/study/sub01/t1.nii',
+                                  {'subject': 'sub01'})
+        self.db.set_json_value('config', {'a': [1, 2]})
+        self.db.commit()
+        self.db.set_path_metadata('/data/study/sub02/t1.nii',
+                                  {'subject': 'sub02'})
+        self.db.set_named_directory('study2', None)
+        self.db.commit()
+        # not committed
+        self.db.set_json_value('config', None)
+        self.assertTrue(osp.exists(self.db.journal_filename))
+        self.reopen()
+        self.assertEqual(self.db.json_value('config'), {'a': [1, 2]})
+        self.assertEqual([d['name'] for d in self.db.named_directories()],
+                         ['study'])
+        self.assertEqual(
+            self.db.path_metadata('/data/study/sub01/t1.nii')['subject'],
+            'sub01')
+        self.assertEqual(
+            [m['subject'] for m in self.db.paths_metadata(
+                prefix='/data/study/sub02/')],
+            ['sub02'])
+
+    def test_incomplete_commit(self):
+        self.db.set_json_value('a', 1)
+        self.db.commit()
+        self.db.set_json_value('a', 2)
+        self.db.set_json_value('b', 2)
+        self.db.commit()
+        # simulate a crash during the second commit
+        with open(self.db.journal_filename) as f:
+            journal = f.read()
+        with open(self.db.journal_filename, 'w') as f:
+            f.write(journal[:journal.rindex('["json_value","b"') + 5])
+        self.reopen()
+        self.assertEqual(self.db.json_value('a'), 1)
+        self.assertTrue(self.db.json_value('b') is None)
+        # the incomplete commit has been removed, following commits are
+        # readable
+        self.db.set_json_value('c', 3)
+        self.db.commit()
+        self.reopen()
+        self.assertEqual(self.db.json_value('a'), 1)
+        self.assertEqual(self.db.json_value('c'), 3)
+
+    def test_compaction(self):
+        self.db.compaction_threshold = 10
+        for i in range(25):
+            self.db.set_path_metadata('/data/study/sub%02d/t1.nii' % i,
+                                      {'subject': 'sub%02d' % i})
+            self.db.commit()
+        # each commit writes a modification and a commit marker
+        with open(self.db.journal_filename) as f:
+            self.assertTrue(len(f.readlines()) < 2 * 10)
+        self.db.set_json_value('a', 1)
+        self.db.commit()
+        self.db.compact()
+        self.assertFalse(osp.exists(self.db.journal_filename))
+        self.reopen()
+        self.assertEqual(self.db.json_value('a'), 1)
+        self.assertEqual(self.db.named_directory('study'), '/data/study')
+        self.assertEqual(len(self.db.paths_metadata('study')), 25)
+        self.assertEqual(
+            self.db.path_metadata('sub03/t1.nii', 'study'),
+            {'subject': 'sub03', 'named_directory': 'study',
+             'path': 'sub03/t1.nii'})
+
+
+class TestPopulseDatabase(DatabaseTest, TransactionTest, unittest.TestCase):
+
+    def create_database(self):
+        return PopulseDBEngine(
+            'sqlite:///%s' % osp.join(self.tmp_dir, 'capsul.sqlite'))
+
+    def reopen(self):
+        self.db = self.create_database()
+
+    def test_json_value_cache(self):
+        self.db.set_json_value('a', {'b': [1]})
+        value = self.db.json_value('a')
+        value['b'].append(2)
+        self.assertEqual(self.db.json_value('a'), {'b': [1]})
+        self.db.set_json_value('a', {'b': [3]})
+        self.assertEqual(self.db.json_value('a'), {'b': [3]})
+
+    def test_failed_paths_metadata(self):
+        # the new field is rolled back with the failed bulk operation
+        self.assertRaises(ValueError, self.db.set_paths_metadata,
+                          [('/data/study/sub01/t1.nii', {'newattr': 1}),
+                           ('t1.nii', {})])
+        self.assertEqual(self.db.paths_metadata(filters={'newattr': 1}), [])
+        self.db.set_path_metadata('/data/study/sub01/t1.nii',
+                                  {'newattr': 1})
+        self.assertEqual(
+            len(self.db.paths_metadata(filters={'newattr': 1})), 1)
+
+
+class TestPopulseMemoryDatabase(DatabaseTest, TransactionTest,
+                                unittest.TestCase):
+
+    def create_database(self):
+        return PopulseDBEngine('sqlite:///:memory:')
+
+    def reopen(self):
+        pass
+
+    def test_threads(self):
+        # all threads share the in-memory database
+        def write(i):
+            self.db.set_json_value('t%d' % i, i)
+
+        threads = [threading.Thread(target=write, args=(i,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([self.db.json_value('t%d' % i) for i in range(4)],
+                         list(range(4)))
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestSuite()
+    for test_case in (TestJSONDatabase, TestJSONDatabaseFile,
+                      TestPopulseDatabase, TestPopulseMemoryDatabase):
+        suite.addTests(unittest.TestLoader().loadTestsFromTestCase(test_case))
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
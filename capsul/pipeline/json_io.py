@@ -17,12 +17,17 @@ import sys
 from traits.api import Undefined
 from soma.controller import Controller
 from capsul.pipeline.pipeline_construction import PipelineConstructor
+from capsul.pipeline import pipeline_cache
 
 
 def create_json_pipeline(module, name, json_file):
     """
     Create a pipeline class given its Capsul JSON representation.
 
+    Pipeline classes created from JSON files are stored in the
+    :mod:`~capsul.pipeline.pipeline_cache`, so that a file is only parsed
+    again when it is modified.
+
     Parameters
     ----------
     module: str (mandatory)
@@ -33,6 +38,17 @@ def create_json_pipeline(module, name, json_file):
     json_file: str or dict of file object (mandatory)
         name of file containing the JSON description or JSON dict.
 
+    """
+    if isinstance(json_file, str) and os.path.isfile(json_file):
+        return pipeline_cache.cached_pipeline_class(
+            _create_json_pipeline, module, name, json_file)
+    return _create_json_pipeline(module, name, json_file)
+
+
+def _create_json_pipeline(module, name, json_file):
+    """
+    Create a pipeline class given its Capsul JSON representation, without
+    using the cache. See :func:`create_json_pipeline`.
     """
     json_filename = None
     if hasattr(json_file, 'read'):
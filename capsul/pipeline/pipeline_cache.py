@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+'''
+Cache of pipeline classes created from XML or JSON description files.
+
+Creating a pipeline class from a description parses the file and records
+the pipeline construction calls in a
+:class:`~capsul.pipeline.pipeline_construction.ConstructedPipeline`
+subclass. The cache saves these construction calls in a generated python
+module, named after a hash of the description file contents and of the
+capsul version: later loads of the same description import this module
+(thus its compiled bytecode) instead of parsing the description again. A
+modified description, or another capsul version, gets a new hash, thus a
+new cache entry.
+
+The cache is stored in ``$XDG_CACHE_HOME/capsul/pipelines`` (see
+:func:`capsul.utils.user_cache_directory`), unless :data:`cache_dir` is
+set. Setting :data:`enabled` to False disables the cache.
+
+Functions
+=========
+:func:`cached_pipeline_class`
+-----------------------------
+'''
+
+from __future__ import absolute_import
+import hashlib
+import importlib.util
+import logging
+import math
+import os
+import os.path as osp
+import tempfile
+
+import six
+from soma.sorted_dictionary import OrderedDict
+from traits.api import Undefined
+
+from capsul.info import __version__ as capsul_version
+from capsul.pipeline.pipeline_construction import ConstructedPipeline
+from capsul.utils import user_cache_directory
+
+logger = logging.getLogger(__name__)
+
+# set to False to disable the cache
+enabled = True
+# cache directory, user_cache_directory('pipelines') if None
+cache_dir = None
+
+# bumped when the generated modules change
+cache_version = 1
+
+# ConstructedPipeline class attributes set by PipelineConstructor
+constructed_attributes = ('_pipeline_definition_calls',
+                          'do_autoexport_nodes_parameters', 'node_position',
+                          'scene_scale_factor')
+
+
+def cached_pipeline_class(create_function, module, name, filename):
+    ''' Get a pipeline class created from a description file, using the
+    cache.
+
+    Parameters
+    ----------
+    create_function: function
+        function creating the pipeline class when it is not cached, called
+        as ``create_function(module, name, filename)``
+    module: str
+        name of the module for the created Pipeline class
+    name: str
+        name of the pipeline class, or None to use the name given in the
+        description
+    filename: str
+        description file
+    '''
+    if not enabled:
+        return create_function(module, name, filename)
+    with open(filename, 'rb') as f:
+        source = f.read()
+    key = hashlib.sha1()
+    # construction calls depend on the capsul version which recorded them
+    for item in (capsul_version, str(cache_version),
+                 create_function.__name__, name or '',
+                 osp.basename(filename)):
+        key.update(item.encode('utf-8'))
+        key.update(b'\0')
+    key.update(source)
+    directory = cache_dir or user_cache_directory('pipelines')
+    py_file = osp.join(directory, 'pipeline_%s.py' % key.hexdigest())
+    if osp.exists(py_file):
+        try:
+            return _load_class(py_file, module)
+        except Exception as e:
+            logger.warning('Ignoring invalid pipeline cache {0}: {1}'
+                           .format(py_file, e))
+    pipeline_class = create_function(module, name, filename)
+    _save_class(pipeline_class, py_file, filename)
+    return pipeline_class
+
+
+def _load_class(py_file, module):
+    ''' Build a pipeline class from a cache module
+    '''
+    spec = importlib.util.spec_from_file_location(
+        '_capsul_pipeline_cache', py_file)
+    cached = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(cached)
+    attributes = dict(cached.attributes)
+    attributes['__module__'] = module
+    pipeline_class = type(cached.name, (ConstructedPipeline, ), attributes)
+    # the documentation is already complemented by ProcessMeta
+    pipeline_class.__doc__ = cached.doc
+    return pipeline_class
+
+
+def _save_class(pipeline_class, py_file, filename):
+    ''' Write a cache module for a pipeline class. Nothing is written if
+    the construction calls contain values which cannot be written as python
+    literals, or if the cache directory cannot be written.
+    '''
+    attributes = dict((name, pipeline_class.__dict__[name])
+                      for name in constructed_attributes
+                      if name in pipeline_class.__dict__)
+    try:
+        lines = [
+            '# -*- coding: utf-8 -*-',
+            '# Pipeline class cache generated by capsul from:',
+            '# %s' % filename,
+            'from soma.sorted_dictionary import OrderedDict',
+            'from traits.api import Undefined',
+            '',
+            'name = %s' % _python_literal(pipeline_class.__name__),
+            'doc = %s' % _python_literal(pipeline_class.__doc__),
+            'attributes = %s' % _python_literal(attributes),
+            '']
+    except ValueError as e:
+        logger.debug('Pipeline {0} is not cached: {1}'.format(filename, e))
+        return
+    directory = osp.dirname(py_file)
+    try:
+        if not osp.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp_file = tempfile.mkstemp(prefix='.pipeline_', suffix='.py',
+                                        dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(lines))
+        getattr(os, 'replace', os.rename)(tmp_file, py_file)
+    except (IOError, OSError) as e:
+        logger.warning('Cannot write pipeline cache {0}: {1}'
+                       .format(py_file, e))
+
+
+def _python_literal(value):
+    ''' Python source of a value, raise ValueError if it cannot be written
+    as a literal
+    '''
+    if value is Undefined:
+        return 'Undefined'
+    if value is None or isinstance(value, (bool, six.string_types, bytes)) \
+            or isinstance(value, six.integer_types):
+        return repr(value)
+    if isinstance(value, float):
+        if math.isinf(value) or math.isnan(value):
+            return 'float(%r)' % repr(value)
+        return repr(value)
+    # container subclasses are not written, they would lose their type
+    if type(value) is list:
+        return '[%s]' % ', '.join(_python_literal(v) for v in value)
+    if type(value) is tuple:
+        return '(%s)' % ''.join('%s, ' % _python_literal(v) for v in value)
+    if type(value) is set:
+        return 'set([%s])' % ', '.join(_python_literal(v) for v in value)
+    if type(value) is dict:
+        return '{%s}' % ', '.join(
+            '%s: %s' % (_python_literal(k), _python_literal(v))
+            for k, v in six.iteritems(value))
+    if type(value) is OrderedDict:
+        return 'OrderedDict(%s)' % _python_literal(list(value.items()))
+    raise ValueError('cannot write %r as a python literal' % (value, ))
@@ -10,6 +10,10 @@ Functions
 =========
 :func:`workflow_from_pipeline`
 ------------------------------
+:func:`workflow_shards_from_pipeline`
+-------------------------------------
+:func:`pack_small_jobs`
+-----------------------
 :func:`workflow_run`
 --------------------
 """
@@ -105,10 +109,196 @@ class TempFile(str):
         return str(self) >= other
 
 
+class PathPrefixIndex(object):
+    ''' Prefix tree (trie) index of base directories, used to find which
+    base directory (soma-workflow shared resource path or transfer path)
+    contains a given file path.
+
+    Lookups cost the number of path components, instead of the number of
+    base directories, and results are memoized since the same paths are
+    looked up many times when building a workflow.
+    '''
+
+    def __init__(self, base_dirs):
+        '''
+        Parameters
+        ----------
+        base_dirs: dict or sequence
+            base directories. If a dict is given, its values are associated
+            to base directories keys, and returned by :meth:`find`.
+        '''
+        self._tree = {}
+        self._cache = {}
+        if isinstance(base_dirs, dict):
+            items = six.iteritems(base_dirs)
+        else:
+            items = [(base_dir, base_dir) for base_dir in base_dirs]
+        for base_dir, value in items:
+            node = self._tree
+            for part in base_dir.rstrip(os.sep).split(os.sep):
+                node = node.setdefault(part, {})
+            # None is used as the leaf marker since it cannot be a path part
+            node[None] = (base_dir, value)
+
+    def find(self, path):
+        ''' Find the deepest base directory containing the given path.
+
+        Returns
+        -------
+        item: tuple or None
+            ``(base_dir, rel_path, value)`` or None if no base directory
+            contains the path.
+        '''
+        try:
+            return self._cache[path]
+        except KeyError:
+            pass
+        except TypeError:
+            return None  # not hashable: not a path
+        if not isinstance(path, six.string_types) or not self._tree:
+            self._cache[path] = None
+            return None
+        parts = path.split(os.sep)
+        node = self._tree
+        found = None
+        for i, part in enumerate(parts[:-1]):
+            node = node.get(part)
+            if node is None:
+                break
+            leaf = node.get(None)
+            if leaf is not None:
+                found = (leaf[0], os.sep.join(parts[i + 1:]), leaf[1])
+        self._cache[path] = found
+        return found
+
+
+class WorkflowJobCache(object):
+    ''' Jobs cache used to regenerate a workflow incrementally.
+
+    A cache instance may be passed to successive calls of
+    :func:`workflow_from_pipeline` on the same pipeline. Each job is recorded
+    with a signature of its process parameters values, file transfers and
+    job options. In a later build, a job whose signature has not changed is
+    reused as is, and only jobs whose inputs have changed are rebuilt.
+    Temporary paths and file transfers are also reused from one build to the
+    next, so that the signatures of unchanged jobs remain stable.
+
+    Entries which are not used during a build are dropped at the end of it.
+    The cache does not track configuration changes in the CapsulEngine
+    settings: :meth:`clear` should be called after such a change.
+
+    Attributes
+    ----------
+    hits: int
+        number of jobs reused during the last build
+    misses: int
+        number of jobs (re)built during the last build
+    '''
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        ''' Empty the cache '''
+        self._jobs = {}
+        self._temporaries = {}
+        self._transfers = {}
+        self._occurrences = {}
+        self._used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def begin_build(self):
+        ''' Start a new workflow build (called by
+        :func:`workflow_from_pipeline`)
+        '''
+        self._occurrences = {}
+        self._used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def end_build(self):
+        ''' Finish a workflow build: drop entries which have not been used
+        '''
+        for cache in (self._jobs, self._temporaries, self._transfers):
+            for key in list(cache.keys()):
+                if key not in self._used:
+                    del cache[key]
+        self._occurrences = {}
+
+    def _key(self, key):
+        # the same process (or path) may be used several times in a single
+        # build (iterations), so keys are numbered by order of occurrence.
+        occurrence = self._occurrences.get(key, 0)
+        self._occurrences[key] = occurrence + 1
+        key = key + (occurrence, )
+        self._used.add(key)
+        return key
+
+    def temporary_path(self, process, plug_name, is_directory, suffix, name):
+        ''' Get a soma-workflow TemporaryPath for the given process parameter,
+        reusing the one of the previous build if possible.
+        '''
+        key = self._key(('temp', id(process), plug_name))
+        item = self._temporaries.get(key)
+        if item is not None:
+            process_ref, params, swf_tmp = item
+            if process_ref() is process \
+                    and params == (is_directory, suffix, name):
+                return swf_tmp
+        swf_tmp = swclient.TemporaryPath(is_directory=is_directory,
+                                         suffix=suffix, name=name)
+        self._temporaries[key] = (weakref.ref(process),
+                                  (is_directory, suffix, name), swf_tmp)
+        return swf_tmp
+
+    def file_transfer(self, is_input, client_path, client_paths):
+        ''' Get a soma-workflow FileTransfer for the given path, reusing the
+        one of the previous build if possible. The transfer initial status
+        is reset.
+        '''
+        key = self._key(('transfer', client_path, is_input))
+        transfer = self._transfers.get(key)
+        if transfer is not None and transfer.client_paths == client_paths:
+            if is_input:
+                transfer.initial_status = swclient.constants.FILES_ON_CLIENT
+            else:
+                transfer.initial_status \
+                    = swclient.constants.FILES_DO_NOT_EXIST
+            return transfer
+        transfer = swclient.FileTransfer(is_input=is_input,
+                                         client_path=client_path,
+                                         client_paths=client_paths)
+        self._transfers[key] = transfer
+        return transfer
+
+    def job_key(self, process, name):
+        ''' Get the cache key of the job built for a process '''
+        return self._key(('job', id(process), name))
+
+    def get_job(self, key, process, signature):
+        ''' Get the job recorded for the given key, if its process and
+        signature match, or None
+        '''
+        item = self._jobs.get(key)
+        if item is not None:
+            process_ref, job_signature, job = item
+            if process_ref() is process and job_signature == signature:
+                self.hits += 1
+                return job
+        self.misses += 1
+        return None
+
+    def set_job(self, key, process, signature, job):
+        ''' Record a job in the cache '''
+        self._jobs[key] = (weakref.ref(process), signature, job)
+
+
 def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
                            jobs_priority=0, create_directories=True,
                            environment='global', check_requirements=True,
-                           complete_parameters=False):
+                           complete_parameters=False, job_cache=None,
+                           memory=None):
     """ Create a soma-workflow workflow from a Capsul Pipeline
 
     Parameters
@@ -146,6 +336,17 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
         several times when it's already done, but in iteration nodes,
         completion needs to be done anyway for each iteration, so this option
         offers to do the rest of the "parent" pipeline completion.
+    job_cache: WorkflowJobCache (optional)
+        jobs cache for incremental workflow regeneration. When the same cache
+        is passed to successive calls on a pipeline, only the jobs whose
+        parameters have changed since the previous call are rebuilt. See
+        :class:`WorkflowJobCache`.
+    memory: str (optional)
+        smart-caching directory. If given, each process job looks up its
+        results in this cache before running, and stores them afterwards
+        (see :class:`~capsul.study_config.memory.Memory`), so that running
+        the workflow again only recomputes jobs whose inputs have changed.
+        The directory must be accessible from the computing resource.
 
     Returns
     -------
@@ -153,6 +354,17 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
         a soma-workflow workflow
     """
 
+    # prefix trees of shared / transfer base directories, built once
+    path_indices = {}
+
+    def _path_index(base_dirs):
+        item = path_indices.get(id(base_dirs))
+        if item is None:
+            # keep a reference on base_dirs so that its id remains valid
+            item = (base_dirs, PathPrefixIndex(base_dirs))
+            path_indices[id(base_dirs)] = item
+        return item[1]
+
     def _files_group(path, merged_formats):
         bname = os.path.basename(path)
         l0 = len(path) - len(bname)
@@ -184,14 +396,13 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
             # already in map
             return item
 
-        for base_dir, (namespace, uuid) in six.iteritems(shared_paths):
-            if path.startswith(base_dir + os.sep):
-                rel_path = path[len(base_dir)+1:]
-                #uuid = path
-                item = swclient.SharedResourcePath(
-                    rel_path, namespace, uuid=uuid)
-                shared_map[path] = item
-                return item
+        found = _path_index(shared_paths).find(path)
+        if found is not None:
+            base_dir, rel_path, (namespace, uuid) = found
+            item = swclient.SharedResourcePath(
+                rel_path, namespace, uuid=uuid)
+            shared_map[path] = item
+            return item
         return None
 
     def _replace_in_list(rlist, temp_map):
@@ -301,6 +512,23 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
                 else:
                     rdict[param_name] = value
 
+    def _value_signature(value, temp_map):
+        # comparable representation of a parameter value, where temporary
+        # files are identified by their soma-workflow TemporaryPath
+        if isinstance(value, TempFile):
+            return ('temp', id(temp_map.get(value)), value.pattern)
+        if isinstance(value, (list, tuple, set)):
+            return tuple(_value_signature(item, temp_map) for item in value)
+        if isinstance(value, (dict, OrderedDict, SortedDictionary)):
+            return tuple((key, _value_signature(item, temp_map))
+                         for key, item in six.iteritems(value))
+        return value
+
+    def _transfers_signature(proc_transfers):
+        return tuple(sorted(
+            (param, id(transfer), transfer.initial_status, path)
+            for param, (transfer, path) in six.iteritems(proc_transfers)))
+
     def build_job(process, temp_map={}, shared_map={}, transfers=[{}, {}],
                   shared_paths={}, forbidden_temp=set(), name='', priority=0,
                   step_name='', engine=None, environment='global'):
@@ -350,8 +578,14 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
         has_outputs = False
         forbidden_traits = ('nodes_activation', 'selection_changed',
                             'activated', 'enabled', 'name', 'node_type', )
+        values_signature = []
         for param_name, parameter in six.iteritems(process.user_traits()):
             if param_name not in forbidden_traits:
+                if job_cache is not None:
+                    values_signature.append(
+                        (param_name,
+                         _value_signature(getattr(process, param_name),
+                                          temp_map)))
                 if parameter.output \
                         and (parameter.input_filename is False
                              or not (isinstance(parameter.trait_type,
@@ -386,12 +620,25 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
                         _translated_path(value, shared_map, shared_paths,
                                         parameter)
 
+        iproc_transfers = transfers[0].get(process, {})
+        oproc_transfers = transfers[1].get(process, {})
+
+        if job_cache is not None:
+            # reuse the job of a previous build if nothing has changed
+            cache_key = job_cache.job_key(process, job_name)
+            signature = (tuple(values_signature),
+                         _transfers_signature(iproc_transfers),
+                         _transfers_signature(oproc_transfers),
+                         tuple(sorted(six.iteritems(shared_paths))),
+                         priority, step_name, environment, memory)
+            job = job_cache.get_job(cache_key, process, signature)
+            if job is not None:
+                return job
+
         # Get the process command line
         #process_cmdline = process.get_commandline()
         process_cmdline = process.params_to_command()
         # and replace in commandline
-        iproc_transfers = transfers[0].get(process, {})
-        oproc_transfers = transfers[1].get(process, {})
         #proc_transfers = dict(iproc_transfers)
         #proc_transfers.update(oproc_transfers)
         _replace_in_list(process_cmdline, temp_map)
@@ -406,6 +653,7 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
             config = {}
 
         use_input_params_file = False
+        capsul_job_info = None
         if process_cmdline[0] == 'capsul_job':
             # use python executable from config, if any
             pconf = config.get('capsul.engine.module.python')
@@ -437,6 +685,8 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
             if ppath:
                 path_trick = 'import sys; sys.path = %s + sys.path; ' \
                     % repr(ppath)
+            # used to pack small jobs together (see pack_small_jobs())
+            capsul_job_info = (python_command, path_trick, process_cmdline[1])
             process_cmdline = [
                 'capsul_job', python_command, '-c',
                 '%sfrom capsul.api import Process; '
@@ -486,6 +736,8 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
                 param_dict=param_dict,
                 use_input_params_file=use_input_params_file,
                 has_outputs=has_outputs)
+            if memory is not None:
+                job.env = {'CAPSUL_MEMORY': memory}
             # print('job command:', job.command)
             # handle parallel job info (as in soma-workflow)
             parallel_job_info = getattr(process, 'parallel_job_info', None)
@@ -497,10 +749,14 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
             # propagate the process uuid, if any, to maintain link with it
             job.uuid = process.uuid
         job.configuration = config
+        if capsul_job_info is not None:
+            job.capsul_job_info = capsul_job_info
         # associate job with process
         job.process = weakref.ref(process)
         job._do_not_pickle = ['process']
         job.process_hash = id(process)
+        if job_cache is not None:
+            job_cache.set_job(cache_key, process, signature, job)
         return job
 
     def build_custom_job(node, process_cmdline, name,
@@ -579,8 +835,14 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
                     suffix = trait.allowed_extensions[0]
                 else:
                     suffix = ''
-                swf_tmp = swclient.TemporaryPath(is_directory=is_directory,
-                    suffix=suffix, name='temporary_%d' % count)
+                if job_cache is not None:
+                    swf_tmp = job_cache.temporary_path(
+                        process, plug_name, is_directory=is_directory,
+                        suffix=suffix, name='temporary_%d' % count)
+                else:
+                    swf_tmp = swclient.TemporaryPath(
+                        is_directory=is_directory, suffix=suffix,
+                        name='temporary_%d' % count)
                 tmp_file = TempFile('%d' % count)
                 count += 1
                 temp_map[tmp_file] = (swf_tmp, node, plug_name, optional)
@@ -729,6 +991,7 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
         in_transfers = {}
         out_transfers = {}
         transfers = [in_transfers, out_transfers]
+        transfer_index = _path_index(transfer_paths)
         todo_nodes = [pipeline.pipeline_node]
         while todo_nodes:
             node = todo_nodes.pop(0)
@@ -750,17 +1013,19 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
                     existing_transfer = existing_transfers.get(param)
                     if existing_transfer:
                         continue
-                    for tpath in transfer_paths:
-                        if path.startswith(os.path.join(tpath, '')):
+                    if transfer_index.find(path) is not None:
+                        client_paths = _files_group(path, merged_formats)
+                        if job_cache is not None:
+                            transfer_item = job_cache.file_transfer(
+                                not output, path, client_paths)
+                        else:
                             transfer_item = swclient.FileTransfer(
                                 is_input=not output,
                                 client_path=path,
-                                client_paths=_files_group(path,
-                                                          merged_formats))
-                            _propagate_transfer(node, param,
-                                                path, not output, transfers,
-                                                transfer_item)
-                            break
+                                client_paths=client_paths)
+                        _propagate_transfer(node, param,
+                                            path, not output, transfers,
+                                            transfer_item)
             if hasattr(process, 'nodes'):
                 todo_nodes += [sub_node
                                for name, sub_node
@@ -1479,16 +1744,11 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
 
     def _create_directories_job(pipeline, shared_map={}, shared_paths={},
                                 priority=0, transfer_paths=[]):
-        def _is_transfer(d, transfer_paths):
-            for path in transfer_paths:
-                if d.startswith(os.path.join(path, '')):
-                    return True
-            return False
-
+        transfer_index = _path_index(transfer_paths)
         directories = [d
                        for d in pipeline_tools.get_output_directories(
                           pipeline)[1]
-                       if not _is_transfer(d, transfer_paths)]
+                       if transfer_index.find(d) is None]
         if len(directories) == 0:
             return None # no dirs to create.
         paths = []
@@ -1558,6 +1818,9 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
             attributes = completion.get_attribute_values()
             completion.complete_parameters(complete_iterations=False)
 
+    if job_cache is not None:
+        job_cache.begin_build()
+
     temp_map = assign_temporary_filenames(pipeline)
     temp_subst_list = [(x1, x2[0]) for x1, x2 in six.iteritems(temp_map)]
     temp_subst_map = dict(temp_subst_list)
@@ -1606,41 +1869,59 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
                 environment=environment)
     finally:
         restore_empty_filenames(temp_map)
-
-    # post-process links to replace nodes with jobs
-    param_links = {}
-    # expand jobs map because jobs keys may be tuples (for iterations)
-    jobs_map = {}
-    for process, job in six.iteritems(jobs):
+        if job_cache is not None:
+            job_cache.end_build()
+
+    # post-process links to replace nodes with jobs.
+    # jobs keys may be tuples (process, iteration), possibly nested, for
+    # iterated jobs, and iteration nodes are represented by a (map, reduce)
+    # tuple of jobs. Build in a single pass a flat registry of the jobs to
+    # use as links destinations (inputs) and sources (outputs), indexed by
+    # jobs keys and by processes.
+    key_jobs = {}
+    process_jobs = {}
+    for key, job in six.iteritems(jobs):
+        if isinstance(job, tuple):
+            # iteration node: inputs go to the map job, outputs come from
+            # the reduce job
+            dest_job, src_job = job
+        else:
+            dest_job = src_job = job
+        key_jobs[key] = ([dest_job], [src_job])
+        process = key
         while isinstance(process, tuple):
             process = process[0]
-        jobs_map.setdefault(process, []).append(job)
+        registered = process_jobs.setdefault(process, ([], []))
+        registered[0].append(dest_job)
+        registered[1].append(src_job)
+
+    def _registered_jobs(key, output):
+        # a tuple key designates a single iteration of a job, whereas a
+        # process designates its jobs in all iterations. Pipelines are
+        # virtual nodes and have no jobs.
+        if isinstance(key, tuple):
+            registered = key_jobs.get(key)
+        else:
+            registered = process_jobs.get(key)
+        if registered is None:
+            return ()
+        return registered[int(output)]
+
+    param_links = {}
     for dnode, dlinks in six.iteritems(links):
-        if isinstance(dnode, (Pipeline, ProcessIteration)) \
-                or (isinstance(dnode, tuple)
-                    and isinstance(dnode[0], (Pipeline, ProcessIteration))):
-            continue  # FIXME handle this
+        dest_jobs = _registered_jobs(dnode, False)
+        if not dest_jobs:
+            continue
         djlinks = {}
         for param, linkl in six.iteritems(dlinks):
             for link in linkl:
-                if link[0] is not pipeline \
-                        and not isinstance(link[0],
-                                          (Pipeline, ProcessIteration)):
-                    # FIXME handle ProcessIteration cases
-                    if isinstance(link[0], tuple):
-                        if not isinstance(link[0][0],
-                                          (Pipeline, ProcessIteration)):
-                            djlinks.setdefault(param, []) \
-                                .append((jobs[link[0]], link[1]))
-                    else:
-                        for job in jobs_map[link[0]]:
-                            djlinks.setdefault(param, []) \
-                                .append((job, link[1]))
-        if isinstance(dnode, tuple):
-            param_links[jobs[dnode]] = djlinks
-        else:
-            for job in jobs_map[dnode]:
-                param_links[job] = djlinks
+                for job in _registered_jobs(link[0], True):
+                    djlinks.setdefault(param, []).append((job, link[1]))
+        for job in dest_jobs:
+            jlinks = param_links.setdefault(job, {})
+            for param, linkl in six.iteritems(djlinks):
+                jlinkl = jlinks.setdefault(param, [])
+                jlinkl += [link for link in linkl if link not in jlinkl]
 
     all_jobs = [job for job in list(jobs.values()) if not isinstance(job, tuple)]
     root_jobs = sum(list(root_jobs.values()), [])
@@ -1676,6 +1957,354 @@ def workflow_from_pipeline(pipeline, study_config=None, disabled_nodes=None,
     return workflow
 
 
+def _sharding_iteration(pipeline):
+    ''' Get the iteration process of a pipeline which can be split into
+    shards, or None. This is the case of pipelines which only contain an
+    iteration node, as those built using
+    :meth:`capsul.engine.CapsulEngine.get_iteration_pipeline`.
+    '''
+    if not isinstance(pipeline, Pipeline):
+        return None
+    job_nodes = [node for name, node in six.iteritems(pipeline.nodes)
+                 if name != '' and node.activated and node.enabled
+                    and node.is_job()]
+    if len(job_nodes) != 1:
+        return None
+    process = getattr(job_nodes[0], 'process', None)
+    if not isinstance(process, ProcessIteration):
+        return None
+    return process
+
+
+def workflow_shards_from_pipeline(pipeline, shards, study_config=None,
+                                  **kwargs):
+    """ Create several independent soma-workflow workflows from an iteration
+    pipeline.
+
+    The iterations are split into ``shards`` contiguous ranges, and a workflow
+    is built for each range. Such workflows can be submitted and run
+    concurrently, and a failure in one of them does not affect the others.
+
+    Only pipelines containing a single iteration node can be split this way
+    (see :meth:`capsul.engine.CapsulEngine.get_iteration_pipeline`). For
+    other pipelines, a list containing a single workflow is returned.
+
+    After the call, the iterative outputs of the iteration node are set to
+    the concatenation of the values of all shards.
+
+    Parameters
+    ----------
+    pipeline: Pipeline (mandatory)
+        a CAPSUL pipeline
+    shards: int (mandatory)
+        number of sub-workflows to build. Fewer may be returned if the
+        number of iterations is smaller.
+    study_config: StudyConfig (optional)
+        passed to :func:`workflow_from_pipeline`
+    kwargs:
+        other parameters are passed to :func:`workflow_from_pipeline`
+
+    Returns
+    -------
+    workflows: list of Workflow
+        each workflow has a ``shard`` attribute holding its iterations range
+        as a tuple ``(start, stop)``.
+    """
+    it_process = _sharding_iteration(pipeline)
+    if it_process is not None:
+        completion_engine = ProcessCompletionEngine.get_completion_engine(
+            it_process)
+        size = completion_engine.iteration_size()
+    if it_process is None or shards <= 1 or size <= 1:
+        workflow = workflow_from_pipeline(pipeline, study_config=study_config,
+                                          **kwargs)
+        return [workflow]
+
+    shards = min(shards, size)
+    in_params = [p for p in it_process.iterative_parameters
+                 if not it_process.trait(p).output]
+    out_params = [p for p in it_process.iterative_parameters
+                  if it_process.trait(p).output]
+    in_values = dict((p, getattr(it_process, p)) for p in in_params)
+    out_values = dict((p, getattr(it_process, p)) for p in out_params)
+    shard_out_values = dict((p, []) for p in out_params)
+
+    def _slice(values, start, stop):
+        if len(values) == 0:
+            return values
+        return [values[min(i, len(values) - 1)] for i in range(start, stop)]
+
+    workflows = []
+    try:
+        for shard in range(shards):
+            start = shard * size // shards
+            stop = (shard + 1) * size // shards
+            for param, values in six.iteritems(in_values):
+                setattr(it_process, param, _slice(values, start, stop))
+            for param, values in six.iteritems(out_values):
+                setattr(it_process, param, _slice(values, start, stop))
+            workflow = workflow_from_pipeline(
+                pipeline, study_config=study_config, **kwargs)
+            workflow.name = '%s_%d' % (workflow.name, shard)
+            workflow.shard = (start, stop)
+            workflows.append(workflow)
+            for param in out_params:
+                shard_out_values[param] += list(getattr(it_process, param))
+    finally:
+        for param, values in six.iteritems(in_values):
+            setattr(it_process, param, values)
+        if len(workflows) == shards:
+            out_values = shard_out_values
+        for param, values in six.iteritems(out_values):
+            setattr(it_process, param, values)
+
+    return workflows
+
+
+def pack_small_jobs(workflow, runtime_estimates=None, max_runtime=1.,
+                    max_jobs=20):
+    """ Pack chains of small jobs into batch jobs.
+
+    Each job in a soma-workflow workflow is submitted separately to the
+    computing resource scheduler, and has to wait in its queue. For very
+    short processes, this latency is much longer than the processing itself.
+    This post-processing pass replaces chains of small jobs (each job of a
+    chain being the only successor of the previous one, and having no other
+    predecessor) by a single job which runs the processes in sequence in a
+    single python interpreter (see :meth:`Process.run_batch_from_commandline
+    <capsul.process.process.Process.run_batch_from_commandline>`).
+
+    Only jobs running a Capsul process in python (``capsul_job`` commands,
+    see :meth:`Process.params_to_command
+    <capsul.process.process.Process.params_to_command>`), with the same
+    python command, configuration and environment variables, are packed.
+    Custom nodes jobs (map, reduce, strcat...) are run on engine side and do
+    not need packing.
+
+    A job is considered small if its process has a ``small_job`` attribute
+    set to True, or if its estimated runtime is lower than ``max_runtime``.
+
+    Parameters links (output parameters values passed to downstream jobs)
+    are kept: links between jobs of the same batch are handled inside the
+    batch job, and other links are redirected to the batch job parameters.
+
+    Parameters
+    ----------
+    workflow: Workflow (mandatory)
+        workflow built by :func:`workflow_from_pipeline`
+    runtime_estimates: dict (optional)
+        estimated runtime (in seconds), indexed by process identifier (as in
+        :meth:`~capsul.engine.CapsulEngine.get_process_instance`) or by job
+        name
+    max_runtime: float (optional, default: 1.)
+        jobs with an estimated runtime lower or equal to this value are small
+    max_jobs: int (optional, default: 20)
+        maximum number of jobs in a batch
+
+    Returns
+    -------
+    workflow: Workflow
+        a new workflow, or the input one if no jobs have been packed.
+    """
+    def _is_small(job):
+        info = getattr(job, 'capsul_job_info', None)
+        if info is None or getattr(job, 'native_specification', None) \
+                or getattr(job, 'parallel_job_info', None):
+            return False
+        process = job.process()
+        if process is not None and getattr(process, 'small_job', False):
+            return True
+        if runtime_estimates:
+            runtime = runtime_estimates.get(info[2])
+            if runtime is None:
+                runtime = runtime_estimates.get(job.name)
+            return runtime is not None and runtime <= max_runtime
+        return False
+
+    small_jobs = set([job for job in workflow.jobs if _is_small(job)])
+    if not small_jobs:
+        return workflow
+
+    successors = {}
+    predecessors = {}
+    for src, dest in workflow.dependencies:
+        successors.setdefault(src, set()).add(dest)
+        predecessors.setdefault(dest, set()).add(src)
+    # parameters links also define dependencies
+    links_funcs = {}
+    for dest, dlinks in six.iteritems(workflow.param_links):
+        for param, linkl in six.iteritems(dlinks):
+            for link in linkl:
+                successors.setdefault(link[0], set()).add(dest)
+                predecessors.setdefault(dest, set()).add(link[0])
+                if len(link) > 2:
+                    links_funcs[(link[0], dest)] = True
+
+    # find chains
+    next_job = {}
+    for job in small_jobs:
+        succ = successors.get(job, ())
+        if len(succ) != 1:
+            continue
+        dest = list(succ)[0]
+        if dest in small_jobs and len(predecessors.get(dest, ())) == 1 \
+                and (job, dest) not in links_funcs \
+                and dest.capsul_job_info[:2] == job.capsul_job_info[:2] \
+                and dest.configuration == job.configuration \
+                and dest.env == job.env:
+            next_job[job] = dest
+    previous = set(next_job.values())
+    chains = []
+    for job in workflow.jobs:
+        if job not in next_job or job in previous:
+            continue  # not the head of a chain
+        chain = [job]
+        while job in next_job:
+            job = next_job[job]
+            if len(chain) == max_jobs:
+                chains.append(chain)
+                chain = []
+            chain.append(job)
+        chains.append(chain)
+    chains = [chain for chain in chains if len(chain) > 1]
+    if not chains:
+        return workflow
+
+    packed_map = {}
+    packed_jobs = []
+    for chain in chains:
+        packed = _build_batch_job(chain)
+        packed_jobs.append(packed)
+        for i, job in enumerate(chain):
+            packed_map[job] = (packed, '%d.' % i, i)
+
+    # rewrite parameters links
+    param_links = {}
+    for dest, dlinks in six.iteritems(workflow.param_links):
+        dpacked, dprefix, dindex = packed_map.get(dest, (dest, '', None))
+        for param, linkl in six.iteritems(dlinks):
+            for link in linkl:
+                src, sparam = link[:2]
+                spacked, sprefix, sindex = packed_map.get(src,
+                                                          (src, '', None))
+                if spacked is dpacked:
+                    # link inside the batch
+                    dpacked.param_dict['capsul_batch_links'].append(
+                        [dindex, param, sindex, sparam])
+                    continue
+                param_links.setdefault(dpacked, {}).setdefault(
+                    dprefix + param, []).append(
+                        (spacked, sprefix + sparam) + tuple(link[2:]))
+
+    dependencies = set()
+    for src, dest in workflow.dependencies:
+        src = packed_map.get(src, (src, ))[0]
+        dest = packed_map.get(dest, (dest, ))[0]
+        if src is not dest:
+            dependencies.add((src, dest))
+
+    # groups of the input workflow are copied, not modified
+    groups_map = {}
+
+    def _replace_in_group(elements):
+        new_elements = []
+        for element in elements:
+            if isinstance(element, swclient.Group):
+                new_group = groups_map.get(element)
+                if new_group is None:
+                    new_group = swclient.Group(
+                        elements=_replace_in_group(element.elements),
+                        name=element.name,
+                        user_storage=element.user_storage)
+                    groups_map[element] = new_group
+                new_elements.append(new_group)
+                continue
+            packed = packed_map.get(element)
+            if packed is None:
+                new_elements.append(element)
+            elif packed[2] == 0:
+                new_elements.append(packed[0])
+        return new_elements
+
+    jobs = _replace_in_group(workflow.jobs)
+    root_group = _replace_in_group(workflow.root_group)
+
+    new_workflow = swclient.Workflow(jobs=jobs,
+        dependencies=dependencies,
+        root_group=root_group,
+        name=workflow.name,
+        param_links=param_links)
+    for attribute in ('pipeline', '_pipeline', '_do_not_pickle', 'uuid',
+                      'shard'):
+        if hasattr(workflow, attribute):
+            setattr(new_workflow, attribute, getattr(workflow, attribute))
+    return new_workflow
+
+
+def _build_batch_job(jobs):
+    ''' Build a job running the given capsul jobs in sequence (see
+    :func:`pack_small_jobs`)
+    '''
+    python_command, path_trick = jobs[0].capsul_job_info[:2]
+    command = [python_command, '-c',
+               '%sfrom capsul.api import Process; '
+               'Process.run_batch_from_commandline()' % path_trick]
+    param_dict = {'capsul_batch': [], 'capsul_batch_links': []}
+    input_files = []
+    output_files = []
+    for i, job in enumerate(jobs):
+        prefix = '%d.' % i
+        param_dict['capsul_batch'].append(
+            {'process': job.capsul_job_info[2], 'prefix': prefix,
+             'name': job.name})
+        for param, value in six.iteritems(job.param_dict):
+            param_dict[prefix + param] = value
+        # files produced by a previous job of the batch are not inputs
+        input_files += [f for f in job.referenced_input_files
+                        if f not in output_files and f not in input_files]
+        output_files += [f for f in job.referenced_output_files
+                         if f not in output_files]
+    job = swclient.Job(
+        name='batch: %s' % ', '.join([job.name for job in jobs]),
+        command=command,
+        referenced_input_files=input_files,
+        referenced_output_files=output_files,
+        priority=max([job.priority for job in jobs]),
+        param_dict=param_dict,
+        use_input_params_file=True,
+        has_outputs=any([job.has_outputs for job in jobs]))
+    job.user_storage = jobs[0].user_storage
+    job.configuration = jobs[0].configuration
+    job.env = jobs[0].env
+    # processes of the batch, used to dispatch output parameters
+    job.capsul_batch_processes = [('%d.' % i, job.process_hash)
+                                  for i, job in enumerate(jobs)]
+    return job
+
+
+def job_output_params(job, out_params):
+    ''' Split the output parameters of a job into the output parameters of
+    each process it has run: a batch job (see :func:`pack_small_jobs`) runs
+    several processes.
+
+    Returns
+    -------
+    outputs: list
+        list of tuples ``(process_hash, output_params)``
+    '''
+    batch = getattr(job, 'capsul_batch_processes', None)
+    if batch is None:
+        return [(getattr(job, 'process_hash', None), out_params)]
+    outputs = []
+    for prefix, process_hash in batch:
+        outputs.append(
+            (process_hash,
+             dict([(param[len(prefix):], value)
+                   for param, value in six.iteritems(out_params)
+                   if param.startswith(prefix)])))
+    return outputs
+
+
 def workflow_run(workflow_name, workflow, study_config):
     """ Create a soma-workflow controller and submit a workflow
 
@@ -1723,11 +2352,14 @@ def workflow_run(workflow_name, workflow, study_config):
         eng_wf = controller.workflow(wf_id)
         for job in eng_wf.jobs:
             if job.has_outputs:
-                out_params = controller.get_job_output_params(
+                job_out_params = controller.get_job_output_params(
                     eng_wf.job_mapping[job].job_id)
-                if out_params:
-                    process = proc_map.get(job.process_hash)
-                    if process is None:
+                if not job_out_params:
+                    continue
+                for process_hash, out_params \
+                        in job_output_params(job, job_out_params):
+                    process = proc_map.get(process_hash)
+                    if process is None or not out_params:
                         # iteration or non-process job
                         continue
                     for param in list(out_params.keys()):
@@ -591,14 +591,14 @@ class TestCustomNodes(unittest.TestCase):
         #print('dependencies:', sorted([(x[0].name, x[1].name) for x in wf.dependencies]))
         #print('links:', {n.name: {p: (l[0].name, l[1]) for p, l in six.iteritems(links)} for n, links in six.iteritems(wf.param_links)})
         self.assertEqual(len(wf.jobs), 42)
-        self.assertEqual(len(wf.dependencies), 76)
+        self.assertEqual(len(wf.dependencies), 80)
         deps = sorted([
                        ['CV', 'CVtest_map'],
                        ['CV', 'train1'],
                        ['CV_subject', 'CVtest_map'],
                        ['CVtest_map', 'test'],
                        ['CVtest_map', 'test_output'],
-                       #['CVtest_reduce', 'PipelineCVFold_reduce'],
+                       ['CVtest_reduce', 'PipelineCVFold_reduce'],
                        ['PipelineCVFold_map', 'CV'],
                        ['PipelineCVFold_map', 'CV_subject'],
                        ['PipelineCVFold_map', 'intermediate_output'],
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# System import
+from __future__ import absolute_import
+import unittest
+import tempfile
+import shutil
+import os
+import os.path as osp
+
+# Capsul import
+from capsul.pipeline import pipeline_cache
+from capsul.pipeline import xml as xml_io
+from capsul.pipeline import json_io
+from capsul.pipeline.xml import create_xml_pipeline
+from capsul.pipeline.json_io import create_json_pipeline, save_json_pipeline
+
+
+xml_pipeline = osp.join(osp.dirname(osp.dirname(osp.dirname(__file__))),
+                        'process', 'test', 'xml_pipeline.xml')
+
+
+class TestPipelineCache(unittest.TestCase):
+    """ Test the cache of pipeline classes created from description files.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='capsul_pipeline_cache')
+        self.cache_dir = osp.join(self.tmp_dir, 'cache')
+        self.former_cache_dir = pipeline_cache.cache_dir
+        pipeline_cache.cache_dir = self.cache_dir
+        self.xml_file = osp.join(self.tmp_dir, 'xml_pipeline.xml')
+        shutil.copy(xml_pipeline, self.xml_file)
+        # count the descriptions parsing
+        self.parsed = []
+        self.create_functions = (xml_io._create_xml_pipeline,
+                                 json_io._create_json_pipeline)
+
+        def counted(create_function):
+            def create(module, name, filename):
+                self.parsed.append(filename)
+                return create_function(module, name, filename)
+            create.__name__ = create_function.__name__
+            return create
+
+        xml_io._create_xml_pipeline = counted(self.create_functions[0])
+        json_io._create_json_pipeline = counted(self.create_functions[1])
+
+    def tearDown(self):
+        xml_io._create_xml_pipeline, json_io._create_json_pipeline \
+            = self.create_functions
+        pipeline_cache.cache_dir = self.former_cache_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def cache_files(self):
+        # compiled modules are in __pycache__, unless bytecode is disabled
+        return [f for f in os.listdir(self.cache_dir) if f.endswith('.py')]
+
+    def check_pipeline(self, pipeline_class):
+        pipeline = pipeline_class()
+        self.assertEqual(sorted(pipeline.nodes), ['', 'p1', 'p2'])
+        self.assertEqual(pipeline.node_position['p2'], (400., -200.))
+
+    def test_xml_pipeline(self):
+        pipeline_class = create_xml_pipeline(__name__, None, self.xml_file)
+        self.assertEqual(len(self.cache_files()), 1)
+        cached_class = create_xml_pipeline(__name__, None, self.xml_file)
+        # the second class has been loaded from the cache
+        self.assertEqual(self.parsed, [self.xml_file])
+        self.assertTrue(cached_class is not pipeline_class)
+        self.assertEqual(cached_class.__name__, pipeline_class.__name__)
+        self.assertEqual(cached_class.__module__, __name__)
+        self.assertEqual(cached_class.__doc__, pipeline_class.__doc__)
+        self.assertEqual(cached_class._pipeline_definition_calls,
+                         pipeline_class._pipeline_definition_calls)
+        self.check_pipeline(cached_class)
+        # a modified description is parsed again
+        with open(self.xml_file) as f:
+            xml = f.read()
+        with open(self.xml_file, 'w') as f:
+            f.write(xml.replace('x="400"', 'x="500"'))
+        modified_class = create_xml_pipeline(__name__, None, self.xml_file)
+        self.assertEqual(len(self.parsed), 2)
+        self.assertEqual(len(self.cache_files()), 2)
+        self.assertEqual(modified_class().node_position['p2'], (500., -200.))
+
+    def test_json_pipeline(self):
+        json_file = osp.join(self.tmp_dir, 'json_pipeline.json')
+        save_json_pipeline(
+            create_xml_pipeline(__name__, None, self.xml_file)(), json_file)
+        pipeline_class = create_json_pipeline(__name__, None, json_file)
+        cached_class = create_json_pipeline(__name__, None, json_file)
+        self.assertEqual(self.parsed, [self.xml_file, json_file])
+        self.assertEqual(cached_class._pipeline_definition_calls,
+                         pipeline_class._pipeline_definition_calls)
+        self.check_pipeline(cached_class)
+
+    def test_capsul_version(self):
+        create_xml_pipeline(__name__, None, self.xml_file)
+        # another capsul version does not use the cache of this one
+        capsul_version = pipeline_cache.capsul_version
+        pipeline_cache.capsul_version = capsul_version + '.upgraded'
+        try:
+            self.check_pipeline(
+                create_xml_pipeline(__name__, None, self.xml_file))
+        finally:
+            pipeline_cache.capsul_version = capsul_version
+        self.assertEqual(len(self.parsed), 2)
+        self.assertEqual(len(self.cache_files()), 2)
+
+    def test_disabled(self):
+        pipeline_cache.enabled = False
+        try:
+            create_xml_pipeline(__name__, None, self.xml_file)
+            create_xml_pipeline(__name__, None, self.xml_file)
+        finally:
+            pipeline_cache.enabled = True
+        self.assertEqual(len(self.parsed), 2)
+        self.assertFalse(osp.exists(self.cache_dir))
+
+    def test_invalid_cache(self):
+        create_xml_pipeline(__name__, None, self.xml_file)
+        py_file = osp.join(self.cache_dir, self.cache_files()[0])
+        with open(py_file, 'w') as f:
+            f.write('invalid python')
+        self.check_pipeline(
+            create_xml_pipeline(__name__, None, self.xml_file))
+        self.assertEqual(len(self.parsed), 2)
+        # the cache has been written again
+        self.check_pipeline(
+            create_xml_pipeline(__name__, None, self.xml_file))
+        self.assertEqual(len(self.parsed), 2)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPipelineCache)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
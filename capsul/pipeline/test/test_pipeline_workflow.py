@@ -6,7 +6,8 @@ import unittest
 import os
 import os.path as osp
 import sys
-from traits.api import File, List
+import json
+from traits.api import File, List, Undefined
 from capsul.api import Process
 from capsul.api import Pipeline, PipelineNode
 from capsul.pipeline import pipeline_workflow
@@ -155,6 +156,36 @@ class DummyPipelineIterSimple(Pipeline):
         self.export_parameter('dummy_iter', 'output', 'intermediate')
 
 
+class DummyChainPipeline(Pipeline):
+
+    def pipeline_definition(self):
+        self.add_process(
+            "node1",
+            'capsul.pipeline.test.test_pipeline_workflow.DummyProcess')
+        self.add_process(
+            "node2",
+            'capsul.pipeline.test.test_pipeline_workflow.DummyProcess')
+        self.add_process(
+            "node3",
+            'capsul.pipeline.test.test_pipeline_workflow.DummyProcess')
+        self.add_link("node1.output->node2.input")
+        self.add_link("node2.output->node3.input")
+        self.export_parameter("node3", "output")
+
+
+class DummyNestedChainPipeline(Pipeline):
+
+    def pipeline_definition(self):
+        self.add_process(
+            "node0",
+            'capsul.pipeline.test.test_pipeline_workflow.DummyProcess')
+        self.add_process(
+            "chain",
+            'capsul.pipeline.test.test_pipeline_workflow.DummyChainPipeline')
+        self.add_link("node0.output->chain.input")
+        self.export_parameter("chain", "output")
+
+
 class TestPipelineWorkflow(unittest.TestCase):
 
     _swf_dir = None
@@ -279,6 +310,49 @@ class TestPipelineWorkflow(unittest.TestCase):
             raise ValueError('workflow should have failed due to a missing '
                 'temporary file')
 
+    def test_path_prefix_index(self):
+        index = pipeline_workflow.PathPrefixIndex(
+            {'/data/shared': ('ns', 'uuid1'),
+             '/data/shared/sub/': ('ns', 'uuid2'),
+             '/home': ('ns2', 'uuid3')})
+        self.assertEqual(index.find('/data/shared/a/b.nii'),
+                         ('/data/shared', 'a/b.nii', ('ns', 'uuid1')))
+        self.assertEqual(index.find('/data/shared/sub/c.nii'),
+                         ('/data/shared/sub/', 'c.nii', ('ns', 'uuid2')))
+        self.assertEqual(index.find('/data/shared'), None)
+        self.assertEqual(index.find('/data/sharedfile'), None)
+        self.assertEqual(index.find('/tmp/x'), None)
+        self.assertEqual(index.find(Undefined), None)
+        self.assertEqual(pipeline_workflow.PathPrefixIndex([]).find('/a/b'),
+                         None)
+
+    def test_incremental_wf(self):
+        self.pipeline.enable_all_pipeline_steps()
+        job_cache = pipeline_workflow.WorkflowJobCache()
+        wf1 = pipeline_workflow.workflow_from_pipeline(
+            self.pipeline, study_config=self.study_config,
+            create_directories=False, job_cache=job_cache)
+        self.assertEqual(job_cache.misses, 4)
+        wf2 = pipeline_workflow.workflow_from_pipeline(
+            self.pipeline, study_config=self.study_config,
+            create_directories=False, job_cache=job_cache)
+        self.assertEqual(job_cache.hits, 4)
+        self.assertEqual(set(wf1.jobs), set(wf2.jobs))
+        # change a parameter of a single node: only its job is rebuilt
+        self.pipeline.output3 = osp.join(self.tmpdir, 'file_out3_bis.nii')
+        wf3 = pipeline_workflow.workflow_from_pipeline(
+            self.pipeline, study_config=self.study_config,
+            create_directories=False, job_cache=job_cache)
+        self.assertEqual(job_cache.hits, 3)
+        self.assertEqual(job_cache.misses, 1)
+        jobs = dict((job.name, job) for job in wf2.jobs)
+        for job in wf3.jobs:
+            if job.name == 'node4':
+                self.assertTrue(job is not jobs['node4'])
+            else:
+                self.assertTrue(job is jobs[job.name])
+        self.assertEqual(len(wf3.dependencies), 3)
+
     def test_wf_run(self):
         print()
         engine = self.study_config.engine
@@ -348,6 +422,141 @@ class TestPipelineWorkflow(unittest.TestCase):
             #print(text)
             self.assertEqual(len(text.split('\n')), olen)
 
+    def test_sharded_iter_workflow(self):
+        engine = self.study_config.engine
+        pipeline = engine.get_iteration_pipeline(
+            'dummy_iter_pipeline', 'dummy_iter',
+            'capsul.pipeline.test.test_pipeline_workflow.DummyProcess',
+            iterative_plugs=['input', 'output'])
+        niter = 3
+        pipeline.input = [osp.join(self.tmpdir, 'file_in%d' % i)
+                          for i in range(niter)]
+        pipeline.output = [osp.join(self.tmpdir, 'file_out%d' % i)
+                           for i in range(niter)]
+
+        wfs = pipeline_workflow.workflow_shards_from_pipeline(
+            pipeline, 2, study_config=self.study_config,
+            create_directories=False)
+        self.assertEqual(len(wfs), 2)
+        self.assertEqual([wf.shard for wf in wfs], [(0, 1), (1, 3)])
+        # iterated jobs + map / reduce
+        self.assertEqual([len(wf.jobs) for wf in wfs], [3, 4])
+        self.assertEqual(pipeline.input,
+                         [osp.join(self.tmpdir, 'file_in%d' % i)
+                          for i in range(niter)])
+        self.assertEqual(len(pipeline.output), niter)
+
+        for i, filein in enumerate(pipeline.input):
+            with open(filein, 'w') as f:
+                print('MAIN INPUT %d' % i, file=f)
+
+        exec_id = engine.start(pipeline, shards=2)
+        self.exec_ids.append(exec_id)
+        self.assertEqual(len(exec_id.workflow_ids), 2)
+        status = engine.wait(exec_id, pipeline=pipeline)
+        self.assertEqual(status, 'workflow_done')
+        for fileout in pipeline.output:
+            self.assertTrue(osp.exists(fileout))
+
+    def test_pack_small_jobs(self):
+        engine = self.study_config.engine
+        pipeline = engine.get_process_instance(DummyChainPipeline)
+        pipeline.input = osp.join(self.tmpdir, 'file_in')
+        pipeline.output = osp.join(self.tmpdir, 'file_out')
+        wf = pipeline_workflow.workflow_from_pipeline(
+            pipeline, study_config=self.study_config,
+            create_directories=False)
+        self.assertEqual(len(wf.jobs), 3)
+        # not small: nothing to pack
+        wf2 = pipeline_workflow.pack_small_jobs(wf)
+        self.assertTrue(wf2 is wf)
+        wf2 = pipeline_workflow.pack_small_jobs(
+            wf, runtime_estimates={
+                'capsul.pipeline.test.test_pipeline_workflow.DummyProcess':
+                    0.1})
+        self.assertEqual(len(wf2.jobs), 1)
+        self.assertEqual(len(wf2.dependencies), 0)
+        job = wf2.jobs[0]
+        self.assertEqual(
+            [item['name'] for item in job.param_dict['capsul_batch']],
+            ['node1', 'node2', 'node3'])
+        outputs = pipeline_workflow.job_output_params(
+            job, {'0.a': 1, '2.b': 2})
+        self.assertEqual(outputs[0][1], {'a': 1})
+        self.assertEqual(outputs[1][1], {})
+        self.assertEqual(outputs[2][1], {'b': 2})
+        wf3 = pipeline_workflow.pack_small_jobs(
+            wf, runtime_estimates={'node1': 0.1, 'node2': 0.1})
+        self.assertEqual(len(wf3.jobs), 2)
+        self.assertEqual(len(wf3.dependencies), 1)
+
+        with open(pipeline.input, 'w') as f:
+            print('MAIN INPUT', file=f)
+        exec_id = engine.start(pipeline, workflow=wf2)
+        self.exec_ids.append(exec_id)
+        status = engine.wait(exec_id, pipeline=pipeline)
+        self.assertEqual(status, 'workflow_done')
+        with open(pipeline.output) as f:
+            text = f.read()
+            self.assertEqual(len(text.split('\n')), 5)
+
+    def test_pack_small_jobs_groups(self):
+        engine = self.study_config.engine
+        pipeline = engine.get_process_instance(DummyNestedChainPipeline)
+        pipeline.input = osp.join(self.tmpdir, 'file_in')
+        pipeline.output = osp.join(self.tmpdir, 'file_out')
+        wf = pipeline_workflow.workflow_from_pipeline(
+            pipeline, study_config=self.study_config,
+            create_directories=False)
+        self.assertEqual(len(wf.groups), 1)
+        group = wf.groups[0]
+        group_elements = list(group.elements)
+        root_group = list(wf.root_group)
+        wf2 = pipeline_workflow.pack_small_jobs(
+            wf, runtime_estimates={
+                'capsul.pipeline.test.test_pipeline_workflow.DummyProcess':
+                    0.1})
+        self.assertEqual(len(wf2.jobs), 1)
+        # the input workflow is not modified
+        self.assertEqual(len(wf.jobs), 4)
+        self.assertTrue(wf.groups[0] is group)
+        self.assertEqual(group.elements, group_elements)
+        self.assertEqual(wf.root_group, root_group)
+        # the new workflow has its own groups, with the batch job
+        self.assertEqual(len(wf2.groups), 1)
+        self.assertTrue(wf2.groups[0] is not group)
+        self.assertEqual(wf2.groups[0].name, group.name)
+        self.assertTrue(wf2.groups[0] in wf2.root_group)
+        elements = wf2.root_group + wf2.groups[0].elements
+        self.assertEqual(
+            [e for e in elements if e in wf2.jobs], wf2.jobs)
+
+    def test_memory_workflow(self):
+        engine = self.study_config.engine
+        pipeline = engine.get_process_instance(DummyChainPipeline)
+        pipeline.input = osp.join(self.tmpdir, 'file_in')
+        pipeline.output = osp.join(self.tmpdir, 'file_out')
+        cachedir = osp.join(self.tmpdir, 'cache')
+        wf = pipeline_workflow.workflow_from_pipeline(
+            pipeline, study_config=self.study_config,
+            create_directories=False, memory=cachedir)
+        self.assertEqual([job.env for job in wf.jobs],
+                         [{'CAPSUL_MEMORY': cachedir}] * 3)
+        with open(pipeline.input, 'w') as f:
+            print('MAIN INPUT', file=f)
+        exec_id = engine.start(pipeline, workflow=wf)
+        self.exec_ids.append(exec_id)
+        status = engine.wait(exec_id, pipeline=pipeline)
+        self.assertEqual(status, 'workflow_done')
+        with open(pipeline.output) as f:
+            text = f.read()
+            self.assertEqual(len(text.split('\n')), 5)
+        with open(osp.join(cachedir, 'capsul_memory',
+                           'cache_index.json')) as f:
+            entries = json.load(f)
+        # each job has stored its results in the cache
+        self.assertEqual(len(entries), 3)
+
     def test_iter_workflow(self):
         engine = self.study_config.engine
         pipeline = engine.get_process_instance(DummyPipelineIter)
@@ -22,6 +22,7 @@ from soma.sorted_dictionary import OrderedDict
 
 from capsul.process.xml import string_to_value
 from capsul.pipeline.pipeline_construction import PipelineConstructor
+from capsul.pipeline import pipeline_cache
 from capsul.pipeline.pipeline_nodes import PipelineNode
 from soma.controller import Controller
 
@@ -31,6 +32,10 @@ from traits.api import Undefined
 def create_xml_pipeline(module, name, xml_file):
     """
     Create a pipeline class given its Capsul XML 2.0 representation.
+
+    Pipeline classes created from XML files are stored in the
+    :mod:`~capsul.pipeline.pipeline_cache`, so that a file is only parsed
+    again when it is modified.
     
     Parameters
     ----------
@@ -42,6 +47,17 @@ def create_xml_pipeline(module, name, xml_file):
     xml_file: str (mandatory)
         name of file containing the XML description or XML string.
     
+    """
+    if isinstance(xml_file, six.string_types) and os.path.isfile(xml_file):
+        return pipeline_cache.cached_pipeline_class(
+            _create_xml_pipeline, module, name, xml_file)
+    return _create_xml_pipeline(module, name, xml_file)
+
+
+def _create_xml_pipeline(module, name, xml_file):
+    """
+    Create a pipeline class given its Capsul XML 2.0 representation, without
+    using the cache. See :func:`create_xml_pipeline`.
     """
     if hasattr(xml_file, 'read') or os.path.exists(xml_file):
         xml_pipeline = ET.parse(xml_file).getroot()
@@ -688,11 +688,95 @@ class Process(six.with_metaclass(ProcessMeta, Controller)):
         If the process has outputs, the ``SOMAWF_OUTUT_PARAMS`` environment
         variable should contain the location of an output file which will be
         written with a dict containing output parameters values.
+
+        If the ``CAPSUL_MEMORY`` environment variable is set, it is the
+        smart-caching directory where the process results are looked up
+        before running it, and stored afterwards (see
+        :class:`~capsul.study_config.memory.Memory`).
+
+        The engine used to run the process uses read-only settings (see
+        :meth:`_commandline_engine`), thus does not create a settings
+        database.
         '''
-        from capsul.engine import capsul_engine
+        params_conf = Process._commandline_input_params()
+        ce = Process._commandline_engine(params_conf)
+        configuration = params_conf.get('configuration_dict')
+        params = params_conf.get('parameters', {})
+        ## filter out undefined values -- maybe this is not OK in all cases:
+        ## we may want to manually reset a parameter, but in normal cases,
+        ## Undefined values are just not set, which means that the values are
+        ## left to defaults depending on the global config: nipype works like
+        ## this for matlab parameters.
+        #params = dict([(k, v) for k, v in params.items()
+                       #if v is not Undefined])
 
-        ce = capsul_engine()
+        process, result = Process._run_with_params(
+            ce, process_definition, params, configuration)
+        Process._write_commandline_output_params(
+            Process._commandline_output_params(process, result))
 
+        # if there was no exception, we assume the process has succeeded.
+        # sys.exit(0)
+        # no error, do a dirty exit, but avoid cleanup crashes after the
+        # process has succeeded...
+        os._exit(0)
+
+    @staticmethod
+    def run_batch_from_commandline():
+        '''
+        Run a batch of processes in sequence from a commandline call, in a
+        single python interpreter. Such batch jobs are built by
+        :func:`~capsul.pipeline.pipeline_workflow.pack_small_jobs`.
+
+        Input parameters are passed through a JSON file, as in
+        :meth:`run_from_commandline`. The ``capsul_batch`` parameter lists the
+        processes to run (process definition and parameters prefix), and
+        parameters of each process are prefixed by the process prefix. The
+        ``capsul_batch_links`` parameter lists the links between outputs of a
+        process and inputs of a later one in the batch, as lists
+        ``[dest_index, dest_param, source_index, source_param]``.
+
+        Output parameters of all processes are written in the output
+        parameters file, also prefixed. Each process of the batch uses the
+        ``CAPSUL_MEMORY`` smart-caching directory, if it is set.
+        '''
+        params_conf = Process._commandline_input_params()
+        ce = Process._commandline_engine(params_conf)
+        configuration = params_conf.get('configuration_dict')
+        params = params_conf.get('parameters', {})
+        batch = params.get('capsul_batch', [])
+        links = params.get('capsul_batch_links', [])
+
+        outputs = []
+        all_output_params = {}
+        for index, item in enumerate(batch):
+            prefix = item['prefix']
+            sub_params = dict([(param[len(prefix):], value)
+                               for param, value in six.iteritems(params)
+                               if param.startswith(prefix)])
+            for dest_index, dest_param, src_index, src_param in links:
+                if dest_index == index and src_param in outputs[src_index]:
+                    sub_params[dest_param] = outputs[src_index][src_param]
+            process, result = Process._run_with_params(
+                ce, item['process'], sub_params, configuration)
+            output_params = Process._commandline_output_params(process,
+                                                               result)
+            outputs.append(output_params)
+            all_output_params.update(
+                [(prefix + param, value)
+                 for param, value in six.iteritems(output_params)])
+        Process._write_commandline_output_params(all_output_params)
+
+        # no error, do a dirty exit, but avoid cleanup crashes after the
+        # processes have succeeded...
+        os._exit(0)
+
+    @staticmethod
+    def _commandline_input_params():
+        '''
+        Read the input parameters file of a commandline call, and activate
+        the configuration it contains.
+        '''
         param_file = os.environ.get('SOMAWF_INPUT_PARAMS')
 
         # fix expandvars problem when the env var SOMAWF_OUTPUT_PARAMS is
@@ -723,15 +807,43 @@ class Process(six.with_metaclass(ProcessMeta, Controller)):
             engine.activated_modules = set()
             engine.activate_configuration(configuration)
 
-        params = params_conf.get('parameters', {})
-        ## filter out undefined values -- maybe this is not OK in all cases:
-        ## we may want to manually reset a parameter, but in normal cases,
-        ## Undefined values are just not set, which means that the values are
-        ## left to defaults depending on the global config: nipype works like
-        ## this for matlab parameters.
-        #params = dict([(k, v) for k, v in params.items()
-                       #if v is not Undefined])
+        return params_conf
+
+    @staticmethod
+    def _commandline_engine(params_conf):
+        '''
+        Build the engine of a commandline call. Its settings are read-only
+        :class:`~capsul.engine.settings.FrozenSettings`, loaded from the
+        snapshot file given in the ``CAPSUL_SETTINGS_SNAPSHOT`` environment
+        variable (see :meth:`~capsul.engine.settings.Settings.save_snapshot`)
+        if it is set, or built from the ``configuration_dict`` of input
+        parameters. Only the modules having configurations in these settings
+        are loaded. Without any of them, a default engine is built.
+        '''
+        from capsul.engine import capsul_engine
+        from capsul.engine.settings import FrozenSettings
+
+        snapshot = os.environ.get('CAPSUL_SETTINGS_SNAPSHOT')
+        if snapshot:
+            return capsul_engine(settings_snapshot=snapshot)
+        configuration = params_conf.get('configuration_dict')
+        if configuration:
+            return capsul_engine(
+                settings_snapshot=FrozenSettings.from_configuration(
+                    configuration))
+        return capsul_engine()
 
+    @staticmethod
+    def _run_with_params(ce, process_definition, params, configuration):
+        '''
+        Instantiate a process, set its parameters and run it in a temporary
+        working directory, using the ``CAPSUL_MEMORY`` smart-caching
+        directory if it is set.
+
+        Returns
+        -------
+        (process, result)
+        '''
         process = ce.get_process_instance(process_definition)
         try:
             process.import_from_dict(params)
@@ -744,10 +856,45 @@ class Process(six.with_metaclass(ProcessMeta, Controller)):
         cwd = os.getcwd()
         with tempfile.TemporaryDirectory() as temp_work_dir:
             os.chdir(temp_work_dir)
-            result = ce.study_config.run(process,
-                                         configuration_dict=configuration)
+            result = ce.study_config.run(
+                process, configuration_dict=configuration,
+                memory=os.environ.get('CAPSUL_MEMORY') or None)
             os.chdir(cwd)
-        # collect output parameters
+        return process, result
+
+    @staticmethod
+    def _commandline_output_params(process, result):
+        '''
+        Get the output parameters of a process run from a commandline call,
+        which have to be written in the output parameters file.
+        '''
+        if result is None:
+            result = {}
+        output_params = {}
+        reserved_params = ("nodes_activation", "selection_changed")
+        for param, trait in six.iteritems(process.user_traits()):
+            if param in reserved_params or not trait.output:
+                continue
+            if isinstance(trait.trait_type, (File, Directory)) \
+                    and trait.input_filename is not False:
+                continue
+            elif isinstance(trait.trait_type, List) \
+                    and isinstance(trait.inner_traits[0].trait_type,
+                                   (File, Directory)) \
+                    and trait.inner_traits[0].trait_type.input_filename \
+                        is not False \
+                    and trait.input_filename is not False:
+                continue
+            output_params[param] = getattr(process, param)
+        output_params.update(result)
+        return output_params
+
+    @staticmethod
+    def _write_commandline_output_params(output_params):
+        '''
+        Write output parameters in the file given in the
+        ``SOMAWF_OUTPUT_PARAMS`` environment variable, if any.
+        '''
         out_param_file = os.environ.get('SOMAWF_OUTPUT_PARAMS')
 
         # fix expandvars problem when the env var SOMAWF_OUTPUT_PARAMS is
@@ -760,35 +907,10 @@ class Process(six.with_metaclass(ProcessMeta, Controller)):
                               '${SOMAWF_OUTPUT_PARAMS}'):
             out_param_file = None
 
-        output_params = {}
         if out_param_file:
-            if result is None:
-                result = {}
-            reserved_params = ("nodes_activation", "selection_changed")
-            for param, trait in six.iteritems(process.user_traits()):
-                if param in reserved_params or not trait.output:
-                    continue
-                if isinstance(trait.trait_type, (File, Directory)) \
-                        and trait.input_filename is not False:
-                    continue
-                elif isinstance(trait.trait_type, List) \
-                        and isinstance(trait.inner_traits[0].trait_type,
-                                       (File, Directory)) \
-                        and trait.inner_traits[0].trait_type.input_filename \
-                            is not False \
-                        and trait.input_filename is not False:
-                    continue
-                output_params[param] = getattr(process, param)
-            output_params.update(result)
             with open(out_param_file, 'w') as f:
                 json.dump(json_utils.to_json(output_params), f)
 
-        # if there was no exception, we assume the process has succeeded.
-        # sys.exit(0)
-        # no error, do a dirty exit, but avoid cleanup crashes after the
-        # process has succeeded...
-        os._exit(0)
-
     def get_log(self):
         """ Load the logging file.
 
@@ -58,24 +58,17 @@ Functions
 
 """
 
-from capsul.api import StudyConfig
-from capsul.api import capsul_engine
-from capsul.api import Pipeline
-from capsul.attributes.completion_engine import ProcessCompletionEngine
+# capsul, traits and the completion system are imported in functions, so
+# that commandline options are parsed (and --help is answered) before they
+# are loaded.
 import os
 import os.path as osp
 import logging
 import sys
 import re
 from optparse import OptionParser, OptionGroup
-from traits.api import Undefined, List
 import tempfile
 import subprocess
-try:
-    import yaml
-except ImportError:
-    yaml = None
-    import json
 import six
 
 # Define the logger
@@ -90,6 +83,8 @@ class ProcessParamError(Exception):
 
 def set_process_param_from_str(process, k, arg):
     """Set a process parameter from a string representation."""
+    from capsul.pipeline.pipeline import Pipeline
+
     if '.' in k:
         sub_node_name, k2 = k.split('.', 1)
         sub_node = process.nodes.get(sub_node_name)
@@ -152,6 +147,9 @@ def get_process_with_params(process_name, study_config, iterated_params=[],
     -------
     process: Process instance
     '''
+    from capsul.pipeline.pipeline import Pipeline
+    from capsul.attributes.completion_engine import ProcessCompletionEngine
+
     process = study_config.get_process_instance(process_name)
     signature = process.user_traits()
     params = list(signature.keys())
@@ -267,6 +265,18 @@ def run_process_with_distribution(
     return res
 
 
+def _load_config_file(f):
+    '''
+    Read a YAML configuration file (JSON if yaml is not installed)
+    '''
+    try:
+        import yaml
+    except ImportError:
+        import json
+        return json.load(f)
+    return yaml.load(f, Loader=yaml.SafeLoader)
+
+
 def convert_commandline_parameter(i):
     if len(i) > 0 and ( i[0] in '[({' or i in ( 'None', 'True', 'False' ) ):
         try:
@@ -465,6 +475,11 @@ def main():
                 setattr(options, k, v)
         args += new_args
 
+    from capsul.engine import capsul_engine
+    from capsul.study_config.study_config import StudyConfig
+    from capsul.attributes.completion_engine import ProcessCompletionEngine
+    from traits.api import Undefined, List
+
     engine = capsul_engine()
     engine.load_modules(['fom', 'axon'])
     study_config = engine.study_config
@@ -481,20 +496,14 @@ def main():
             subprocess.check_call(cmd)
             config_file = tmp[1]
         with open(config_file) as f:
-            if yaml:
-                conf = yaml.load(f, Loader=yaml.SafeLoader)
-            else:
-                conf = json.load(f)
+            conf = _load_config_file(f)
         if tmp:
             os.unlink(tmp[1])
         for env, c in conf.items():
             engine.import_configs(env, c)
     elif options.studyconfig:
         with open(options.studyconfig) as f:
-            if yaml:
-                scdict = yaml.load(f, Loader=yaml.SafeLoader)
-            else:
-                scdict = json.load(f)
+            scdict = _load_config_file(f)
         study_config.set_study_configuration(scdict)
         engine = study_config.engine
     else:
@@ -13,16 +13,12 @@ Functions
 # System import
 from __future__ import absolute_import
 import logging
-import traceback
 import os
 import json
 import sys
-from setuptools import find_packages
-from inspect import isclass
 
 # CAPSUL import
-from capsul.api import Pipeline
-from capsul.api import Process
+from capsul.utils.process_registry import default_registry
 
 # Define the logger
 logger = logging.getLogger(__name__)
@@ -82,7 +78,9 @@ def find_pipeline_and_process(module_name):
     """ Function that return all the Pipeline and Process classes of a module.
 
     All the mdoule path are scanned recuresively. Any pipeline or process will
-    be added to the output.
+    be added to the output. Processes are found using the process registry
+    (see :mod:`capsul.utils.process_registry`), which avoids importing
+    modules.
 
     Parameters
     ----------
@@ -97,68 +95,26 @@ def find_pipeline_and_process(module_name):
         found in the module.
     """
 
-    # Try to import the module
+    # Find processes in module sources, modules are only imported if
+    # processes cannot be found statically
     try:
-        __import__(module_name)
+        processes = default_registry().module_processes(module_name)
     except ImportError:
         logger.error("Can't load module {0}".format(module_name))
         return {}, []
 
-    # Get the module path
-    module = sys.modules[module_name]
-    if hasattr(module, '__path__'):
-        module_path = module.__path__[0]
-    else:
-        module_path = os.path.dirname(module.__file__)
-
-    # Use setuptools to go through the module
-    sub_modules = find_packages(where=module_path, exclude=("doc", ))
-    sub_modules = [module_name + "." + x for x in sub_modules]
-    sub_modules.insert(0, module_name)
-    logger.debug("Modules found with setuptools: '{0}'.".format(sub_modules))
-
-    # Shift
-    shift = len(module_name.split("."))
-
     # Create a set with all pipelines and process
     pip_and_proc = [set(), set()]
-    for sub_module in sub_modules:
-        # Get the sub module path
-        sub_module_path = os.path.join(
-            module_path, *sub_module.split(".")[shift:])
-
-        # List all the module in submodule path
-        sub_sub_module_names = [
-            sub_module + "." + x[:-3] for x in os.listdir(sub_module_path)
-            if (x.endswith(".py") and not x.startswith("_"))]
-
-        # Try to import the sub sub module
-        for sub_sub_module_name in sub_sub_module_names:
-            try:
-                __import__(sub_sub_module_name)
-            except ImportError:
-                exc_info = sys.exc_info()
-                logger.error("".join(traceback.format_exception(*exc_info)))
-                logger.error("Can't load module "
-                              "{0}".format(sub_sub_module_name))
-                continue
-
-            # Get the module
-            sub_sub_module = sys.modules[sub_sub_module_name]
-
-            # From all the tools, find Pipeline instance
-            for tool_name in dir(sub_sub_module):
-                if tool_name.startswith("_"):
-                    continue
-                tool = getattr(sub_sub_module, tool_name)
-                # Check all the authorized derived class
-                parent_classes = [Pipeline, Process]
-                for cnt, parent_class in enumerate(parent_classes):
-                    if (isclass(tool) and issubclass(tool, parent_class)) \
-                            and tool not in parent_classes:
-                        pip_and_proc[cnt].add(
-                            sub_sub_module_name + "." + tool_name)
-                        break
+    for process_id, kind in processes:
+        sub_module_names = process_id.split(".")[:-1]
+        # Skip private modules and documentation
+        if sub_module_names[-1].startswith("_") or "doc" in sub_module_names:
+            continue
+        if kind == "pipeline":
+            pip_and_proc[0].add(process_id)
+        elif kind == "process":
+            pip_and_proc[1].add(process_id)
+
     # Format output
     output = {
         "pipeline_descs": list(pip_and_proc[0]),
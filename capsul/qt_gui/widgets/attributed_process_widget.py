@@ -59,6 +59,13 @@ class AttributedProcessWidget(QtGui.QWidget):
         self.user_data = user_data
         self.separate_outputs = separate_outputs
         self._userlevel = userlevel
+        # attributes changes are gathered and completion is run once they
+        # stop for completion_delay milliseconds
+        self.completion_delay = 300
+        self._completion_timer = QtCore.QTimer()
+        self._completion_timer.setSingleShot(True)
+        self._completion_timer.timeout.connect(
+            self._complete_changed_attributes)
 
         process = attributed_process
         completion_engine = getattr(process, 'completion_engine', None)
@@ -184,7 +191,7 @@ class AttributedProcessWidget(QtGui.QWidget):
                 override_control_types=control_types_a, user_data=user_data,
                 userlevel=userlevel)
             completion_engine.get_attribute_values().on_trait_change(
-                completion_engine.attributes_changed, 'anytrait')
+                self._attributes_changed, 'anytrait', dispatch='ui')
         else:
             self.controller_widget2 = CWidgetClass(
                 Controller(), override_control_types=control_types_a,
@@ -230,7 +237,7 @@ class AttributedProcessWidget(QtGui.QWidget):
                                    'completion_engine', None)
         if completion_engine is not None:
             completion_engine.get_attribute_values().on_trait_change(
-                completion_engine.attributes_changed, 'anytrait', remove=True)
+                self._attributes_changed, 'anytrait', remove=True)
             completion_engine.on_trait_change(
                 self._completion_progress_changed, 'completion_progress',
                 remove=True)
@@ -322,7 +329,7 @@ class AttributedProcessWidget(QtGui.QWidget):
             if completion_engine is None:
                 return
             completion_engine.get_attribute_values().on_trait_change(
-                completion_engine.attributes_changed, 'anytrait')
+                self._attributes_changed, 'anytrait', dispatch='ui')
             try:
                 # WARNING: is it necessary to reset all this ?
                 # create_completion() will do the job anyway ?
@@ -366,8 +373,7 @@ class AttributedProcessWidget(QtGui.QWidget):
                                         'completion_engine', None)
             if completion_engine is not None:
                 completion_engine.get_attribute_values().on_trait_change(
-                    completion_engine.attributes_changed, 'anytrait',
-                    remove=True)
+                    self._attributes_changed, 'anytrait', remove=True)
                 self.btn_show_completion.setChecked(True)
 
     def show_completion(self, visible=None):
@@ -429,6 +435,25 @@ class AttributedProcessWidget(QtGui.QWidget):
         '''
         self.show_completion(visible)
 
+    def _attributes_changed(self, obj, name, old, new):
+        '''
+        Record an attribute change, and (re)start the completion timer
+        '''
+        completion_engine = getattr(self.attributed_process,
+                                    'completion_engine', None)
+        if completion_engine is None \
+                or name in ('trait_added', 'user_traits_changed') \
+                or completion_engine.completion_ongoing:
+            return
+        completion_engine.changed_attributes.add(name)
+        self._completion_timer.start(self.completion_delay)
+
+    def _complete_changed_attributes(self):
+        completion_engine = getattr(self.attributed_process,
+                                    'completion_engine', None)
+        if completion_engine is not None:
+            completion_engine.complete_changed_attributes()
+
     def _completion_progress_changed(self, obj, name, old, new):
         completion_engine = getattr(self.attributed_process,
                                     'completion_engine', None)
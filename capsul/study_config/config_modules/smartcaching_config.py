@@ -9,7 +9,7 @@ Classes
 '''
 
 from __future__ import absolute_import
-from traits.api import Bool, Undefined
+from traits.api import Bool, Enum, Undefined
 from capsul.study_config.study_config import StudyConfigModule
 
 
@@ -23,5 +23,12 @@ class SmartCachingConfig(StudyConfigModule):
             output=False,
             desc='Use smart-caching during the execution',
             groups=['smartcaching']))
+        study_config.add_trait('smart_caching_fingerprint', Enum(
+            'stat', 'content',
+            output=False,
+            desc='How input files are identified by smart-caching: '
+            '"stat" uses their mtime and size, "content" uses a digest of '
+            'their content',
+            groups=['smartcaching']))
         self.study_config = study_config
         # self.study_config.on_trait_change(self._use_smart_caching_changed, 'use_smart_caching')
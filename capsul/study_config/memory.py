@@ -8,8 +8,16 @@ Classes
 ---------------------------
 :class:`MemorizedProcess`
 -------------------------
+:class:`FileLock`
+-----------------
+:class:`FileDigestIndex`
+------------------------
 :class:`CapsulResultEncoder`
 ----------------------------
+:class:`CacheIndex`
+-------------------
+:class:`CacheStats`
+-------------------
 :class:`Memory`
 ---------------
 
@@ -21,6 +29,12 @@ Functions
 ---------------------
 :func:`file_fingerprint`
 ------------------------
+:func:`file_digest`
+-------------------
+:func:`directory_size`
+----------------------
+:func:`store_file`
+------------------
 '''
 
 # System import
@@ -28,13 +42,16 @@ from __future__ import with_statement
 from __future__ import absolute_import
 from __future__ import print_function
 import os
+import errno
 import hashlib
 import time
 import shutil
+import tempfile
 import json
 import logging
 import six
 import sys
+import threading
 
 # CAPSUL import
 from capsul.process.process import Process, ProcessResult
@@ -194,7 +211,9 @@ class MemorizedProcess(object):
     structure. Methods are provided to inspect the cache or clean it.
     """
 
-    def __init__(self, process, cachedir, timestamp=None, verbose=1):
+    def __init__(self, process, cachedir, timestamp=None, verbose=1,
+                 digest_index=None, cache_index=None, storage="copy",
+                 wait=True, stats=None):
         """ Initialize the MemorizedProcess class.
 
         Parameters
@@ -211,6 +230,23 @@ class MemorizedProcess(object):
             is called.
         verbose: int
             if different from zero, print console messages.
+        digest_index: FileDigestIndex (optional)
+            if given, input files are fingerprinted using their content
+            digest rather than their mtime and size.
+        cache_index: CacheIndex (optional)
+            if given, cache entries creation and accesses are recorded in
+            this index, which may evict old entries.
+        storage: string (optional, default 'copy')
+            how output files are restored from the cache, see
+            :func:`store_file`. They are always stored in the cache as
+            copies (or reflinks in 'reflink' mode), so that cache entries
+            do not share data with workspace files.
+        wait: bool (optional, default True)
+            if another worker is computing the same cache entry, wait for it
+            and use its results, rather than computing them concurrently.
+        stats: CacheStats (optional)
+            the cache statistics to update. A new one is created if not
+            given.
         """
         # Check the a process is passed
         self.process_class = process.__class__
@@ -239,6 +275,17 @@ class MemorizedProcess(object):
         # Store if some messages have to be displayed
         self.verbose = verbose
 
+        self.digest_index = digest_index
+        self.cache_index = cache_index
+        if storage not in STORAGE_STRATEGIES:
+            raise ValueError("storage should be one of {0}, not '{1}'"
+                             .format(", ".join(STORAGE_STRATEGIES), storage))
+        self.storage = storage
+        self.wait = wait
+        if stats is None:
+            stats = CacheStats()
+        self.stats = stats
+
     def __call__(self, **kwargs):
         """ Call wrapped process and cache result, or read cache if
         available.
@@ -260,58 +307,143 @@ class MemorizedProcess(object):
 
         # Create the destination folder and a unique id for the current
         # process
+        start_time = time.time()
         process_dir, process_hash, input_parameters = self._get_process_id()
+        self.stats.add(self.process.id, hash_time=time.time() - start_time)
 
-        # Execute the process
-        if not os.path.isdir(process_dir):
+        # Only one worker computes (or restores) a given entry at a time:
+        # other ones wait for it and then use its results, unless waiting is
+        # disabled
+        start_time = time.time()
+        with FileLock(process_dir + ".lock", self.wait):
+            hit = os.path.isdir(process_dir)
+            self.stats.add(self.process.id,
+                           lookup_time=time.time() - start_time)
+            if not hit:
+                result = self._compute_entry(process_dir, input_parameters)
+            else:
+                result = self._restore_entry(process_dir, input_parameters)
+
+        return result
+
+    def _compute_entry(self, process_dir, input_parameters):
+        """ Execute the process and store its results in a new cache entry.
 
-            # Create the destination memory folder
-            os.makedirs(process_dir)
+        The entry is written in a temporary directory, then renamed, so that
+        other workers never see a partially written entry.
 
-            # Try to execute the process and if an error occurred remove the
-            # cache folder
+        Parameters
+        ----------
+        process_dir: string
+            the cache entry directory.
+        input_parameters: dict
+            the process input_parameters.
+
+        Returns
+        -------
+        result: dict
+            the process results.
+        """
+        start_time = time.time()
+        tmp_dir = tempfile.mkdtemp(
+            prefix=".{0}.".format(os.path.basename(process_dir)),
+            dir=os.path.dirname(process_dir))
+
+        # Try to execute the process and if an error occurred remove the
+        # cache folder
+        try:
+            # Outputs restored as links would be written in place, thus in
+            # the cache entries they are linked to
+            if self.storage in ("hardlink", "symlink"):
+                for name in self.process.traits(output=True):
+                    self._detach_files(self.process.get_parameter(name))
+
+            # Run
+            result = self._call_process(tmp_dir, input_parameters)
+
+            # Save the result files in the memory with the corresponding
+            # mapping
+            output_parameters = {}
+            for name, trait in self.process.traits(output=True).items():
+                # Get the trait value
+                value = self.process.get_parameter(name)
+                output_parameters[name] = value
+            file_mapping = []
+            self._copy_files_to_memory(output_parameters, tmp_dir,
+                                       file_mapping)
+            file_mapping = [
+                (workspace_file, os.path.join(
+                    process_dir, os.path.relpath(memory_file, tmp_dir)))
+                for workspace_file, memory_file in file_mapping]
+            map_fname = os.path.join(tmp_dir, "file_mapping.json")
+            with open(map_fname, "w") as open_file:
+                open_file.write(json.dumps(file_mapping))
+
+            # Publish the entry
             try:
-                # Run
-                result = self._call_process(process_dir, input_parameters)
-
-                # Save the result files in the memory with the corresponding
-                # mapping
-                output_parameters = {}
-                for name, trait in self.process.traits(output=True).items():
-                    # Get the trait value
-                    value = self.process.get_parameter(name)
-                    output_parameters[name] = value
-                file_mapping = []
-                self._copy_files_to_memory(output_parameters, process_dir,
-                                           file_mapping)
-                map_fname = os.path.join(process_dir, "file_mapping.json")
-                with open(map_fname, "w") as open_file:
-                    open_file.write(json.dumps(file_mapping))
-
-            except Exception as e:  # noqa: E722
-                print('error in MemorizedProcess.__call__:', e)
-                shutil.rmtree(process_dir)
-                raise
+                os.rename(tmp_dir, process_dir)
+            except OSError:
+                if not os.path.isdir(process_dir):
+                    raise
+                # published meanwhile by a worker which did not wait
+                shutil.rmtree(tmp_dir)
+
+        except Exception as e:  # noqa: E722
+            print('error in MemorizedProcess.__call__:', e)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        if self.cache_index is not None:
+            self.cache_index.add(process_dir)
+        self.stats.add(self.process.id, misses=1,
+                       compute_time=time.time() - start_time,
+                       bytes_stored=directory_size(process_dir))
 
-        # Restore the process results from the cache folder
-        else:
-            # Restore the memorized files
-            map_fname = os.path.join(process_dir, "file_mapping.json")
-            with open(map_fname, "r") as json_data:
-                file_mapping = json.load(json_data)
+        return result
 
-            # Go through all mapping files
-            for workspace_file, memory_file in file_mapping:
+    def _restore_entry(self, process_dir, input_parameters):
+        """ Restore the process results from a cache entry.
 
-                # Determine if the workspace directory is writeable
-                if os.access(os.path.dirname(workspace_file), os.W_OK):
-                    shutil.copy2(memory_file, workspace_file)
-                else:
-                    logger.debug("Can't restore file '{0}', access rights are "
-                                 "not sufficients.".format(workspace_file))
+        Parameters
+        ----------
+        process_dir: string
+            the cache entry directory.
+        input_parameters: dict
+            the process input_parameters.
 
-            # Update the process output traits
-            result = self._load_process_result(process_dir, input_parameters)
+        Returns
+        -------
+        result: dict
+            the process cached results.
+        """
+        start_time = time.time()
+        restored_bytes = 0
+
+        # Restore the memorized files
+        map_fname = os.path.join(process_dir, "file_mapping.json")
+        with open(map_fname, "r") as json_data:
+            file_mapping = json.load(json_data)
+
+        # Go through all mapping files
+        for workspace_file, memory_file in file_mapping:
+
+            # Determine if the workspace directory is writeable
+            if os.access(os.path.dirname(workspace_file), os.W_OK):
+                store_file(memory_file, workspace_file, self.storage)
+                restored_bytes += os.stat(memory_file).st_size
+            else:
+                logger.debug("Can't restore file '{0}', access rights are "
+                             "not sufficients.".format(workspace_file))
+
+        # Update the process output traits
+        result, runtime = self._load_process_result(process_dir,
+                                                    input_parameters)
+        if self.cache_index is not None:
+            self.cache_index.touch(process_dir)
+        restore_time = time.time() - start_time
+        self.stats.add(self.process.id, hits=1, restore_time=restore_time,
+                       bytes_restored=restored_bytes,
+                       time_saved=max(0., runtime - restore_time))
 
         return result
 
@@ -347,9 +479,36 @@ class MemorizedProcess(object):
                     os.path.isfile(python_object)):
                 fname = os.path.basename(python_object)
                 out = os.path.join(process_dir, fname)
-                shutil.copy2(python_object, out)
+                # a link in the cache would share data with a workspace file
+                # which may change: store actual data
+                storage = ("reflink" if self.storage == "reflink"
+                           else "copy")
+                store_file(python_object, out, storage)
                 file_mapping.append((python_object, out))
 
+    def _detach_files(self, python_object):
+        """ Replace files which are links (symbolic links, or files with
+        several hard links) by copies of their data.
+
+        Parameters
+        ----------
+        python_object: object
+            a generic python object.
+        """
+        if isinstance(python_object, dict):
+            for val in python_object.values():
+                self._detach_files(val)
+        elif isinstance(python_object, (list, tuple)):
+            for val in python_object:
+                self._detach_files(val)
+        elif (python_object is not Undefined and
+                isinstance(python_object, six.string_types) and
+                os.path.isfile(python_object) and
+                (os.path.islink(python_object) or
+                 os.stat(python_object).st_nlink > 1)):
+            store_file(os.path.realpath(python_object), python_object,
+                       "copy")
+
     def _call_process(self, process_dir, input_parameters):
         """ Call a process.
 
@@ -387,7 +546,8 @@ class MemorizedProcess(object):
         # Save the result in json format
         cache = {'parameters': dict((i, getattr(self.process, i)) 
                                     for i in self.process.user_traits()),
-                 'result': result}
+                 'result': result,
+                 'runtime': duration}
         json_data = json.dumps(cache, sort_keys=True,
                                check_circular=True, indent=4,
                                cls=CapsulResultEncoder)
@@ -416,6 +576,8 @@ class MemorizedProcess(object):
         -------
         result: ProcessResult
             the process cached results.
+        runtime: float
+            the recorded process execution time, in seconds.
         """
         # Display an information message
         if self.verbose != 0:
@@ -436,7 +598,7 @@ class MemorizedProcess(object):
         for name, value in six.iteritems(result_dict['parameters']):
             self.process.set_parameter(name, value)
 
-        return result_dict['result']
+        return result_dict['result'], result_dict.get('runtime', 0.)
 
     def _get_process_id(self, **kwargs):
         """ Return the directory in which are persisted the result of the
@@ -507,6 +669,8 @@ class MemorizedProcess(object):
         process_parameters = input_parameters.copy()
         process_parameters = self._add_fingerprints(process_parameters)
         process_parameters["versions"] = self.process.versions
+        if self.digest_index is not None:
+            self.digest_index.save()
 
         # Generate the process hash
         hasher = hashlib.new("md5")
@@ -550,7 +714,7 @@ class MemorizedProcess(object):
             if (python_object is not Undefined and
                     isinstance(python_object, six.string_types) and
                     os.path.isfile(python_object)):
-                out = file_fingerprint(python_object)
+                out = file_fingerprint(python_object, self.digest_index)
 
         return out
 
@@ -570,7 +734,12 @@ class MemorizedProcess(object):
 
         # Guarantee the path exists on the disk
         if not os.path.exists(process_dir):
-            os.makedirs(process_dir)
+            try:
+                os.makedirs(process_dir)
+            except OSError as e:
+                # created meanwhile by a concurrent worker
+                if e.errno != errno.EEXIST:
+                    raise
 
         return process_dir
 
@@ -684,22 +853,33 @@ def has_attribute(trait, attribute_name, attribute_value=None,
     return count > 0
 
 
-def file_fingerprint(a_file):
+def file_fingerprint(a_file, digest_index=None):
     """ Computes the file fingerprint.
 
-    Do not consider the file content, just the fingerprint (ie. the mtime,
-    the size and the file location).
+    By default, do not consider the file content, just the fingerprint (ie.
+    the mtime, the size and the file location). If a
+    :class:`FileDigestIndex` is given, the fingerprint is the file location
+    and a digest of its content, which does not change when the file is
+    copied back or touched, and does change on same-size rewrites.
 
     Parameters
     ----------
     a_file: string
         the file to process.
+    digest_index: FileDigestIndex (optional)
+        if given, use content digests stored in (or added to) this index.
 
     Returns
     -------
-    fingerprint: tuple
-        the file location, mtime and size.
+    fingerprint: dict
+        the file location, mtime and size, or the file location and content
+        digest.
     """
+    if digest_index is not None:
+        return {
+            "name": a_file,
+            "digest": digest_index.digest(a_file)
+        }
     fingerprint = {
         "name": a_file,
         "mtime": None,
@@ -712,6 +892,291 @@ def file_fingerprint(a_file):
     return fingerprint
 
 
+def file_digest(a_file, algorithm=None, chunk_size=1 << 20):
+    """ Computes a digest of the file content.
+
+    The file is read by chunks so that large files are never loaded
+    entirely in memory.
+
+    Parameters
+    ----------
+    a_file: string
+        the file to process.
+    algorithm: string (optional)
+        a :mod:`hashlib` algorithm name. Defaults to BLAKE2b when it is
+        available, MD5 otherwise.
+    chunk_size: int (optional)
+        the read buffer size in bytes.
+
+    Returns
+    -------
+    digest: string
+        the hexadecimal digest, prefixed with the algorithm name.
+    """
+    if algorithm is None:
+        algorithm = ("blake2b" if "blake2b" in hashlib.algorithms_available
+                     else "md5")
+    hasher = hashlib.new(algorithm)
+    with open(a_file, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return "{0}:{1}".format(algorithm, hasher.hexdigest())
+
+
+STORAGE_STRATEGIES = ("copy", "hardlink", "reflink", "symlink")
+
+# Linux FICLONE ioctl request number
+_FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    """ Clone a file using a copy-on-write reflink (Linux filesystems
+    supporting FICLONE, such as btrfs or xfs). Raises OSError or IOError if
+    it is not supported.
+    """
+    import fcntl
+
+    with open(src, "rb") as fsrc:
+        with open(dst, "wb") as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            except Exception:
+                fdst.close()
+                os.unlink(dst)
+                raise
+    shutil.copystat(src, dst)
+
+
+def store_file(src, dst, strategy="copy"):
+    """ Copy or link a file, replacing the destination if it exists.
+
+    Links make storing a file in the cache, or restoring it from the cache,
+    a constant time operation. Whenever the requested strategy is not
+    possible (unsupported by the filesystem, different devices...), the file
+    is copied.
+
+    Parameters
+    ----------
+    src: string
+        the source file.
+    dst: string
+        the destination file.
+    strategy: string (optional, default 'copy')
+        'copy', 'hardlink' (the destination shares the source data, which
+        must thus not be modified in place), 'reflink' (copy-on-write clone,
+        where the filesystem supports it) or 'symlink' (the destination is a
+        symbolic link to the source).
+
+    Returns
+    -------
+    strategy: string
+        the strategy actually used.
+    """
+    if os.path.lexists(dst):
+        if (strategy == "hardlink" and not os.path.islink(dst)
+                and os.path.samefile(src, dst)):
+            return strategy
+        if (strategy == "symlink" and os.path.islink(dst)
+                and os.readlink(dst) == os.path.abspath(src)):
+            return strategy
+    # link or copy into a temporary file, then rename it, so that the
+    # destination is replaced atomically
+    tmp_dst = "{0}.{1}.tmp".format(dst, os.getpid())
+    try:
+        if strategy == "hardlink":
+            os.link(src, tmp_dst)
+        elif strategy == "symlink":
+            os.symlink(os.path.abspath(src), tmp_dst)
+        elif strategy == "reflink":
+            _reflink(src, tmp_dst)
+        else:
+            shutil.copy2(src, tmp_dst)
+    except (OSError, IOError, ImportError, AttributeError) as e:
+        if strategy == "copy":
+            raise
+        logger.debug("Can't {0} '{1}' ({2}), copying it."
+                     .format(strategy, src, e))
+        strategy = "copy"
+        shutil.copy2(src, tmp_dst)
+    getattr(os, "replace", os.rename)(tmp_dst, dst)
+    return strategy
+
+
+class FileLock(object):
+    """ Exclusive lock on a file, shared between processes, to be used as a
+    context manager.
+
+    The lock is an advisory ``flock()`` lock, thus it is only available on
+    POSIX systems: elsewhere, locking silently does nothing.
+    """
+
+    def __init__(self, path, wait=True):
+        """ Initialize the FileLock class.
+
+        Parameters
+        ----------
+        path: string
+            the lock file, created if it does not exist.
+        wait: bool (optional, default True)
+            if True, acquiring the lock blocks until it is released by its
+            current owner. Otherwise, acquiring a lock owned by someone else
+            fails.
+        """
+        self.path = path
+        self.wait = wait
+        self.acquired = False
+        self.supported = True
+        self._file = None
+
+    def acquire(self):
+        """ Acquire the lock.
+
+        Returns
+        -------
+        acquired: bool
+        """
+        try:
+            import fcntl
+        except ImportError:
+            self.supported = False
+            return False
+        flags = fcntl.LOCK_EX
+        if not self.wait:
+            flags |= fcntl.LOCK_NB
+        while True:
+            self._file = open(self.path, "a")
+            try:
+                fcntl.flock(self._file.fileno(), flags)
+            except (IOError, OSError):
+                self._file.close()
+                self._file = None
+                return False
+            # the lock file may have been removed (see unlink()) while
+            # waiting for it: then lock the new one
+            try:
+                if (os.stat(self.path).st_ino
+                        == os.fstat(self._file.fileno()).st_ino):
+                    break
+            except OSError:
+                pass
+            self._file.close()
+        self.acquired = True
+        return True
+
+    def unlink(self):
+        """ Remove the lock file, while the lock is held, so that the lock
+        does not leave a file behind it.
+        """
+        if self.acquired:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def release(self):
+        """ Release the lock, if it is acquired.
+        """
+        if self._file is not None:
+            # closing the file releases the lock
+            self._file.close()
+            self._file = None
+        self.acquired = False
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class FileDigestIndex(object):
+    """ Persistent index of file content digests.
+
+    Each digested file is recorded with its inode, mtime and size, so that
+    the content is digested again only when one of them changes. The index
+    is stored as a JSON file (usually in the cache directory) and shared by
+    all the processes cached by a :class:`Memory` object.
+
+    A file modified within the filesystem mtime granularity of its last
+    digest cannot be told apart from the indexed version using its stats
+    only: such "racy" entries are not trusted and are digested again.
+    """
+
+    #: delay (in seconds) under which an entry is considered racy
+    racy_delay = 2.
+
+    def __init__(self, index_file=None, algorithm=None):
+        """ Initialize the FileDigestIndex class.
+
+        Parameters
+        ----------
+        index_file: string (optional)
+            the JSON file where the index is persisted. If None, the index
+            is kept in memory only.
+        algorithm: string (optional)
+            the digest algorithm, see :func:`file_digest`.
+        """
+        self.index_file = index_file
+        self.algorithm = algorithm
+        self.entries = {}
+        self.modified = False
+        if index_file is not None and os.path.isfile(index_file):
+            try:
+                with open(index_file) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                logger.warning("Ignoring corrupted digest index '{0}'."
+                               .format(index_file))
+
+    def digest(self, a_file):
+        """ Get the content digest of a file, from the index if it is still
+        valid, or by reading the file otherwise.
+
+        Parameters
+        ----------
+        a_file: string
+            the file to digest.
+
+        Returns
+        -------
+        digest: string or None
+            the file digest, None if the file does not exist.
+        """
+        if not os.path.isfile(a_file):
+            return None
+        path = os.path.abspath(a_file)
+        stat = os.stat(path)
+        key = [stat.st_ino, stat.st_mtime, stat.st_size]
+        entry = self.entries.get(path)
+        if (entry is not None and entry["stat"] == key
+                and entry["time"] - stat.st_mtime >= self.racy_delay):
+            return entry["digest"]
+        digest = file_digest(path, self.algorithm)
+        self.entries[path] = {"stat": key, "digest": digest,
+                              "time": time.time()}
+        self.modified = True
+        return digest
+
+    def save(self):
+        """ Write the index file if it has been modified.
+
+        The file is written to a temporary file first, then renamed, so that
+        concurrent readers never see a partial index.
+        """
+        if self.index_file is None or not self.modified:
+            return
+        fd, tmp_file = tempfile.mkstemp(
+            prefix=".digest_index.", dir=os.path.dirname(self.index_file))
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.entries, f)
+        getattr(os, "replace", os.rename)(tmp_file, self.index_file)
+        self.modified = False
+
+
 class CapsulResultEncoder(json.JSONEncoder):
     """ Deal with ProcessResult in json.
     """
@@ -810,6 +1275,323 @@ class CapsulResultDecoder(json.JSONDecoder):
 # be able to flush the disk
 ############################################################################
 
+def directory_size(path):
+    """ Computes the size of the files in a directory tree.
+
+    Parameters
+    ----------
+    path: string
+        the directory to process.
+
+    Returns
+    -------
+    size: int
+        the cumulated size of the files, in bytes.
+    """
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for fname in files:
+            try:
+                size += os.lstat(os.path.join(root, fname)).st_size
+            except OSError:
+                pass
+    return size
+
+
+class CacheIndex(object):
+    """ Index of the cache entries of a :class:`Memory` object.
+
+    Each entry (the directory where a process call is memorized) is
+    recorded with its size, creation time, last access time and number of
+    hits, so that the cache can be inspected and trimmed without walking
+    the whole cache tree.
+
+    When the cache exceeds its byte or entry budget, entries are evicted,
+    either least recently used first ('lru' policy) or least frequently
+    used first ('lfu' policy, ties broken by access time).
+    """
+
+    def __init__(self, cachedir, max_bytes=None, max_entries=None,
+                 policy="lru"):
+        """ Initialize the CacheIndex class.
+
+        Parameters
+        ----------
+        cachedir: string
+            the cache directory. The index is stored in the
+            'cache_index.json' file of this directory, and is rebuilt from
+            the directory contents if this file does not exist.
+        max_bytes: int (optional)
+            the maximum cumulated size of the cache entries, in bytes.
+        max_entries: int (optional)
+            the maximum number of cache entries.
+        policy: string (optional, default 'lru')
+            the eviction policy, 'lru' or 'lfu'.
+        """
+        if policy not in ("lru", "lfu"):
+            raise ValueError("policy should be 'lru' or 'lfu', not "
+                             "'{0}'".format(policy))
+        self.cachedir = cachedir
+        self.index_file = os.path.join(cachedir, "cache_index.json")
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.policy = policy
+        with FileLock(self.index_file + ".lock"):
+            if not self.load():
+                self.rebuild()
+
+    def load(self):
+        """ Read the index file.
+
+        Returns
+        -------
+        loaded: bool
+            False if the index file does not exist or is corrupted.
+        """
+        self.entries = {}
+        if not os.path.isfile(self.index_file):
+            return False
+        try:
+            with open(self.index_file) as f:
+                self.entries = json.load(f)
+        except ValueError:
+            logger.warning("Rebuilding corrupted cache index '{0}'."
+                           .format(self.index_file))
+            return False
+        return True
+
+    def rebuild(self):
+        """ Rebuild the index by walking the cache directory.
+        """
+        self.entries = {}
+        for root, dirs, files in os.walk(self.cachedir):
+            # skip entries being written
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            if "result.json" in files:
+                stat = os.stat(os.path.join(root, "result.json"))
+                self.entries[os.path.relpath(root, self.cachedir)] = {
+                    "size": directory_size(root),
+                    "ctime": stat.st_mtime,
+                    "atime": stat.st_mtime,
+                    "hits": 0}
+        self.save()
+
+    def save(self):
+        """ Write the index file.
+        """
+        fd, tmp_file = tempfile.mkstemp(prefix=".cache_index.",
+                                        dir=self.cachedir)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.entries, f)
+        getattr(os, "replace", os.rename)(tmp_file, self.index_file)
+
+    def add(self, process_dir):
+        """ Record a new cache entry, then evict entries if the cache is
+        over budget. The new entry itself is never evicted.
+
+        Parameters
+        ----------
+        process_dir: string
+            the cache entry directory.
+        """
+        now = time.time()
+        size = directory_size(process_dir)
+        with FileLock(self.index_file + ".lock"):
+            # other workers may have modified the index
+            self.load()
+            self.entries[os.path.relpath(process_dir, self.cachedir)] = {
+                "size": size,
+                "ctime": now,
+                "atime": now,
+                "hits": 0}
+            self.evict(keep=[process_dir])
+
+    def touch(self, process_dir):
+        """ Record a cache hit on an entry.
+
+        Parameters
+        ----------
+        process_dir: string
+            the cache entry directory.
+        """
+        with FileLock(self.index_file + ".lock"):
+            self.load()
+            entry = self.entries.get(
+                os.path.relpath(process_dir, self.cachedir))
+            if entry is not None:
+                entry["atime"] = time.time()
+                entry["hits"] += 1
+                self.save()
+                return
+        self.add(process_dir)
+
+    def remove(self, process_dir):
+        """ Delete a cache entry and its directory.
+
+        Parameters
+        ----------
+        process_dir: string
+            the cache entry directory.
+
+        Returns
+        -------
+        removed: bool
+            False if the entry is in use by another worker, and has not been
+            removed.
+        """
+        with FileLock(process_dir + ".lock", wait=False) as lock:
+            if not lock.acquired and lock.supported:
+                return False
+            self.entries.pop(os.path.relpath(process_dir, self.cachedir),
+                             None)
+            if os.path.isdir(process_dir):
+                shutil.rmtree(process_dir)
+            lock.unlink()
+        return True
+
+    def total_size(self):
+        """ The cumulated size of the cache entries, in bytes.
+        """
+        return sum(entry["size"] for entry in six.itervalues(self.entries))
+
+    def evict(self, keep=()):
+        """ Delete entries, following the eviction policy, until the cache
+        fits in its budgets. Entries in use by other workers are skipped.
+
+        Parameters
+        ----------
+        keep: list of string (optional)
+            entry directories which must not be evicted.
+
+        Returns
+        -------
+        evicted: list of string
+            the deleted entry directories.
+        """
+        keep = set(os.path.relpath(path, self.cachedir) for path in keep)
+        if self.policy == "lfu":
+            sort_key = lambda item: (item[1]["hits"], item[1]["atime"])
+        else:
+            sort_key = lambda item: item[1]["atime"]
+        candidates = sorted([item for item in six.iteritems(self.entries)
+                             if item[0] not in keep], key=sort_key)
+        size = self.total_size()
+        count = len(self.entries)
+        evicted = []
+        for rel_path, entry in candidates:
+            if ((self.max_bytes is None or size <= self.max_bytes)
+                    and (self.max_entries is None
+                         or count <= self.max_entries)):
+                break
+            process_dir = os.path.join(self.cachedir, rel_path)
+            if not self.remove(process_dir):
+                continue
+            evicted.append(process_dir)
+            size -= entry["size"]
+            count -= 1
+        self.save()
+        return evicted
+
+
+class CacheStats(object):
+    """ Smart-caching statistics, recorded for each process id.
+
+    The recorded counters are:
+
+    * hits, misses: the number of process calls found in the cache, or
+      computed
+    * hash_time: the time spent computing process calls signatures
+      (including input files fingerprints)
+    * lookup_time: the time spent looking up entries in the cache (including
+      waiting for concurrent workers)
+    * compute_time, restore_time: the time spent running processes and
+      storing their results, or restoring results from the cache
+    * bytes_stored, bytes_restored: the size of the stored cache entries,
+      and of the restored files
+    * time_saved: the recorded runtimes of processes found in the cache,
+      minus the time spent to restore them
+
+    Times are in seconds.
+    """
+
+    counters = ("hits", "misses", "hash_time", "lookup_time", "compute_time",
+                "restore_time", "bytes_stored", "bytes_restored",
+                "time_saved")
+
+    def __init__(self):
+        self.processes = {}
+        self._lock = threading.RLock()
+
+    def add(self, process_id, **counters):
+        """ Increment counters of a process.
+
+        Parameters
+        ----------
+        process_id: string
+            the process id.
+        counters: dict
+            counters increments.
+        """
+        with self._lock:
+            stats = self.processes.setdefault(
+                process_id, dict((name, 0) for name in self.counters))
+            for name, value in six.iteritems(counters):
+                stats[name] += value
+
+    def totals(self):
+        """ Counters summed over all processes.
+
+        Returns
+        -------
+        totals: dict
+        """
+        with self._lock:
+            totals = dict((name, 0) for name in self.counters)
+            for stats in six.itervalues(self.processes):
+                for name, value in six.iteritems(stats):
+                    totals[name] += value
+        return totals
+
+    def summary(self):
+        """ Statistics of all processes, and their totals.
+
+        Returns
+        -------
+        summary: dict
+            {"processes": {process_id: counters}, "total": counters}. Hit
+            ratios are added to counters.
+        """
+        def with_ratio(stats):
+            stats = dict(stats)
+            calls = stats["hits"] + stats["misses"]
+            stats["hit_ratio"] = float(stats["hits"]) / calls if calls else 0.
+            return stats
+
+        with self._lock:
+            return {
+                "processes": dict(
+                    (process_id, with_ratio(stats))
+                    for process_id, stats in six.iteritems(self.processes)),
+                "total": with_ratio(self.totals())}
+
+    def save(self, filename):
+        """ Write the statistics summary as a JSON report.
+
+        Parameters
+        ----------
+        filename: string
+            the report file.
+        """
+        with open(filename, "w") as f:
+            json.dump(self.summary(), f, indent=4, sort_keys=True)
+
+    def reset(self):
+        """ Reset all counters.
+        """
+        with self._lock:
+            self.processes = {}
+
+
 class Memory(object):
     """ Memory context to provide caching for processes.
 
@@ -817,33 +1599,97 @@ class Memory(object):
     ----------
     `cachedir`: string
         the location for the caching. If None is given, no caching is done.
+    `digest_index`: FileDigestIndex
+        the content digests index, None unless the 'content' fingerprint
+        mode is used.
+    `cache_index`: CacheIndex
+        the cache entries index, None if no caching is done.
+    `stats`: CacheStats
+        hits, misses, timing and size statistics of the processes cached by
+        this Memory.
+    `report_file`: string
+        if not None, :meth:`StudyConfig.run
+        <capsul.study_config.study_config.StudyConfig.run>` writes the
+        statistics in this JSON file at the end of a run.
 
     Methods
     -------
     cache
     clear
+    du
+    save_report
     """
 
-    def __init__(self, cachedir):
+    def __init__(self, cachedir, fingerprint="stat", max_bytes=None,
+                 max_entries=None, policy="lru", storage="copy",
+                 wait=True, report_file=None):
         """ Initialize the Memory class.
 
         Parameters
         ----------
         base_dir: string
             the directory name of the location for the caching.
+        fingerprint: string (optional, default 'stat')
+            how input files are identified: 'stat' uses their location,
+            mtime and size, 'content' uses their location and a digest of
+            their content, stored in a persistent index in the cache
+            directory so that each file is only digested once.
+        max_bytes: int (optional)
+            the cache size budget, in bytes. Unlimited if None.
+        max_entries: int (optional)
+            the maximum number of memorized process calls. Unlimited if
+            None.
+        policy: string (optional, default 'lru')
+            the eviction policy used when the cache is over budget: 'lru'
+            (least recently used) or 'lfu' (least frequently used).
+        storage: string (optional, default 'copy')
+            how output files are restored from the cache: 'copy',
+            'hardlink', 'reflink' or 'symlink', see :func:`store_file`.
+            Other strategies than 'copy' fall back to copying files when
+            they are not possible. Files are stored in the cache as copies
+            (or reflinks).
+        wait: bool (optional, default True)
+            when several workers share the cache and need the same entry,
+            one computes it while the other ones wait for its results. If
+            False, they compute it concurrently, and the first to finish
+            publishes it.
+        report_file: string (optional)
+            JSON file where the cache statistics are written at the end of a
+            run (see :meth:`save_report`).
         """
+        if fingerprint not in ("stat", "content"):
+            raise ValueError("fingerprint should be 'stat' or 'content', "
+                             "not '{0}'".format(fingerprint))
+
         # Build the capsul memory folder
         if cachedir is not None:
             cachedir = os.path.join(
                 os.path.abspath(cachedir), "capsul_memory")
             if not os.path.exists(cachedir):
-                os.makedirs(cachedir)
-            elif not os.path.isdir(cachedir):
+                try:
+                    os.makedirs(cachedir)
+                except OSError as e:
+                    # created meanwhile by a concurrent worker
+                    if e.errno != errno.EEXIST:
+                        raise
+            if not os.path.isdir(cachedir):
                 raise ValueError("'base_dir' should be a directory")
 
         # Define class parameters
         self.cachedir = cachedir
         self.timestamp = time.time()
+        self.storage = storage
+        self.wait = wait
+        self.stats = CacheStats()
+        self.report_file = report_file
+        self.digest_index = None
+        self.cache_index = None
+        if cachedir is not None:
+            if fingerprint == "content":
+                self.digest_index = FileDigestIndex(
+                    os.path.join(cachedir, "digest_index.json"))
+            self.cache_index = CacheIndex(cachedir, max_bytes, max_entries,
+                                          policy)
 
     def cache(self, process, verbose=1):
         """ Create a proxy of the given process in order to only execute
@@ -899,7 +1745,9 @@ class Memory(object):
         # Otherwise a proxy process is created
         else:
             return MemorizedProcess(process, self.cachedir, self.timestamp,
-                                    verbose)
+                                    verbose, self.digest_index,
+                                    self.cache_index, self.storage,
+                                    self.wait, self.stats)
 
     def clear(self, skips=None):
         """ Remove all the cache apart from those given to the method
@@ -914,12 +1762,55 @@ class Memory(object):
         to_remove_folders = []
         skips = skips or []
         for root, dirs, files in os.walk(self.cachedir):
-            if "result.json" and files and dirs == [] and root not in skips:
+            # skip entries being written
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            if "result.json" in files and root not in skips:
                 to_remove_folders.append(root)
 
         # Delete memory directories
         for folder in to_remove_folders:
-            shutil.rmtree(folder)
+            self.cache_index.remove(folder)
+        self.cache_index.save()
+
+    def save_report(self, filename=None):
+        """ Write the cache statistics in a JSON file.
+
+        Parameters
+        ----------
+        filename: string (optional)
+            the report file. Defaults to the report_file attribute. If none
+            is given, nothing is written.
+        """
+        if filename is None:
+            filename = self.report_file
+        if filename is not None:
+            self.stats.save(filename)
+
+    def du(self, per_entry=False):
+        """ Get the disk usage of the cache, from the cache index.
+
+        Parameters
+        ----------
+        per_entry: bool (optional, default False)
+            if True, report the size of each memorized process call rather
+            than the cumulated size of each process.
+
+        Returns
+        -------
+        usage: dict
+            maps process ids (or cache entry directories) to their size in
+            bytes.
+        """
+        usage = {}
+        if self.cache_index is None:
+            return usage
+        for rel_path, entry in six.iteritems(self.cache_index.entries):
+            if per_entry:
+                key = os.path.join(self.cachedir, rel_path)
+            else:
+                key = ".".join(os.path.dirname(rel_path).split(os.sep))
+            usage[key] = usage.get(key, 0) + entry["size"]
+        return usage
 
     def __repr__(self):
         """ Memory class representation.
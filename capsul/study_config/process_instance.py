@@ -26,6 +26,7 @@ import re
 import six
 import os
 import inspect
+from functools import partial
 
 # Caspul import
 from capsul.process.process import Process
@@ -189,23 +190,239 @@ def _load_module(filename, modname=None):
         sys.modules[modname] = mod
     return mod
 
-def _get_process_instance(process_or_id, study_config=None, **kwargs):
 
-    def _find_single_process(module_dict, filename):
-        ''' Scan objects in module_dict and find out if a single one of them is
-        a process
-        '''
-        object_name = None
-        for name, item in six.iteritems(module_dict):
-            if is_process(item):
+def _find_single_process(module_dict, filename):
+    ''' Scan objects in module_dict and find out if a single one of them is
+    a process
+    '''
+    object_name = None
+    for name, item in six.iteritems(module_dict):
+        if is_process(item):
+            if object_name is not None:
+                raise KeyError(
+                    'file %s contains several processes. Please '
+                    'specify which one should be used using '
+                    'filename.py#ProcessName or '
+                    'module.submodule.ProcessName' % filename)
+            object_name = name
+    return object_name
+
+
+# {(process_id, cwd): (factory, {filename: stamp}, module, source)}
+# resolutions of process string identifiers, see _get_process_factory().
+# Identifiers may be relative file names, thus the current directory is part
+# of the key.
+_process_factories = {}
+
+
+def _file_stamp(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+def _get_process_factory(process_id):
+    ''' Get a callable creating process instances from a process string
+    identifier, or None if the identifier cannot be resolved.
+
+    Resolutions are cached: they are only done again when a file they depend
+    on (python file, XML or JSON description) has been modified, when their
+    module has been reloaded, or when the module object they are read from
+    has been replaced (redefined class in ``__main__``...).
+    '''
+    key = (process_id, os.getcwd())
+    cached = _process_factories.get(key)
+    if cached is not None:
+        factory, files, module, source = cached
+        if (module is None or sys.modules.get(module.__name__) is module) \
+                and (source is None
+                     or module.__dict__.get(source[0]) is source[1]) \
+                and all(_file_stamp(filename) == stamp
+                        for filename, stamp in six.iteritems(files)):
+            return factory
+    factory, filenames, module, source = _resolve_process_id(process_id)
+    if factory is not None:
+        _process_factories[key] = (
+            factory,
+            dict((filename, _file_stamp(filename)) for filename in filenames),
+            module, source)
+    return factory
+
+
+def _resolve_process_id(process_or_id):
+    ''' Resolve a process string identifier
+
+    Returns
+    -------
+    factory: callable
+        creates a process instance, None if the identifier cannot be
+        resolved
+    filenames: list
+        files the factory is read from
+    module: module
+        python module the factory is read from, or None
+    source: tuple
+        (object_name, object) of the module object the factory is made from,
+        or None
+    '''
+    factory = None
+    source = None
+    filenames = []
+    Interface = _get_interface_class()
+    py_url = os.path.basename(process_or_id).split('#')
+    object_name = None
+    as_xml = False
+    as_py = False
+    module_dict = None
+    module = None
+    if len(py_url) >= 2 and py_url[-2].endswith('.py') \
+            or len(py_url) == 1 and py_url[0].endswith('.py'):
+        # python file + process name: something.py#ProcessName
+        # or just something.py if it contains only one process class
+        if len(py_url) >= 2:
+            filename = process_or_id[:-len(py_url[-1]) - 1]
+            object_name = py_url[-1]
+        else:
+            filename = process_or_id
+            object_name = None
+        module = _load_module(filename)
+        filenames.append(filename)
+        module_name = module.__name__
+        module_dict = module.__dict__
+        if object_name is None:
+            object_name = _find_single_process(
+                module_dict, module_name)
+            if object_name is not None:
+                module_name = process_or_id
+                as_py = True
+        elif object_name in module_dict:
+            as_py = True
+    if object_name is None:
+        elements = process_or_id.rsplit('.', 1)
+        if len(elements) < 2:
+            module_name, object_name = '__main__', elements[0]
+        else:
+            module_name, object_name = elements
+        try:
+            module = importlib.import_module(module_name)
+            # update the Interface class since we may have loaded nipype
+            # during import
+            Interface = _get_interface_class()
+
+            if object_name not in module.__dict__ \
+                    or not is_process(getattr(module, object_name)):
+                # maybe a module with a single process in it
+                module = importlib.import_module(process_or_id)
+                module_dict = module.__dict__
+                # update the Interface class since we may have loaded
+                # nipype during import
+                Interface = _get_interface_class()
+                object_name = _find_single_process(
+                    module_dict, module_name)
                 if object_name is not None:
-                    raise KeyError(
-                        'file %s contains several processes. Please '
-                        'specify which one should be used using '
-                        'filename.py#ProcessName or '
-                        'module.submodule.ProcessName' % filename)
-                object_name = name
-        return object_name
+                    module_name = process_or_id
+                    as_py = True
+            else:
+                as_py = True
+        except ImportError as e:
+            pass
+    if not as_py:
+        # maybe XML or JSON filename or URL
+        for ext in ('.xml', '.json'):
+            xml_url = process_or_id + ext
+            if osp.exists(xml_url):
+                object_name = None
+                as_xml = True
+            elif process_or_id.endswith(ext) and osp.exists(process_or_id):
+                xml_url = process_or_id
+                object_name = None
+                as_xml = True
+            else:
+                # maybe XML or JSON file with pipeline name in it
+                xml_url = module_name + ext
+                if not osp.exists(xml_url) and module_name.endswith(ext) \
+                        and osp.exists(module_name):
+                    xml_url = module_name
+                if not osp.exists(xml_url):
+                    # try XML file in a module directory + class name
+                    basename = None
+                    module_name2 = None
+                    if module_name in sys.modules:
+                        basename = object_name
+                        module_name2 = module_name
+                        object_name = None # to allow unmatching class / xml
+                        if basename.endswith(ext):
+                            basename = basename[:-4]
+                    else:
+                        elements = module_name.rsplit('.', 1)
+                        if len(elements) == 2:
+                            module_name2, basename = elements
+                    if module_name2 and basename:
+                        try:
+                            importlib.import_module(module_name2)
+                            mod_dirname = osp.dirname(
+                                sys.modules[module_name2].__file__)
+                            xml_url = osp.join(mod_dirname, basename + ext)
+                            if not osp.exists(xml_url):
+                                # if basename includes .xml extension
+                                xml_url = osp.join(mod_dirname, basename)
+                            as_xml = True
+                        except ImportError as e:
+                            raise ImportError('Cannot import %s: %s'
+                                              % (module_name, str(e)))
+            if as_xml:
+                break
+
+        if osp.exists(xml_url):
+            loaders = {'.xml': create_xml_pipeline,
+                       '.json': create_json_pipeline}
+            factory = loaders[ext](module_name, object_name, xml_url)
+            filenames.append(xml_url)
+
+    if factory is None and not as_xml:
+        if module_dict is not None:
+            module_object = module_dict.get(object_name)
+        else:
+            module = sys.modules[module_name]
+            module_object = getattr(module, object_name, None)
+        if module_object is not None:
+            if (isinstance(module_object, type) and
+                issubclass(module_object, Process)):
+                factory = module_object
+            elif isinstance(module_object, Interface):
+                # If we have a Nipype interface, wrap this structure in a
+                # Process class
+                factory = partial(nipype_factory, module_object)
+            elif (isinstance(module_object, type) and
+                issubclass(module_object, Interface)):
+                factory = lambda: nipype_factory(module_object())
+            elif isinstance(module_object, types.FunctionType):
+                xml = getattr(module_object, 'capsul_xml', None)
+                if xml is None:
+                    # Check docstring
+                    if module_object.__doc__:
+                        match = process_xml_re.search(
+                            module_object.__doc__)
+                        if match:
+                            xml = match.group(0)
+                if xml:
+                    factory = create_xml_process(
+                        module_name, object_name, module_object, xml)
+            if factory is not None:
+                source = (object_name, module_object)
+        if factory is None and module is not None:
+            xml_file = osp.join(osp.dirname(module.__file__),
+                                object_name + '.xml')
+            if osp.exists(xml_file):
+                factory = create_xml_pipeline(module_name, None,
+                                              xml_file)
+                filenames.append(xml_file)
+    return factory, filenames, module, source
+
+
+def _get_process_instance(process_or_id, study_config=None, **kwargs):
 
     result = None
     Interface = _get_interface_class()
@@ -250,149 +467,9 @@ def _get_process_instance(process_or_id, study_config=None, **kwargs):
     # description
     elif isinstance(process_or_id, six.string_types) \
             and not process_or_id.startswith('<pipeline'):
-        py_url = os.path.basename(process_or_id).split('#')
-        object_name = None
-        as_xml = False
-        as_py = False
-        module_dict = None
-        module = None
-        if len(py_url) >= 2 and py_url[-2].endswith('.py') \
-                or len(py_url) == 1 and py_url[0].endswith('.py'):
-            # python file + process name: something.py#ProcessName
-            # or just something.py if it contains only one process class
-            if len(py_url) >= 2:
-                filename = process_or_id[:-len(py_url[-1]) - 1]
-                object_name = py_url[-1]
-            else:
-                filename = process_or_id
-                object_name = None
-            module = _load_module(filename)
-            module_name = module.__name__
-            module_dict = module.__dict__
-            if object_name is None:
-                object_name = _find_single_process(
-                    module_dict, module_name)
-                if object_name is not None:
-                    module_name = process_or_id
-                    as_py = True
-            elif object_name in module_dict:
-                as_py = True
-        if object_name is None:
-            elements = process_or_id.rsplit('.', 1)
-            if len(elements) < 2:
-                module_name, object_name = '__main__', elements[0]
-            else:
-                module_name, object_name = elements
-            try:
-                module = importlib.import_module(module_name)
-                # update the Interface class since we may have loaded nipype
-                # during import
-                Interface = _get_interface_class()
-
-                if object_name not in module.__dict__ \
-                        or not is_process(getattr(module, object_name)):
-                    # maybe a module with a single process in it
-                    module = importlib.import_module(process_or_id)
-                    module_dict = module.__dict__
-                    # update the Interface class since we may have loaded
-                    # nipype during import
-                    Interface = _get_interface_class()
-                    object_name = _find_single_process(
-                        module_dict, module_name)
-                    if object_name is not None:
-                        module_name = process_or_id
-                        as_py = True
-                else:
-                    as_py = True
-            except ImportError as e:
-                pass
-        if not as_py:
-            # maybe XML or JSON filename or URL
-            for ext in ('.xml', '.json'):
-                xml_url = process_or_id + ext
-                if osp.exists(xml_url):
-                    object_name = None
-                    as_xml = True
-                elif process_or_id.endswith(ext) and osp.exists(process_or_id):
-                    xml_url = process_or_id
-                    object_name = None
-                    as_xml = True
-                else:
-                    # maybe XML or JSON file with pipeline name in it
-                    xml_url = module_name + ext
-                    if not osp.exists(xml_url) and module_name.endswith(ext) \
-                            and osp.exists(module_name):
-                        xml_url = module_name
-                    if not osp.exists(xml_url):
-                        # try XML file in a module directory + class name
-                        basename = None
-                        module_name2 = None
-                        if module_name in sys.modules:
-                            basename = object_name
-                            module_name2 = module_name
-                            object_name = None # to allow unmatching class / xml
-                            if basename.endswith(ext):
-                                basename = basename[:-4]
-                        else:
-                            elements = module_name.rsplit('.', 1)
-                            if len(elements) == 2:
-                                module_name2, basename = elements
-                        if module_name2 and basename:
-                            try:
-                                importlib.import_module(module_name2)
-                                mod_dirname = osp.dirname(
-                                    sys.modules[module_name2].__file__)
-                                xml_url = osp.join(mod_dirname, basename + ext)
-                                if not osp.exists(xml_url):
-                                    # if basename includes .xml extension
-                                    xml_url = osp.join(mod_dirname, basename)
-                                as_xml = True
-                            except ImportError as e:
-                                raise ImportError('Cannot import %s: %s'
-                                                  % (module_name, str(e)))
-                if as_xml:
-                    break
-
-            if osp.exists(xml_url):
-                loaders = {'.xml': create_xml_pipeline,
-                           '.json': create_json_pipeline}
-                result = loaders[ext](module_name, object_name, xml_url)()
-
-        if result is None and not as_xml:
-            if module_dict is not None:
-                module_object = module_dict.get(object_name)
-            else:
-                module = sys.modules[module_name]
-                module_object = getattr(module, object_name, None)
-            if module_object is not None:
-                if (isinstance(module_object, type) and
-                    issubclass(module_object, Process)):
-                    result = module_object()
-                elif isinstance(module_object, Interface):
-                    # If we have a Nipype interface, wrap this structure in a
-                    # Process class
-                    result = nipype_factory(result)
-                elif (isinstance(module_object, type) and
-                    issubclass(module_object, Interface)):
-                    result = nipype_factory(module_object())
-                elif isinstance(module_object, types.FunctionType):
-                    xml = getattr(module_object, 'capsul_xml', None)
-                    if xml is None:
-                        # Check docstring
-                        if module_object.__doc__:
-                            match = process_xml_re.search(
-                                module_object.__doc__)
-                            if match:
-                                xml = match.group(0)
-                    if xml:
-                        result = create_xml_process(module_name, object_name,
-                                                    module_object, xml)()
-            if result is None and module is not None:
-                xml_file = osp.join(osp.dirname(module.__file__),
-                                    object_name + '.xml')
-                if osp.exists(xml_file):
-                    result = create_xml_pipeline(module_name, None,
-                                                 xml_file)()
+        factory = _get_process_factory(process_or_id)
+        if factory is not None:
+            result = factory()
     elif hasattr(process_or_id, 'read') \
             or (isinstance(process_or_id, bytes)
                 and process_or_id.startswith(b'<pipeline')) \
@@ -29,7 +29,7 @@ logger = logging.getLogger(__name__)
 
 def run_process(output_dir, process_instance,
                 generate_logging=False, verbose=0, configuration_dict=None,
-                cachedir=None,
+                cachedir=None, memory=None,
                 **kwargs):
     """ Execute a capsul process in a specific directory.
 
@@ -42,6 +42,9 @@ def run_process(output_dir, process_instance,
     cachedir: str (optional, default None)
         save in the cache the current process execution.
         If None, no caching is done.
+    memory: Memory (optional, default None)
+        if given, the process results are looked up in (and stored into)
+        this cache, regardless of the smart-caching configuration.
     generate_logging: bool (optional, default False)
         if True save the log stored in the process after its execution.
     verbose: int
@@ -91,7 +94,9 @@ def run_process(output_dir, process_instance,
     engine.activate_configuration(configuration_dict)
 
     # Run
-    if study_config.get_trait_value("use_smart_caching") in [None, False]:
+    if memory is not None:
+        cachedir = None
+    elif study_config.get_trait_value("use_smart_caching") in [None, False]:
         cachedir = None
     elif cachedir is None:
         cachedir = output_dir
@@ -149,8 +154,10 @@ def run_process(output_dir, process_instance,
             call_with_inputs))
     if cachedir:
         # Create a memory object
-        mem = Memory(cachedir)
-        proxy_instance = mem.cache(process_instance, verbose=verbose)
+        memory = Memory(cachedir, fingerprint=study_config.get_trait_value(
+            "smart_caching_fingerprint") or "stat")
+    if memory is not None:
+        proxy_instance = memory.cache(process_instance, verbose=verbose)
 
         # Execute the proxy process
         returncode = proxy_instance(**kwargs)
@@ -44,6 +44,7 @@ from soma.controller import Controller
 from capsul.pipeline.pipeline import Pipeline
 from capsul.process.process import Process
 from capsul.study_config.run import run_process
+from capsul.study_config.memory import Memory
 from capsul.pipeline.pipeline_nodes import Node
 from capsul.study_config.process_instance import get_process_instance
 
@@ -294,7 +295,7 @@ class StudyConfig(Controller):
 
     def run(self, process_or_pipeline, output_directory=None,
             execute_qc_nodes=True, verbose=0, configuration_dict=None,
-            **kwargs):
+            memory=None, **kwargs):
         """Method to execute a process or a pipeline in a study configuration
          environment.
 
@@ -322,6 +323,13 @@ class StudyConfig(Controller):
             if different from zero, print console messages.
         configuration_dict: dict (optional)
             configuration dictionary
+        memory: Memory or str (optional)
+            smart-caching memory, or its directory. If given, each process
+            (or pipeline leaf node) looks up its results in the cache before
+            running, and stores them afterwards, so that running a pipeline
+            again only recomputes the nodes whose inputs have changed. If the
+            memory has a report_file, cache statistics are written in it at
+            the end of the run.
         """
 
         # Use soma workflow to execute the pipeline or process in parallel
@@ -376,6 +384,10 @@ class StudyConfig(Controller):
                     "Can't create folder '{0}', please investigate.".format(
                         output_directory))
 
+        if isinstance(memory, six.string_types):
+            memory = Memory(memory, fingerprint=self.get_trait_value(
+                "smart_caching_fingerprint") or "stat")
+
         # Temporary files can be generated for pipelines
         temporary_files = []
         result = None
@@ -416,7 +428,8 @@ class StudyConfig(Controller):
                         process_node.process,
                         generate_logging=self.generate_logging,
                         verbose=verbose,
-                        configuration_dict=configuration_dict)
+                        configuration_dict=configuration_dict,
+                        memory=memory)
 
                 # Execute the process instance
                 else:
@@ -425,7 +438,8 @@ class StudyConfig(Controller):
                         process_node,
                         generate_logging=self.generate_logging,
                         verbose=verbose,
-                        configuration_dict=configuration_dict)
+                        configuration_dict=configuration_dict,
+                        memory=memory)
 
                 with self.run_lock:
                     if self.run_interruption_request:
@@ -433,6 +447,8 @@ class StudyConfig(Controller):
                         raise RuntimeError('Execution interruption requested')
 
         finally:
+            if memory is not None:
+                memory.save_report()
             # Destroy temporary files
             if temporary_files:
                 # If temporary files have been created, we are sure that
@@ -7,12 +7,17 @@ import unittest
 import os
 import tempfile
 import shutil
+import json
+import threading
+import time
 
 # Capsul import
 from capsul.api import Process
 from capsul.api import FileCopyProcess
 from capsul.api import get_process_instance
-from capsul.study_config.memory import Memory
+from capsul.api import Pipeline, StudyConfig
+from capsul.study_config.memory import (Memory, FileDigestIndex, CacheIndex,
+                                        FileLock, store_file)
 
 # Trait import
 from traits.api import Float, File, List, String
@@ -44,6 +49,61 @@ class DummyCopyProcess(FileCopyProcess):
         self.s = repr(self.copied_inputs)
 
 
+class DummyWriteProcess(Process):
+    """ Dummy file writer.
+    """
+    text = String(output=False, optional=False, desc="the file content")
+    out_file = File(output=True, optional=False, desc="the written file")
+
+    def _run_process(self):
+        with open(self.out_file, "w") as f:
+            f.write(self.text)
+
+
+class DummyAppendProcess(Process):
+    """ Dummy file writer, copying an input file and appending some text.
+    """
+    runs = []
+
+    in_file = File(output=False, optional=False, desc="the input file")
+    text = String(output=False, optional=False, desc="the appended text")
+    out_file = File(output=True, optional=False, desc="the written file")
+
+    def _run_process(self):
+        DummyAppendProcess.runs.append(self.text)
+        with open(self.in_file) as f:
+            content = f.read()
+        with open(self.out_file, "w") as f:
+            f.write(content + self.text)
+
+
+class DummySlowProcess(DummyWriteProcess):
+    """ Dummy file writer, taking some time.
+    """
+    runs = []
+
+    def _run_process(self):
+        DummySlowProcess.runs.append(self.text)
+        time.sleep(0.5)
+        super(DummySlowProcess, self)._run_process()
+
+
+class DummyChainPipeline(Pipeline):
+    """ Chain of two file writers.
+    """
+    def pipeline_definition(self):
+        self.add_process(
+            "node1", "capsul.study_config.test.test_memory.DummyAppendProcess")
+        self.add_process(
+            "node2", "capsul.study_config.test.test_memory.DummyAppendProcess")
+        self.add_link("node1.out_file->node2.in_file")
+        self.export_parameter("node1", "in_file")
+        self.export_parameter("node1", "text", "text1")
+        self.export_parameter("node2", "text", "text2")
+        self.export_parameter("node1", "out_file", "intermediate")
+        self.export_parameter("node2", "out_file")
+
+
 class TestMemory(unittest.TestCase):
     """ Execute a process using smart-caching functionalities.
     """
@@ -91,6 +151,278 @@ class TestMemory(unittest.TestCase):
         # Call the test
         self.proxy_process_copy()
 
+    def test_digest_index(self):
+        """ Test the persistent content digest index.
+        """
+        fname = os.path.join(self.workspace_dir, "data.txt")
+        index_file = os.path.join(self.workspace_dir, "index.json")
+        with open(fname, "w") as f:
+            f.write("data")
+        index = FileDigestIndex(index_file)
+        digest = index.digest(fname)
+        self.assertTrue(index.modified)
+        index.save()
+        self.assertTrue(os.path.isfile(index_file))
+
+        # a touched file keeps its digest
+        os.utime(fname, (10000., 10000.))
+        index = FileDigestIndex(index_file)
+        self.assertEqual(index.digest(fname), digest)
+        # the (non-racy) new stats are indexed: no new digest computation
+        index.modified = False
+        self.assertEqual(index.digest(fname), digest)
+        self.assertFalse(index.modified)
+
+        # a same-size rewrite with the same mtime changes the digest
+        # because the entry is racy
+        index = FileDigestIndex()
+        with open(fname, "w") as f:
+            f.write("abcd")
+        os.utime(fname, (10000., 10000.))
+        self.assertNotEqual(index.digest(fname), digest)
+        self.assertEqual(index.digest(os.path.join(self.workspace_dir,
+                                                   "missing.txt")), None)
+
+    def test_content_fingerprint(self):
+        """ Test the cache hit on a touched input with content fingerprints.
+        """
+        self.cachedir = tempfile.mkdtemp()
+        self.mem = Memory(self.cachedir, fingerprint="content")
+        fname = os.path.join(self.workspace_dir, "data.txt")
+        with open(fname, "w") as f:
+            f.write("data")
+        process = DummyCopyProcess()
+        process.destination = self.workspace_dir
+        proxy_process = self.mem.cache(process, verbose=0)
+        proxy_process.f = 1.
+        proxy_process.i = fname
+        proxy_process.l = []
+        process_dir = proxy_process._get_process_id()[0]
+        os.utime(fname, (10000., 10000.))
+        self.assertEqual(proxy_process._get_process_id()[0], process_dir)
+        self.assertTrue(os.path.isfile(os.path.join(
+            self.mem.cachedir, "digest_index.json")))
+
+        self.assertRaises(ValueError, Memory, self.cachedir, "other")
+
+    def test_cache_eviction(self):
+        """ Test the cache budgets and eviction policies.
+        """
+        self.cachedir = tempfile.mkdtemp()
+        self.mem = Memory(self.cachedir, max_entries=2)
+        process = DummyProcess()
+        proxy_process = self.mem.cache(process, verbose=0)
+        process_dirs = []
+        for f in (1., 2., 1., 3.):
+            proxy_process(f=f, ff=2.)
+            process_dirs.append(proxy_process._get_process_id()[0])
+        # f=2. is the least recently used entry
+        self.assertEqual(sorted(os.path.isdir(d) for d in process_dirs),
+                         [False, True, True, True])
+        self.assertFalse(os.path.isdir(process_dirs[1]))
+        # evicted entries do not leave their lock file
+        self.assertEqual([os.path.exists(d + ".lock") for d in process_dirs],
+                         [os.path.isdir(d) for d in process_dirs])
+        self.assertEqual(len(self.mem.cache_index.entries), 2)
+        usage = self.mem.du()
+        self.assertEqual(list(usage.keys()), [process.id])
+        self.assertEqual(usage[process.id],
+                         sum(self.mem.du(per_entry=True).values()))
+
+        # the index is persistent, and rebuilt if missing
+        index = CacheIndex(self.mem.cachedir)
+        self.assertEqual(index.entries, self.mem.cache_index.entries)
+        os.unlink(index.index_file)
+        index = CacheIndex(self.mem.cachedir, max_bytes=0, policy="lfu")
+        self.assertEqual(sorted(index.entries),
+                         sorted(self.mem.cache_index.entries))
+        self.assertEqual(len(index.evict()), 2)
+        self.assertEqual(index.entries, {})
+
+        proxy_process(f=4., ff=2.)
+        self.assertTrue(os.path.exists(
+            proxy_process._get_process_id()[0] + ".lock"))
+        self.mem.clear()
+        self.assertTrue(os.path.isdir(self.mem.cachedir))
+        lock_files = [
+            os.path.join(root, f)
+            for root, dirs, files in os.walk(self.mem.cachedir)
+            for f in files if f.endswith(".lock")]
+        self.assertEqual(lock_files, [self.mem.cache_index.index_file
+                                      + ".lock"])
+
+    def test_file_lock_unlink(self):
+        """ Test that a worker waiting for a lock which is removed locks a
+        new lock file.
+        """
+        path = os.path.join(self.workspace_dir, "entry.lock")
+        lock = FileLock(path)
+        if not lock.acquire():
+            # no flock() on this system
+            return
+        acquired = []
+
+        def wait_lock():
+            with FileLock(path) as other_lock:
+                acquired.append(os.path.exists(path))
+
+        thread = threading.Thread(target=wait_lock)
+        thread.start()
+        time.sleep(0.2)
+        self.assertEqual(acquired, [])
+        lock.unlink()
+        lock.release()
+        thread.join()
+        self.assertEqual(acquired, [True])
+
+    def test_store_file(self):
+        """ Test the cache storage strategies.
+        """
+        src = os.path.join(self.workspace_dir, "src.txt")
+        dst = os.path.join(self.workspace_dir, "dst.txt")
+        with open(src, "w") as f:
+            f.write("data")
+        self.assertEqual(store_file(src, dst, "hardlink"), "hardlink")
+        self.assertTrue(os.path.samefile(src, dst))
+        self.assertEqual(store_file(src, dst, "symlink"), "symlink")
+        self.assertTrue(os.path.islink(dst))
+        self.assertEqual(os.readlink(dst), src)
+        # reflinks may not be supported here, but files are always copied
+        self.assertIn(store_file(src, dst, "reflink"), ("reflink", "copy"))
+        self.assertFalse(os.path.islink(dst))
+        with open(dst) as f:
+            self.assertEqual(f.read(), "data")
+        self.assertEqual(sorted(os.listdir(self.workspace_dir)),
+                         ["dst.txt", "src.txt"])
+
+    def test_proxy_process_hardlink(self):
+        """ Test output files restoration with hardlinks.
+        """
+        self.cachedir = tempfile.mkdtemp()
+        self.mem = Memory(self.cachedir, storage="hardlink")
+        process = DummyWriteProcess()
+        proxy_process = self.mem.cache(process, verbose=0)
+        out_file = os.path.join(self.workspace_dir, "out.txt")
+        proxy_process(text="data", out_file=out_file)
+        process_dir = os.path.join(
+            self.mem.cachedir, list(self.mem.cache_index.entries)[0])
+        memory_file = os.path.join(process_dir, "out.txt")
+        # outputs are stored as copies
+        self.assertFalse(os.path.samefile(memory_file, out_file))
+        os.unlink(out_file)
+        proxy_process(text="data", out_file=out_file)
+        self.assertTrue(os.path.samefile(memory_file, out_file))
+        self.assertEqual(
+            self.mem.cache_index.entries[
+                os.path.relpath(process_dir, self.mem.cachedir)]["hits"], 1)
+
+    def test_rewrite_linked_outputs(self):
+        """ Test that rewriting an output restored as a link does not modify
+        the cache.
+        """
+        for storage in ("hardlink", "symlink"):
+            self.cachedir = tempfile.mkdtemp()
+            self.mem = Memory(self.cachedir, storage=storage)
+            proxy_process = self.mem.cache(DummyWriteProcess(), verbose=0)
+            out_file = os.path.join(self.workspace_dir,
+                                    "out_{0}.txt".format(storage))
+            for text in ("AAA", "BBB", "AAA", "BBB"):
+                proxy_process(text=text, out_file=out_file)
+                with open(out_file) as f:
+                    self.assertEqual(f.read(), text)
+            self.assertEqual(self.mem.stats.totals()["misses"], 2)
+            self.assertEqual(self.mem.stats.totals()["hits"], 2)
+            shutil.rmtree(self.cachedir)
+
+    def test_pipeline_memory(self):
+        """ Test the memoization of pipeline nodes.
+        """
+        self.cachedir = tempfile.mkdtemp()
+        study_config = StudyConfig()
+        pipeline = study_config.get_process_instance(DummyChainPipeline)
+        in_file = os.path.join(self.workspace_dir, "in.txt")
+        with open(in_file, "w") as f:
+            f.write("in")
+        params = dict(in_file=in_file, text1="1", text2="2",
+                      intermediate=os.path.join(self.workspace_dir, "i.txt"),
+                      out_file=os.path.join(self.workspace_dir, "out.txt"))
+        del DummyAppendProcess.runs[:]
+        study_config.run(pipeline, memory=self.cachedir, **params)
+        self.assertEqual(DummyAppendProcess.runs, ["1", "2"])
+
+        # only the downstream node is run again
+        del DummyAppendProcess.runs[:]
+        params["text2"] = "3"
+        study_config.run(pipeline, memory=self.cachedir, **params)
+        self.assertEqual(DummyAppendProcess.runs, ["3"])
+        with open(params["out_file"]) as f:
+            self.assertEqual(f.read(), "in13")
+
+        # nothing is run again
+        del DummyAppendProcess.runs[:]
+        report_file = os.path.join(self.workspace_dir, "report.json")
+        memory = Memory(self.cachedir, report_file=report_file)
+        study_config.run(pipeline, memory=memory, **params)
+        self.assertEqual(DummyAppendProcess.runs, [])
+        with open(report_file) as f:
+            report = json.load(f)
+        process_id = DummyAppendProcess().id
+        self.assertEqual(list(report["processes"].keys()), [process_id])
+        stats = memory.stats.summary()["total"]
+        self.assertEqual(report["total"], stats)
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 0))
+        self.assertEqual(stats["hit_ratio"], 1.)
+        self.assertEqual(stats["bytes_restored"], len("in1") + len("in13"))
+        self.assertEqual(stats["bytes_stored"], 0)
+
+    def concurrent_calls(self, wait):
+        """ Call the same process in two threads sharing a cache directory.
+        """
+        del DummySlowProcess.runs[:]
+        errors = []
+
+        def call(i):
+            try:
+                proxy_process = Memory(self.cachedir, wait=wait).cache(
+                    DummySlowProcess(), verbose=0)
+                proxy_process(text="data", out_file=os.path.join(
+                    self.workspace_dir, "out%d.txt" % i))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call, args=(i, ))
+                   for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        # a single, complete entry has been published
+        mem = Memory(self.cachedir)
+        self.assertEqual(len(mem.cache_index.entries), 1)
+        for rel_path in mem.cache_index.entries:
+            process_dir = os.path.join(mem.cachedir, rel_path)
+            self.assertEqual(
+                sorted(os.listdir(process_dir))[::2],
+                ["file_mapping.json", "result.json"])
+            self.assertEqual(
+                [d for d in os.listdir(os.path.dirname(process_dir))
+                 if d.startswith(".")], [])
+
+    def test_concurrent_cache(self):
+        """ Test concurrent workers waiting for each other.
+        """
+        self.cachedir = tempfile.mkdtemp()
+        self.concurrent_calls(wait=True)
+        self.assertEqual(DummySlowProcess.runs, ["data"])
+
+    def test_concurrent_cache_nowait(self):
+        """ Test concurrent workers computing the same entry.
+        """
+        self.cachedir = tempfile.mkdtemp()
+        self.concurrent_calls(wait=False)
+        self.assertEqual(DummySlowProcess.runs, ["data", "data"])
+
     def proxy_process(self):
         """ Test the proxy process behaviours.
         """
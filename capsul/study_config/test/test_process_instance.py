@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# System import
+from __future__ import absolute_import
+from __future__ import print_function
+import unittest
+import sys
+import tempfile
+import shutil
+import os
+import os.path as osp
+
+# Capsul import
+from capsul.api import Process, get_process_instance
+from capsul.study_config import process_instance
+
+# Trait import
+from traits.api import Float
+
+
+class DummyProcess(Process):
+    """ A dummy process.
+    """
+    f = Float(output=False, desc="a float")
+
+    def _run_process(self):
+        pass
+
+
+process_source = '''
+from capsul.api import Process
+from traits.api import Float
+
+class FileProcess(Process):
+    f = Float(%s, output=False)
+'''
+
+
+class TestProcessInstance(unittest.TestCase):
+    """ Test the resolution of process string identifiers.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='capsul_process_instance')
+        self.resolutions = []
+        self.resolve = process_instance._resolve_process_id
+
+        def resolve(process_id):
+            self.resolutions.append(process_id)
+            return self.resolve(process_id)
+
+        process_instance._resolve_process_id = resolve
+
+    def tearDown(self):
+        process_instance._resolve_process_id = self.resolve
+        shutil.rmtree(self.tmp_dir)
+
+    def test_module_id(self):
+        process_id = '%s.DummyProcess' % __name__
+        process1 = get_process_instance(process_id, f=1.)
+        process2 = get_process_instance(process_id)
+        self.assertTrue(isinstance(process1, DummyProcess))
+        self.assertTrue(isinstance(process2, DummyProcess))
+        self.assertTrue(process1 is not process2)
+        self.assertEqual(process1.f, 1.)
+        # the identifier has been resolved only once
+        self.assertEqual(self.resolutions, [process_id])
+        self.assertRaises(ValueError, get_process_instance,
+                          '%s.NoProcess' % __name__)
+
+    def test_redefined_object(self):
+        # interactive sessions redefine classes in __main__
+        main = sys.modules['__main__']
+
+        def define(value):
+            class MainProcess(Process):
+                f = Float(value, output=False)
+            main.MainProcess = MainProcess
+
+        define(1.)
+        try:
+            self.assertEqual(get_process_instance('MainProcess').f, 1.)
+            self.assertEqual(get_process_instance('MainProcess').f, 1.)
+            self.assertEqual(self.resolutions, ['MainProcess'])
+            define(2.)
+            self.assertEqual(get_process_instance('MainProcess').f, 2.)
+            self.assertEqual(len(self.resolutions), 2)
+        finally:
+            del main.MainProcess
+
+    def test_file_id(self):
+        filename = osp.join(self.tmp_dir, 'file_process.py')
+        with open(filename, 'w') as f:
+            f.write(process_source % '1.')
+        process_id = '%s#FileProcess' % filename
+        self.assertEqual(get_process_instance(process_id).f, 1.)
+        self.assertEqual(get_process_instance(process_id).f, 1.)
+        self.assertEqual(len(self.resolutions), 1)
+        # a modified file is loaded again
+        with open(filename, 'w') as f:
+            f.write(process_source % '12.')
+        self.assertEqual(get_process_instance(process_id).f, 12.)
+        self.assertEqual(len(self.resolutions), 2)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestProcessInstance)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
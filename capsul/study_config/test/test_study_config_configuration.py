@@ -33,6 +33,7 @@ tests_no_files = [
         "generate_logging": False,
         'use_matlab': False,
         'use_smart_caching': False,
+        'smart_caching_fingerprint': 'stat',
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
@@ -52,6 +53,7 @@ tests_no_files = [
         "generate_logging": False,
         'use_matlab': False,
         'use_smart_caching': False,
+        'smart_caching_fingerprint': 'stat',
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
@@ -71,6 +73,7 @@ tests_no_files = [
         "generate_logging": False,
         'use_matlab': False,
         'use_smart_caching': False,
+        'smart_caching_fingerprint': 'stat',
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
@@ -114,6 +117,7 @@ tests_no_files = [
         "use_freesurfer": False,
         "shared_directory": soma.config.BRAINVISA_SHARE,
         'use_smart_caching': False,
+        'smart_caching_fingerprint': 'stat',
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
@@ -142,6 +146,7 @@ tests_standard_files = [
         "generate_logging": False,
         'use_matlab': False,
         'use_smart_caching': False,
+        'smart_caching_fingerprint': 'stat',
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
@@ -188,6 +193,7 @@ tests_standard_files = [
         "generate_logging": False,
         'use_matlab': False,
         'use_smart_caching': False,
+        'smart_caching_fingerprint': 'stat',
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
@@ -240,6 +246,7 @@ tests_custom_files = [
         "generate_logging": False,
         'use_matlab': False,
         'use_smart_caching': False,
+        'smart_caching_fingerprint': 'stat',
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
@@ -286,6 +293,7 @@ tests_custom_files = [
         "generate_logging": False,
         'use_matlab': False,
         'use_smart_caching': False,
+        'smart_caching_fingerprint': 'stat',
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
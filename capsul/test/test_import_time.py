@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import print_function
+import unittest
+import subprocess
+import sys
+import os
+import os.path as osp
+
+
+# modules which should not be imported by light imports
+heavy_modules = ['populse_db', 'soma_workflow', 'nipype', 'PyQt4', 'PyQt5',
+                 'PyQt6', 'PySide', 'PySide2', 'PySide6', 'soma.qt_gui']
+
+# cumulative import time budgets, in seconds. They are generous, the
+# measured times being much smaller, but would catch the import of the whole
+# Capsul machinery.
+import_budgets = {
+    'capsul.api': 0.5,
+    'capsul.process.runprocess': 0.5,
+}
+
+
+def import_times(statement):
+    '''
+    Run a python statement in a new interpreter, with the ``-X importtime``
+    option, and return the import times of modules, as a dict
+    {module: (self_time, cumulative_time)} in seconds.
+    '''
+    env = dict(os.environ)
+    capsul_dir = osp.dirname(osp.dirname(osp.dirname(
+        osp.abspath(__file__))))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [capsul_dir] + [p for p in [env.get('PYTHONPATH')] if p])
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        stderr=subprocess.STDOUT, env=env)
+    times = {}
+    for line in output.decode().split('\n'):
+        if not line.startswith('import time:'):
+            continue
+        items = line[len('import time:'):].split('|')
+        if len(items) != 3:
+            continue
+        try:
+            self_time = int(items[0]) * 1e-6
+            cumulative = int(items[1]) * 1e-6
+        except ValueError:
+            # header line
+            continue
+        times[items[2].strip()] = (self_time, cumulative)
+    return times
+
+
+@unittest.skipIf(sys.version_info < (3, 7), '-X importtime needs python 3.7')
+class TestImportTime(unittest.TestCase):
+
+    def assert_not_imported(self, times, modules):
+        for module in modules:
+            imported = [m for m in times
+                        if m == module or m.startswith(module + '.')]
+            self.assertEqual(imported, [],
+                             '%s should not be imported' % module)
+
+    def test_api_import(self):
+        times = import_times('import capsul.api')
+        self.assertTrue(times['capsul.api'][1]
+                        < import_budgets['capsul.api'])
+        self.assert_not_imported(
+            times, heavy_modules + ['capsul.process.process',
+                                    'capsul.pipeline.pipeline',
+                                    'capsul.engine'])
+
+    def test_api_lazy_attribute(self):
+        times = import_times('from capsul.api import capsul_engine')
+        self.assertTrue('capsul.engine.settings' in times)
+        self.assert_not_imported(
+            times, heavy_modules + ['capsul.pipeline.pipeline',
+                                    'capsul.study_config.study_config'])
+
+    def test_runprocess_import(self):
+        times = import_times('import capsul.process.runprocess')
+        self.assertTrue(times['capsul.process.runprocess'][1]
+                        < import_budgets['capsul.process.runprocess'])
+        self.assert_not_imported(
+            times, heavy_modules + ['traits', 'capsul.engine',
+                                    'capsul.process.process'])
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestImportTime)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+'''
+Utilities
+
+Functions
+=========
+:func:`user_cache_directory`
+----------------------------
+'''
+
+from __future__ import absolute_import
+import os
+import os.path as osp
+
+
+def user_cache_directory(*path):
+    ''' Directory of Capsul caches for the current user:
+    ``$XDG_CACHE_HOME/capsul`` (with ``~/.cache`` as default cache
+    directory), joined with the given path components. The directory is not
+    created.
+    '''
+    cache_dir = os.environ.get('XDG_CACHE_HOME', osp.join('~', '.cache'))
+    return osp.join(osp.expanduser(cache_dir), 'capsul', *path)
@@ -0,0 +1,524 @@
+# -*- coding: utf-8 -*-
+'''
+Persistent index of the processes and pipelines defined in python packages.
+
+Finding processes in a package used to import all its modules, which takes
+a long time for large toolboxes (especially nipype-based ones). The
+registry finds them by parsing module sources instead (using the :mod:`ast`
+module), and stores the result in a cache file, where each source file
+entry is invalidated when the file modification time or size changes.
+Modules which cannot be understood statically (classes derived from bases
+which cannot be resolved, nipype interfaces instantiated at module level)
+are imported, and the result is cached the same way. Import failures are
+not cached in the file, as they depend on the python environment (missing
+dependencies...): they are only remembered during the session.
+
+Classes
+=======
+:class:`ProcessRegistry`
+------------------------
+
+Functions
+=========
+:func:`default_registry`
+------------------------
+'''
+
+from __future__ import absolute_import
+import ast
+import importlib
+import inspect
+import json
+import logging
+import os
+import os.path as osp
+import re
+import sys
+import tempfile
+import types
+
+import six
+
+from capsul.utils import user_cache_directory
+
+logger = logging.getLogger(__name__)
+
+process_xml_re = re.compile(r'<process.*</process>', re.DOTALL)
+pipeline_xml_re = re.compile(r'<pipeline.*</pipeline>', re.DOTALL)
+pipeline_json_re = re.compile(r'{.*"definition":', re.DOTALL)
+
+# classes from which processes derive, and the kind of their subclasses
+root_classes = {
+    'capsul.process.process.Process': 'process',
+    'capsul.pipeline.pipeline.Pipeline': 'pipeline',
+}
+
+# packages which do not define process classes: classes derived from their
+# classes are not processes
+non_process_packages = set([
+    'builtins', '__builtin__', 'six', 'traits', 'numpy', 'scipy', 'soma',
+    'nipype', 'abc', 'collections', 'enum', 'threading', 'json', 'os'])
+
+_default_registry = None
+
+
+def default_registry():
+    ''' Registry using the default cache file,
+    ``$XDG_CACHE_HOME/capsul/process_registry.json`` (with
+    ``~/.cache`` as default cache directory)
+    '''
+    global _default_registry
+
+    if _default_registry is None:
+        _default_registry = ProcessRegistry(
+            user_cache_directory('process_registry.json'))
+    return _default_registry
+
+
+class ProcessRegistry(object):
+    ''' Index of processes and pipelines, stored in a JSON cache file.
+
+    Entries are lists of ``[name, kind]`` pairs, where kind is one of:
+
+    - ``'process'``: a :class:`~capsul.process.process.Process` subclass
+    - ``'pipeline'``: a :class:`~capsul.pipeline.pipeline.Pipeline`
+      subclass
+    - ``'function'``: a function with a process XML description
+    - ``'interface'``: a nipype interface instance
+    - ``'xml_pipeline'``, ``'json_pipeline'``: a pipeline description file
+
+    ::
+
+        registry = ProcessRegistry('/tmp/process_registry.json')
+        for process_id in registry.find_processes('morphologist'):
+            print(process_id)
+    '''
+
+    # bumped when the cache format or the scanning rules change
+    version = 2
+
+    def __init__(self, cache_file=None):
+        ''' Initialize the ProcessRegistry class.
+
+        Parameters
+        ----------
+        cache_file: string (optional)
+            the JSON cache file. If None, the index is only kept in memory.
+        '''
+        self.cache_file = cache_file
+        self.files = {}
+        # {filename: (mtime, size)} of modules which could not be imported,
+        # not saved in the cache file
+        self.import_errors = {}
+        self.modified = False
+        self.load()
+
+    def load(self):
+        ''' Read the cache file. A missing, corrupted or obsolete cache is
+        silently ignored.
+        '''
+        self.files = {}
+        if not self.cache_file or not osp.isfile(self.cache_file):
+            return
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+        except ValueError:
+            logger.warning('Ignoring corrupted process registry {0}'
+                           .format(self.cache_file))
+            return
+        if cache.get('version') == self.version:
+            self.files = cache.get('files', {})
+
+    def save(self):
+        ''' Write the cache file, if the index has been modified. The cache
+        is not saved if its directory cannot be written.
+        '''
+        if not self.modified or not self.cache_file:
+            return
+        cache_dir = osp.dirname(self.cache_file)
+        try:
+            if not osp.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            fd, tmp_file = tempfile.mkstemp(prefix='.process_registry.',
+                                            dir=cache_dir)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': self.version, 'files': self.files}, f)
+            getattr(os, 'replace', os.rename)(tmp_file, self.cache_file)
+        except (IOError, OSError) as e:
+            logger.warning('Cannot write process registry {0}: {1}'
+                           .format(self.cache_file, e))
+            return
+        self.modified = False
+
+    def clear(self):
+        ''' Empty the index, and the cache file
+        '''
+        self.files = {}
+        self.import_errors = {}
+        self.modified = True
+        self.save()
+
+    def find_processes(self, module_name, ignore_import_error=True,
+                       kinds=None):
+        ''' Find processes and pipelines in a module or package (including
+        sub-packages), and iterate over their identifiers.
+
+        Parameters
+        ----------
+        module_name: string
+            the module or package name
+        ignore_import_error: bool (optional)
+            if False, errors in modules which have to be imported are raised
+        kinds: sequence (optional)
+            only return these kinds of processes (see the class
+            documentation)
+        '''
+        ids = []
+        for name, kind in self.module_processes(
+                module_name, ignore_import_error=ignore_import_error):
+            if kinds is None or kind in kinds:
+                ids.append(name)
+        return ids
+
+    def module_processes(self, module_name, ignore_import_error=True):
+        ''' List ``(process_id, kind)`` of processes and pipelines of a
+        module or package, including its sub-packages.
+        '''
+        modules = list(_walk_modules(module_name))
+        if not modules:
+            # not a python source module: import it
+            return [('%s.%s' % (module_name, item), kind)
+                    for item, kind in _imported_entries(module_name)]
+        result = []
+        for name, filename, is_package in modules:
+            result += [('%s.%s' % (name, item), kind)
+                       for item, kind in self._module_entries(
+                           name, filename, ignore_import_error)]
+            if is_package:
+                result += [('%s.%s' % (name, item), kind)
+                           for item, kind in self._description_entries(
+                               osp.dirname(filename))]
+        self.save()
+        return result
+
+    def complete(self, prefix):
+        ''' Process identifiers starting with the given prefix. The package
+        of the prefix (its first component) is scanned if needed.
+        '''
+        package = prefix.split('.', 1)[0]
+        if not package:
+            return []
+        try:
+            ids = [name for name, kind in self.module_processes(package)]
+        except ImportError:
+            return []
+        return sorted(name for name in ids if name.startswith(prefix))
+
+    def _file_entry(self, filename):
+        ''' Cached entry of a file, or a new one if the file has changed
+        '''
+        stat = os.stat(filename)
+        entry = self.files.get(filename)
+        if entry is None or entry.get('mtime') != stat.st_mtime \
+                or entry.get('size') != stat.st_size:
+            entry = {'mtime': stat.st_mtime, 'size': stat.st_size}
+            self.files[filename] = entry
+            self.modified = True
+        return entry
+
+    def _summary(self, module_name, filename):
+        entry = self._file_entry(filename)
+        summary = entry.get('summary')
+        if summary is None:
+            summary = _scan_source(module_name, filename)
+            entry['summary'] = summary
+            self.modified = True
+        return summary
+
+    def _module_entries(self, module_name, filename, ignore_import_error):
+        entry = self._file_entry(filename)
+        if 'imported' in entry:
+            return entry['imported']
+        stamp = (entry['mtime'], entry['size'])
+        if ignore_import_error and self.import_errors.get(filename) == stamp:
+            return []
+        summary = self._summary(module_name, filename)
+        entries = self._static_entries(module_name, summary)
+        if entries is not None:
+            return entries
+        # the module has to be imported
+        try:
+            entries = _imported_entries(module_name)
+        except Exception:
+            self.import_errors[filename] = stamp
+            if not ignore_import_error:
+                raise
+            return []
+        self.import_errors.pop(filename, None)
+        entry['imported'] = entries
+        self.modified = True
+        return entries
+
+    def _static_entries(self, module_name, summary):
+        ''' Processes of a module, from its source summary, or None if
+        the module has to be imported to know them
+        '''
+        if summary['dynamic']:
+            return None
+        entries = []
+        for name in summary['classes']:
+            if '%s.%s' % (module_name, name) in root_classes:
+                continue
+            kind = self._class_kind(module_name, name, set())
+            if kind == 'unknown':
+                return None
+            if kind is not None:
+                entries.append([name, kind])
+        entries += [[name, 'function'] for name in summary['functions']]
+        return sorted(entries)
+
+    def _class_kind(self, module_name, class_name, seen):
+        ''' Kind of a class given by its module and name: 'process',
+        'pipeline', None if it is not a process, or 'unknown' if it cannot
+        be determined without importing modules.
+        '''
+        full_name = '%s.%s' % (module_name, class_name)
+        if full_name in root_classes:
+            return root_classes[full_name]
+        if full_name in seen:
+            return None
+        seen.add(full_name)
+        if module_name == 'capsul.api':
+            # capsul.api imports its objects lazily
+            from capsul.api import _lazy_objects
+            if class_name in _lazy_objects:
+                return self._class_kind(_lazy_objects[class_name],
+                                        class_name, seen)
+        top_package = module_name.split('.', 1)[0]
+        if top_package in non_process_packages:
+            return None
+        filename = _module_file(module_name)
+        if filename is None:
+            return 'unknown'
+        summary = self._summary(module_name, filename)
+        if class_name in summary['imports']:
+            return self._name_kind(summary['imports'][class_name], seen)
+        bases = summary['classes'].get(class_name)
+        if bases is None:
+            return 'unknown'
+        result = None
+        for base in bases:
+            if base is None:
+                return 'unknown'
+            kind = self._name_kind(base, seen)
+            if kind == 'unknown':
+                return kind
+            if kind == 'pipeline' or result is None:
+                result = kind
+        return result
+
+    def _name_kind(self, full_name, seen):
+        if '.' not in full_name:
+            # a builtin
+            return None
+        module_name, class_name = full_name.rsplit('.', 1)
+        return self._class_kind(module_name, class_name, seen)
+
+    def _description_entries(self, directory):
+        ''' Pipelines described in XML or JSON files of a package directory
+        '''
+        entries = []
+        for filename in sorted(os.listdir(directory)):
+            for ext, kind, regex in (
+                    ('.xml', 'xml_pipeline', pipeline_xml_re),
+                    ('.json', 'json_pipeline', pipeline_json_re)):
+                if not filename.endswith(ext):
+                    continue
+                path = osp.join(directory, filename)
+                entry = self._file_entry(path)
+                if 'pipeline' not in entry:
+                    with open(path) as f:
+                        entry['pipeline'] = bool(regex.search(f.read()))
+                    self.modified = True
+                if entry['pipeline']:
+                    entries.append([filename[:-len(ext)], kind])
+        return entries
+
+
+def _module_file(module_name):
+    ''' Find the source file of a module without importing it, or None
+    '''
+    module = sys.modules.get(module_name)
+    if module is not None:
+        filename = getattr(module, '__file__', None)
+        if filename and filename.endswith('.pyc'):
+            filename = filename[:-1]
+        if filename and filename.endswith('.py') and osp.exists(filename):
+            return filename
+        return None
+    parts = module_name.split('.')
+    for path in sys.path:
+        base = osp.join(path or os.curdir, *parts)
+        for filename in (base + '.py', osp.join(base, '__init__.py')):
+            if osp.isfile(filename):
+                return osp.abspath(filename)
+    return None
+
+
+def _walk_modules(module_name):
+    ''' Iterate over (module_name, filename, is_package) of a module and its
+    sub-modules, like :func:`pkgutil.walk_packages`, without importing them
+    '''
+    filename = _module_file(module_name)
+    if filename is None:
+        return
+    is_package = osp.basename(filename) == '__init__.py'
+    yield module_name, filename, is_package
+    if not is_package:
+        return
+    directory = osp.dirname(filename)
+    for name in sorted(os.listdir(directory)):
+        path = osp.join(directory, name)
+        if name.endswith('.py') and name != '__init__.py':
+            yield '%s.%s' % (module_name, name[:-3]), path, False
+        elif osp.isfile(osp.join(path, '__init__.py')):
+            for item in _walk_modules('%s.%s' % (module_name, name)):
+                yield item
+
+
+def _scan_source(module_name, filename):
+    ''' Summarize the module level definitions of a python source file.
+
+    Returns
+    -------
+    summary: dict
+        ``classes``: {name: [base full names]}, where a base which cannot be
+        resolved is None; ``functions``: names of functions with a process
+        XML description; ``imports``: {name: full name} of imported names;
+        ``dynamic``: True if processes may be defined in a way which cannot
+        be parsed (star imports, nipype interfaces instances).
+    '''
+    summary = {'classes': {}, 'functions': [], 'imports': {},
+               'dynamic': False}
+    try:
+        with open(filename, 'rb') as f:
+            tree = ast.parse(f.read(), filename)
+    except (SyntaxError, ValueError):
+        summary['dynamic'] = True
+        return summary
+    is_package = osp.basename(filename) == '__init__.py'
+    package = module_name if is_package else module_name.rpartition('.')[0]
+    imports = summary['imports']
+    classes = summary['classes']
+
+    def full_name(node):
+        # full name of a Name or Attribute expression, or None
+        if isinstance(node, ast.Name):
+            if node.id in imports:
+                return imports[node.id]
+            if node.id in classes:
+                return '%s.%s' % (module_name, node.id)
+            if hasattr(six.moves.builtins, node.id):
+                return node.id
+            return None
+        if isinstance(node, ast.Attribute):
+            value = full_name(node.value)
+            if value is None:
+                return None
+            return '%s.%s' % (value, node.attr)
+        return None
+
+    def scan(body):
+        for node in body:
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.asname:
+                        imports[alias.asname] = alias.name
+                    else:
+                        name = alias.name.split('.', 1)[0]
+                        imports[name] = name
+            elif isinstance(node, ast.ImportFrom):
+                source = node.module or ''
+                if node.level:
+                    base = package.split('.')
+                    if node.level > 1:
+                        base = base[:-(node.level - 1)]
+                    source = '.'.join([p for p in base + [source] if p])
+                for alias in node.names:
+                    if alias.name == '*':
+                        summary['dynamic'] = True
+                    else:
+                        imports[alias.asname or alias.name] \
+                            = '%s.%s' % (source, alias.name)
+            elif isinstance(node, ast.ClassDef):
+                bases = []
+                for base in node.bases:
+                    if isinstance(base, ast.Call) \
+                            and full_name(base.func) == 'six.with_metaclass':
+                        # six.with_metaclass(Meta, *bases)
+                        bases += [full_name(b) for b in base.args[1:]]
+                    else:
+                        bases.append(full_name(base))
+                classes[node.name] = bases
+                imports.pop(node.name, None)
+            elif isinstance(node, ast.FunctionDef):
+                doc = ast.get_docstring(node)
+                decorators = [
+                    full_name(d.func if isinstance(d, ast.Call) else d)
+                    for d in node.decorator_list]
+                if (doc and process_xml_re.search(doc)) \
+                        or any(d and d.endswith('xml_process')
+                               for d in decorators):
+                    summary['functions'].append(node.name)
+            elif isinstance(node, ast.Assign) \
+                    and isinstance(node.value, ast.Call):
+                callee = full_name(node.value.func)
+                if callee and callee.split('.', 1)[0] == 'nipype':
+                    # may be an interface instance
+                    summary['dynamic'] = True
+            elif isinstance(node, ast.If):
+                scan(node.body)
+                scan(node.orelse)
+            elif isinstance(node, getattr(ast, 'Try', ())) \
+                    or type(node).__name__ in ('TryExcept', 'TryFinally'):
+                scan(node.body)
+                for handler in getattr(node, 'handlers', []):
+                    scan(handler.body)
+                scan(getattr(node, 'orelse', []))
+                scan(getattr(node, 'finalbody', []))
+
+    scan(tree.body)
+    summary['functions'].sort()
+    return summary
+
+
+def _imported_entries(module_name):
+    ''' Processes of a module, found by importing it
+    '''
+    from capsul.process.process import Process
+    from capsul.pipeline.pipeline import Pipeline
+
+    module = importlib.import_module(module_name)
+    Interface = None
+    nipype = sys.modules.get('nipype.interfaces.base')
+    if nipype is not None:
+        Interface = nipype.Interface
+    entries = []
+    for name in sorted(dir(module)):
+        item = getattr(module, name)
+        if inspect.isclass(item) and issubclass(item, Process):
+            if item.__module__ == module_name \
+                    and item not in (Process, Pipeline):
+                entries.append(
+                    [name,
+                     'pipeline' if issubclass(item, Pipeline)
+                     else 'process'])
+        elif Interface is not None and isinstance(item, Interface):
+            entries.append([name, 'interface'])
+        elif isinstance(item, types.FunctionType) \
+                and item.__module__ == module_name:
+            if getattr(item, 'capsul_xml', None) \
+                    or (item.__doc__ and process_xml_re.search(item.__doc__)):
+                entries.append([name, 'function'])
+    return entries
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# System import
+from __future__ import absolute_import
+import unittest
+import importlib
+import tempfile
+import shutil
+import sys
+import os
+import os.path as osp
+
+# Capsul import
+from capsul.utils.process_registry import ProcessRegistry
+
+
+modules = {
+    '__init__.py': '',
+    'base.py': '''
+from capsul.api import Process, Pipeline
+
+class ProcessA(Process):
+    pass
+
+class PipelineA(Pipeline):
+    pass
+
+class NotAProcess(object):
+    pass
+
+def xml_function(a):
+    """
+    <process>
+        <input name="a" type="int"/>
+    </process>
+    """
+    return a
+''',
+    'derived.py': '''
+from .base import ProcessA, NotAProcess
+
+class ProcessB(ProcessA):
+    pass
+
+class NotAProcessB(NotAProcess, Exception):
+    pass
+''',
+    'dynamic.py': '''
+from capsul.api import Process
+
+DynamicBase = type('DynamicBase', (Process,), {'__module__': __name__})
+
+class ProcessC(DynamicBase):
+    pass
+''',
+    'sub/__init__.py': '',
+    'sub/nested.py': '''
+from ..base import PipelineA as BasePipeline
+
+class PipelineB(BasePipeline):
+    pass
+''',
+    'sub/pipeline.xml': '''<pipeline>
+    <doc>a pipeline</doc>
+</pipeline>
+''',
+}
+
+
+class TestProcessRegistry(unittest.TestCase):
+    """ Class to test the process registry.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='capsul_registry')
+        for filename, source in modules.items():
+            path = osp.join(self.tmp_dir, 'registry_pkg', filename)
+            if not osp.isdir(osp.dirname(path)):
+                os.makedirs(osp.dirname(path))
+            with open(path, 'w') as f:
+                f.write(source)
+        sys.path.insert(0, self.tmp_dir)
+        self.cache_file = osp.join(self.tmp_dir, 'cache', 'registry.json')
+
+    def tearDown(self):
+        sys.path.remove(self.tmp_dir)
+        for module in list(sys.modules):
+            if module.split('.')[0] in ('registry_pkg', 'registry_dep'):
+                del sys.modules[module]
+        shutil.rmtree(self.tmp_dir)
+
+    expected = [
+        ('registry_pkg.base.PipelineA', 'pipeline'),
+        ('registry_pkg.base.ProcessA', 'process'),
+        ('registry_pkg.base.xml_function', 'function'),
+        ('registry_pkg.derived.ProcessB', 'process'),
+        ('registry_pkg.dynamic.DynamicBase', 'process'),
+        ('registry_pkg.dynamic.ProcessC', 'process'),
+        ('registry_pkg.sub.nested.PipelineB', 'pipeline'),
+        ('registry_pkg.sub.pipeline', 'xml_pipeline'),
+    ]
+
+    def imported_modules(self):
+        return sorted(m for m in sys.modules
+                      if m.split('.')[0] == 'registry_pkg')
+
+    def test_find_processes(self):
+        registry = ProcessRegistry(self.cache_file)
+        self.assertEqual(sorted(registry.module_processes('registry_pkg')),
+                         self.expected)
+        # only the module which cannot be parsed has been imported
+        self.assertEqual(self.imported_modules(),
+                         ['registry_pkg', 'registry_pkg.dynamic'])
+        self.assertEqual(
+            sorted(registry.find_processes('registry_pkg',
+                                           kinds=('pipeline',))),
+            ['registry_pkg.base.PipelineA',
+             'registry_pkg.sub.nested.PipelineB'])
+        self.assertEqual(registry.complete('registry_pkg.sub.'),
+                         ['registry_pkg.sub.nested.PipelineB',
+                          'registry_pkg.sub.pipeline'])
+
+    def test_cache(self):
+        ProcessRegistry(self.cache_file).module_processes('registry_pkg')
+        self.assertTrue(osp.exists(self.cache_file))
+        del sys.modules['registry_pkg.dynamic']
+        # results are read from the cache, no module is imported
+        registry = ProcessRegistry(self.cache_file)
+        self.assertEqual(sorted(registry.module_processes('registry_pkg')),
+                         self.expected)
+        self.assertEqual(self.imported_modules(), ['registry_pkg'])
+        # a modified file is parsed again
+        with open(osp.join(self.tmp_dir, 'registry_pkg', 'derived.py'),
+                  'a') as f:
+            f.write('\nclass ProcessD(ProcessB):\n    pass\n')
+        self.assertTrue(
+            ('registry_pkg.derived.ProcessD', 'process')
+            in ProcessRegistry(self.cache_file).module_processes(
+                'registry_pkg'))
+
+    def test_import_error(self):
+        filename = osp.join(self.tmp_dir, 'registry_pkg', 'needs_dep.py')
+        with open(filename, 'w') as f:
+            f.write('from registry_dep import DepProcess\n\n'
+                    'class ProcessE(DepProcess):\n'
+                    '    pass\n')
+        registry = ProcessRegistry(self.cache_file)
+        self.assertRaises(ImportError, registry.module_processes,
+                          'registry_pkg', ignore_import_error=False)
+        self.assertEqual(sorted(registry.module_processes('registry_pkg')),
+                         self.expected)
+        # the dependency is installed: import failures are not persistent
+        with open(osp.join(self.tmp_dir, 'registry_dep.py'), 'w') as f:
+            f.write('from capsul.api import Process\n\n'
+                    'class DepProcess(Process):\n'
+                    '    pass\n')
+        importlib.invalidate_caches()
+        self.assertTrue(
+            ('registry_pkg.needs_dep.ProcessE', 'process')
+            in ProcessRegistry(self.cache_file).module_processes(
+                'registry_pkg'))
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestProcessRegistry)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())